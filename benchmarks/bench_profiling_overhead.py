@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Microbenchmark for the per-request profiling overhead.
+
+Measures the Rust start/stop profiling pair on its own and a full pass
+through TimeGlassMiddleware around a no-op ASGI app. Both the handle API and
+the older JSON string API are supported, so running this script before and
+after an upgrade gives comparable numbers:
+
+    python benchmarks/bench_profiling_overhead.py
+    git checkout <older-commit> && python setup.py build_ext --inplace
+    python benchmarks/bench_profiling_overhead.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timeglass  # noqa: E402
+from timeglass.middleware import TimeGlassMiddleware  # noqa: E402
+from timeglass.storage import TimeGlassStorage  # noqa: E402
+
+
+def _profile_pair(request_id):
+    """One start/stop cycle, as the middleware performs it."""
+    start = timeglass.start_profiling(request_id)
+    if isinstance(start, str):
+        # JSON string API: parse the start metrics, pass the string back and
+        # parse the result, as the middleware used to
+        json.loads(start)
+        return json.loads(timeglass.stop_profiling(request_id, start))
+    return timeglass.stop_profiling(start)
+
+
+def _measure(fn, iterations, repeats):
+    """Best-of-``repeats`` mean microseconds per call."""
+    runs = []
+    for _ in range(repeats):
+        begin = time.perf_counter_ns()
+        for i in range(iterations):
+            fn(i)
+        runs.append((time.perf_counter_ns() - begin) / iterations / 1000)
+    return min(runs), statistics.median(runs)
+
+
+def bench_rust(iterations, repeats):
+    return _measure(lambda i: _profile_pair(f"bench-{i}"), iterations, repeats)
+
+
+def bench_middleware(iterations, repeats):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    storage = TimeGlassStorage(":memory:")
+    middleware = TimeGlassMiddleware(
+        app, storage=storage, max_queue_size=iterations * repeats + 1
+    )
+    loop = asyncio.new_event_loop()
+    scope = {"type": "http", "method": "GET", "path": "/bench"}
+
+    def one(i):
+        loop.run_until_complete(middleware(scope, None, send))
+
+    result = _measure(one, iterations, repeats)
+    middleware.writer.stop()
+    loop.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.iterations} requests x {args.repeats} repeats, "
+          "microseconds per request (best / median)")
+    if timeglass._rust_available:
+        api = ("json" if isinstance(timeglass.start_profiling("probe"), str)
+               else "handle")
+        best, median = bench_rust(args.iterations, args.repeats)
+        print(f"  rust start/stop ({api} API): {best:9.1f} / {median:9.1f}")
+    else:
+        print("  rust start/stop: skipped (extension not built)")
+    best, median = bench_middleware(args.iterations, args.repeats)
+    print(f"  middleware round trip:    {best:9.1f} / {median:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,86 @@
 use pyo3::prelude::*;
-use serde::{Deserialize, Serialize};
-use std::sync::Mutex;
-use sysinfo::System;
-use chrono::{DateTime, Utc};
-
-/// Profiling metrics data structure
-#[derive(Serialize, Deserialize, Clone, Debug)]
-pub struct ProfilingMetrics {
-    pub start_time: DateTime<Utc>,
-    pub end_time: Option<DateTime<Utc>>,
-    pub duration_ms: Option<f64>,
-    pub cpu_usage_percent: Option<f64>,
-    pub memory_usage_mb: Option<f64>,
-    pub memory_usage_percent: Option<f64>,
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Once;
+use std::thread;
+use std::time::{Duration, Instant};
+use sysinfo::{System, MINIMUM_CPU_UPDATE_INTERVAL};
+use chrono::Utc;
+
+/// Opaque per-request profiling handle returned by `start_profiling`
+#[pyclass(module = "timeglass.timeglass_core")]
+pub struct ProfileHandle {
+    #[pyo3(get)]
     pub request_id: String,
+    /// Wall-clock start, seconds since the Unix epoch
+    #[pyo3(get)]
+    pub start_timestamp: f64,
+    #[pyo3(get)]
+    pub cpu_usage_percent: f64,
+    #[pyo3(get)]
+    pub memory_usage_mb: f64,
+    #[pyo3(get)]
+    pub memory_usage_percent: f64,
+    start: Instant,
 }
 
-/// Global system monitor instance
-static SYSTEM: Mutex<Option<System>> = Mutex::new(None);
+#[pymethods]
+impl ProfileHandle {
+    fn __repr__(&self) -> String {
+        format!("ProfileHandle(request_id={:?})", self.request_id)
+    }
+}
+
+/// Profiling result returned by `stop_profiling`
+#[pyclass(module = "timeglass.timeglass_core")]
+pub struct ProfileResult {
+    #[pyo3(get)]
+    pub request_id: String,
+    /// Wall-clock start and end, seconds since the Unix epoch
+    #[pyo3(get)]
+    pub start_timestamp: f64,
+    #[pyo3(get)]
+    pub end_timestamp: f64,
+    /// Monotonic duration in nanoseconds
+    #[pyo3(get)]
+    pub duration_ns: u64,
+    #[pyo3(get)]
+    pub duration_ms: f64,
+    #[pyo3(get)]
+    pub cpu_usage_percent: f64,
+    #[pyo3(get)]
+    pub memory_usage_mb: f64,
+    #[pyo3(get)]
+    pub memory_usage_percent: f64,
+}
+
+#[pymethods]
+impl ProfileResult {
+    fn __repr__(&self) -> String {
+        format!(
+            "ProfileResult(request_id={:?}, duration_ms={:.3})",
+            self.request_id, self.duration_ms
+        )
+    }
+}
+
+/// Current wall-clock time in seconds since the Unix epoch
+fn epoch_seconds() -> f64 {
+    Utc::now().timestamp_micros() as f64 / 1_000_000.0
+}
+
+/// How often the background sampler refreshes CPU and memory
+const SAMPLE_INTERVAL: Duration = Duration::from_millis(500);
+
+/// Latest resource snapshot, written by the sampler thread and read without
+/// locking by the profiling calls. f64 values are stored as their bit
+/// patterns.
+static CPU_USAGE_PERCENT: AtomicU64 = AtomicU64::new(0);
+static MEMORY_USAGE_MB: AtomicU64 = AtomicU64::new(0);
+static MEMORY_USAGE_PERCENT: AtomicU64 = AtomicU64::new(0);
+static TOTAL_MEMORY_MB: AtomicU64 = AtomicU64::new(0);
+static CPU_COUNT: AtomicU64 = AtomicU64::new(0);
+
+static SAMPLER: Once = Once::new();
 
 /// TimeGlass Rust profiling engine
 #[pymodule]
@@ -25,112 +88,114 @@ fn timeglass_core(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(start_profiling, m)?)?;
     m.add_function(wrap_pyfunction!(stop_profiling, m)?)?;
     m.add_function(wrap_pyfunction!(get_system_info, m)?)?;
+    m.add_class::<ProfileHandle>()?;
+    m.add_class::<ProfileResult>()?;
     Ok(())
 }
 
-/// Initialize or refresh the system monitor
-fn init_system_monitor() {
-    let mut system_opt = SYSTEM.lock().unwrap();
-    if system_opt.is_none() {
-        let mut system = System::new_all();
-        system.refresh_all();
-        *system_opt = Some(system);
-    } else if let Some(ref mut system) = *system_opt {
-        system.refresh_all();
-    }
+/// Refresh only CPU usage and memory and publish them to the snapshot
+fn sample_resources(system: &mut System) {
+    system.refresh_cpu_usage();
+    system.refresh_memory();
+
+    let total_memory = system.total_memory() as f64;
+    let used_memory = system.used_memory() as f64;
+    let memory_percent = if total_memory > 0.0 {
+        (used_memory / total_memory) * 100.0
+    } else {
+        0.0
+    };
+
+    CPU_USAGE_PERCENT.store(
+        (system.global_cpu_usage() as f64).to_bits(), Ordering::Relaxed
+    );
+    MEMORY_USAGE_MB.store(
+        (used_memory / 1024.0 / 1024.0).to_bits(), Ordering::Relaxed
+    );
+    MEMORY_USAGE_PERCENT.store(memory_percent.to_bits(), Ordering::Relaxed);
+    TOTAL_MEMORY_MB.store(system.total_memory() / 1024 / 1024, Ordering::Relaxed);
+    CPU_COUNT.store(system.cpus().len() as u64, Ordering::Relaxed);
+}
+
+/// Start the background sampler on first use
+///
+/// The first sample is taken synchronously so memory figures are available
+/// immediately; CPU usage needs two samples and reads 0 until the sampler
+/// thread's first refresh.
+fn ensure_sampler() {
+    SAMPLER.call_once(|| {
+        let mut system = System::new();
+        sample_resources(&mut system);
+        thread::Builder::new()
+            .name("timeglass-sampler".to_string())
+            .spawn(move || loop {
+                thread::sleep(SAMPLE_INTERVAL.max(MINIMUM_CPU_UPDATE_INTERVAL));
+                sample_resources(&mut system);
+            })
+            .expect("failed to spawn timeglass sampler thread");
+    });
 }
 
 /// Get current CPU usage percentage
 fn get_cpu_usage() -> f64 {
-    init_system_monitor();
-    let system_opt = SYSTEM.lock().unwrap();
-    if let Some(ref system) = *system_opt {
-        system.global_cpu_usage() as f64
-    } else {
-        0.0
-    }
+    ensure_sampler();
+    f64::from_bits(CPU_USAGE_PERCENT.load(Ordering::Relaxed))
 }
 
 /// Get current memory usage in MB and percentage
 fn get_memory_usage() -> (f64, f64) {
-    init_system_monitor();
-    let system_opt = SYSTEM.lock().unwrap();
-    if let Some(ref system) = *system_opt {
-        let total_memory = system.total_memory() as f64;
-        let used_memory = system.used_memory() as f64;
-        let memory_mb = used_memory / 1024.0 / 1024.0;
-        let memory_percent = if total_memory > 0.0 {
-            (used_memory / total_memory) * 100.0
-        } else {
-            0.0
-        };
-        (memory_mb, memory_percent)
-    } else {
-        (0.0, 0.0)
-    }
+    ensure_sampler();
+    (
+        f64::from_bits(MEMORY_USAGE_MB.load(Ordering::Relaxed)),
+        f64::from_bits(MEMORY_USAGE_PERCENT.load(Ordering::Relaxed)),
+    )
 }
 
 /// Start profiling for a request
 #[pyfunction]
-fn start_profiling(request_id: String) -> PyResult<String> {
-    let start_time = Utc::now();
+fn start_profiling(request_id: String) -> ProfileHandle {
+    let start = Instant::now();
+    let start_timestamp = epoch_seconds();
     let cpu_usage = get_cpu_usage();
     let (memory_mb, memory_percent) = get_memory_usage();
 
-    let metrics = ProfilingMetrics {
-        start_time,
-        end_time: None,
-        duration_ms: None,
-        cpu_usage_percent: Some(cpu_usage),
-        memory_usage_mb: Some(memory_mb),
-        memory_usage_percent: Some(memory_percent),
-        request_id: request_id.clone(),
-    };
-
-    // Store metrics in a simple in-memory map (in production, use a proper store)
-    // For now, we'll serialize and return the initial metrics
-    let json = serde_json::to_string(&metrics)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(e.to_string()))?;
-
-    Ok(json)
+    ProfileHandle {
+        request_id,
+        start_timestamp,
+        cpu_usage_percent: cpu_usage,
+        memory_usage_mb: memory_mb,
+        memory_usage_percent: memory_percent,
+        start,
+    }
 }
 
 /// Stop profiling and return metrics
 #[pyfunction]
-fn stop_profiling(_request_id: String, start_metrics_json: String) -> PyResult<String> {
-    let end_time = Utc::now();
+fn stop_profiling(handle: PyRef<'_, ProfileHandle>) -> ProfileResult {
+    let duration = handle.start.elapsed();
+    let end_timestamp = epoch_seconds();
     let cpu_usage = get_cpu_usage();
     let (memory_mb, memory_percent) = get_memory_usage();
 
-    // Parse the start metrics
-    let mut metrics: ProfilingMetrics = serde_json::from_str(&start_metrics_json)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(e.to_string()))?;
-
-    // Update with end metrics
-    metrics.end_time = Some(end_time);
-    metrics.duration_ms = Some((end_time - metrics.start_time).num_milliseconds() as f64);
-    metrics.cpu_usage_percent = Some(cpu_usage);
-    metrics.memory_usage_mb = Some(memory_mb);
-    metrics.memory_usage_percent = Some(memory_percent);
-
-    let json = serde_json::to_string(&metrics)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(e.to_string()))?;
-
-    Ok(json)
+    ProfileResult {
+        request_id: handle.request_id.clone(),
+        start_timestamp: handle.start_timestamp,
+        end_timestamp,
+        duration_ns: duration.as_nanos() as u64,
+        duration_ms: duration.as_secs_f64() * 1000.0,
+        cpu_usage_percent: cpu_usage,
+        memory_usage_mb: memory_mb,
+        memory_usage_percent: memory_percent,
+    }
 }
 
 /// Get basic system information
 #[pyfunction]
 fn get_system_info() -> PyResult<String> {
-    init_system_monitor();
-    let system_opt = SYSTEM.lock().unwrap();
-    if let Some(ref system) = *system_opt {
-        let info = serde_json::json!({
-            "total_memory_mb": system.total_memory() / 1024 / 1024,
-            "cpu_count": system.cpus().len(),
-        });
-        Ok(info.to_string())
-    } else {
-        Ok("{}".to_string())
-    }
+    ensure_sampler();
+    let info = serde_json::json!({
+        "total_memory_mb": TOTAL_MEMORY_MB.load(Ordering::Relaxed),
+        "cpu_count": CPU_COUNT.load(Ordering::Relaxed),
+    });
+    Ok(info.to_string())
 }
@@ -15,11 +15,11 @@ try:
     print("\nTesting Rust functions:")
 
     # Test start_profiling
-    result = timeglass.start_profiling("test-request-123")
-    print(f"start_profiling result: {result}")
+    handle = timeglass.start_profiling("test-request-123")
+    print(f"start_profiling result: {handle}")
 
     # Test stop_profiling
-    final_result = timeglass.stop_profiling("test-request-123", result)
+    final_result = timeglass.stop_profiling(handle)
     print(f"stop_profiling result: {final_result}")
 
     # Test get_system_info
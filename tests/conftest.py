@@ -0,0 +1,35 @@
+"""Shared fixtures for the TimeGlass test suite."""
+
+from datetime import datetime
+
+import pytest
+
+from timeglass.models import ProfilingMetrics
+from timeglass.storage import TimeGlassStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """A TimeGlassStorage backed by a file in ``tmp_path``."""
+    db = TimeGlassStorage(str(tmp_path / "timeglass.db"))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def make_metrics():
+    """Factory for small profiling records; ``make_metrics(i)``.
+
+    With ``pid`` the record comes from that worker and its request ID is
+    ``req-<pid>-<i>``.
+    """
+
+    def make(i, pid=None):
+        return ProfilingMetrics(
+            request_id=f"req-{i}" if pid is None else f"req-{pid}-{i}",
+            start_time=datetime.now(), duration_ms=1.5,
+            method="GET", path=f"/items/{i}", route="/items/{item_id}",
+            status_code=200, worker_pid=pid,
+        )
+
+    return make
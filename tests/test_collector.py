@@ -0,0 +1,127 @@
+"""Unit tests for the TimeGlass multi-worker collector."""
+
+import io
+import os
+import socket
+import stat
+import time
+from datetime import datetime
+
+import pytest
+
+from timeglass.collector import Collector, CollectorSink, _decode, _encode
+from timeglass.models import QueryMetrics, Span
+from timeglass.storage import TimeGlassStorage
+
+
+def wait_for_rows(storage, count, timeout=5.0):
+    """Poll until ``count`` rows are stored."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rows = storage.get_profiling_metrics(limit=count + 1)
+        if len(rows) >= count:
+            return rows
+        time.sleep(0.02)
+    return storage.get_profiling_metrics(limit=count + 1)
+
+
+@pytest.fixture
+def collector(tmp_path):
+    """A running collector writing to an in-memory database."""
+    collector = Collector(
+        socket_path=str(tmp_path / "tg.sock"),
+        storage=TimeGlassStorage(":memory:"),
+        flush_interval=0.05,
+    )
+    collector.start()
+    yield collector
+    collector.stop()
+
+
+class TestCollector:
+    """Test shipping records from workers to a collector."""
+
+    def test_frames_round_trip(self):
+        """Test the length-prefixed message encoding."""
+        stream = io.BytesIO(_encode({"a": 1}) + _encode([[1, None]]))
+        assert _decode(stream) == {"a": 1}
+        assert _decode(stream) == [[1, None]]
+        assert _decode(stream) is None
+
+    def test_workers_share_one_writer(self, collector, make_metrics):
+        """Test that batches from several workers land in one database."""
+        workers = [CollectorSink(collector.socket_path) for _ in range(2)]
+        for pid, sink in enumerate(workers, start=100):
+            sink.write([make_metrics(i, pid) for i in range(5)])
+        for sink in workers:
+            sink.close()
+
+        rows = wait_for_rows(collector.storage, 10)
+        assert len(rows) == 10
+        assert {m.worker_pid for m in rows} == {100, 101}
+        assert {m.route for m in rows} == {"/items/{item_id}"}
+
+    def test_queries_are_forwarded(self, collector, make_metrics):
+        """Test that query rows travel over the same connection."""
+        sink = CollectorSink(collector.socket_path)
+        sink.write([make_metrics(0, 7)])
+        sink.write_queries([
+            QueryMetrics(
+                request_id="req-7-0", query="SELECT 1",
+                duration_ms=1.5, timestamp=datetime.now(),
+            )
+        ])
+        sink.close()
+
+        wait_for_rows(collector.storage, 1)
+        deadline = time.monotonic() + 5
+        queries = []
+        while not queries and time.monotonic() < deadline:
+            queries = collector.storage.get_query_metrics("req-7-0")
+            time.sleep(0.02)
+        assert [q.query for q in queries] == ["SELECT ?"]
+
+    def test_spans_are_forwarded(self, collector, make_metrics):
+        """Test that timeline spans travel over the same connection."""
+        sink = CollectorSink(collector.socket_path)
+        sink.write([make_metrics(0, 8)])
+        sink.write_spans([Span("req-8-0", 1, None, "render", "custom", 5, 20)])
+        sink.close()
+
+        wait_for_rows(collector.storage, 1)
+        deadline = time.monotonic() + 5
+        spans = []
+        while not spans and time.monotonic() < deadline:
+            spans = collector.storage.get_spans("req-8-0")
+            time.sleep(0.02)
+        assert spans == [Span("req-8-0", 1, None, "render", "custom", 5, 20)]
+
+    def test_refuses_a_socket_in_use(self, collector):
+        """Test that a second collector does not steal a live socket."""
+        second = Collector(
+            socket_path=collector.socket_path,
+            storage=TimeGlassStorage(":memory:"),
+        )
+        with pytest.raises(OSError):
+            second.start()
+        assert os.path.exists(collector.socket_path)
+
+    def test_replaces_a_stale_socket(self, tmp_path):
+        """Test that a socket left by a dead collector is reused."""
+        path = str(tmp_path / "stale.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(path)
+        collector = Collector(
+            socket_path=path, storage=TimeGlassStorage(":memory:")
+        )
+        collector.start()
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        finally:
+            collector.stop()
+
+    def test_sink_raises_without_collector(self, tmp_path, make_metrics):
+        """Test that an unreachable collector surfaces as an error."""
+        sink = CollectorSink(str(tmp_path / "missing.sock"))
+        with pytest.raises(OSError):
+            sink.write([make_metrics(0, 1)])
@@ -0,0 +1,70 @@
+"""Unit tests for TimeGlass error capture."""
+
+import asyncio
+
+import pytest
+
+from timeglass.errors import describe, exception_type, fingerprint
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.storage import TimeGlassStorage
+
+
+def _raise(message):
+    raise KeyError(message)
+
+
+def _caught(message):
+    try:
+        _raise(message)
+    except KeyError as exc:
+        return exc
+
+
+class TestFingerprint:
+    """Test exception fingerprinting."""
+
+    def test_same_failure_same_fingerprint(self):
+        """Test that messages do not affect the fingerprint."""
+        assert fingerprint(_caught("a")) == fingerprint(_caught("b"))
+
+    def test_type_changes_fingerprint(self):
+        """Test that different exception types are told apart."""
+        assert fingerprint(_caught("a")) != fingerprint(ValueError("a"))
+
+    def test_describe_truncates_message(self):
+        """Test that long messages are truncated."""
+        error_type, message, _ = describe(ValueError("x" * 2000))
+        assert error_type == "ValueError"
+        assert len(message) == 500
+        assert exception_type(asyncio.TimeoutError()) == "TimeoutError"
+
+
+class TestMiddlewareErrors:
+    """Test that failing requests are recorded."""
+
+    def test_failed_request_is_recorded_and_counted(self):
+        """Test that exceptions are re-raised and stored with a 500."""
+        storage = TimeGlassStorage(":memory:")
+
+        async def app(scope, receive, send):
+            raise RuntimeError(f"boom {scope['path']}")
+
+        middleware = TimeGlassMiddleware(app, storage=storage)
+        for path in ("/fail/1", "/fail/2"):
+            with pytest.raises(RuntimeError):
+                asyncio.run(middleware(
+                    {"type": "http", "method": "GET", "path": path},
+                    None, None,
+                ))
+        middleware.writer.stop()
+
+        metrics = storage.get_profiling_metrics(limit=10)
+        assert len(metrics) == 2
+        assert {m.status_code for m in metrics} == {500}
+        assert {m.error_type for m in metrics} == {"RuntimeError"}
+
+        errors = storage.get_errors()
+        assert len(errors) == 1
+        assert errors[0]["count"] == 2
+        assert errors[0]["route"] == "/fail/{id}"
+        assert errors[0]["message"] in ("boom /fail/1", "boom /fail/2")
@@ -0,0 +1,31 @@
+"""Unit tests for TimeGlass logging helpers."""
+
+import logging
+
+from timeglass.logs import RateLimiter, log_limited
+
+
+class TestRateLimiter:
+    """Test rate-limited warnings."""
+
+    def test_repeats_are_suppressed_and_counted(self, monkeypatch):
+        """Test that one event per interval passes and reports the rest."""
+        clock = [0.0]
+        monkeypatch.setattr("timeglass.logs.time.monotonic", lambda: clock[0])
+        limiter = RateLimiter(interval=10)
+
+        assert limiter.allow("a") == 1
+        assert limiter.allow("a") == 0
+        assert limiter.allow("a") == 0
+        assert limiter.allow("b") == 1
+        clock[0] = 10.0
+        assert limiter.allow("a") == 3
+
+    def test_log_limited_logs_once(self, caplog):
+        """Test that repeated warnings produce a single record."""
+        log = logging.getLogger("timeglass.test")
+        with caplog.at_level(logging.WARNING, logger="timeglass.test"):
+            for _ in range(5):
+                log_limited(log, logging.WARNING, "test-once", "broken: %s", 1)
+
+        assert [r.getMessage() for r in caplog.records] == ["broken: 1"]
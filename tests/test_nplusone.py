@@ -0,0 +1,102 @@
+"""Unit tests for TimeGlass N+1 query detection."""
+
+from datetime import datetime
+
+import pytest
+
+from timeglass.models import ProfilingMetrics, QueryMetrics
+from timeglass.nplusone import NPlusOneDetector
+from timeglass.storage import TimeGlassStorage
+
+
+def save_request(storage, request_id, route, queries):
+    """Store a request followed by its queries, as the writer does."""
+    now = datetime.now()
+    storage.save_profiling_metrics(ProfilingMetrics(
+        request_id=request_id, start_time=now, duration_ms=50.0,
+        method="GET", path=route.replace("{id}", "1"), route=route,
+    ))
+    storage.save_many_query_metrics([
+        QueryMetrics(
+            request_id=request_id, query=query, duration_ms=duration_ms,
+            timestamp=now,
+        )
+        for query, duration_ms in queries
+    ])
+
+
+class TestNPlusOneDetector:
+    """Test counting repeated statements per request."""
+
+    def test_repeats_at_threshold_are_reported(self):
+        """Test that only statements repeated enough times are flagged."""
+        detector = NPlusOneDetector(threshold=3)
+        for _ in range(3):
+            detector.add("a", 1, 2.0)
+        for _ in range(2):
+            detector.add("a", 2, 2.0)
+            detector.add("b", 1, 2.0)
+
+        [finding] = detector.findings()
+        assert (finding.request_id, finding.fingerprint_id) == ("a", 1)
+        assert finding.count == 3
+        assert finding.wasted_ms == pytest.approx(4.0)
+
+
+class TestNPlusOneStorage:
+    """Test that findings are stored as queries are written."""
+
+    def test_loop_queries_are_flagged(self):
+        """Test per-request findings and per-route totals."""
+        storage = TimeGlassStorage(":memory:")
+        loop = [(f"SELECT * FROM items WHERE owner_id = {i}", 1.0)
+                for i in range(10)]
+        save_request(storage, "r1", "/owners/{id}",
+                     [("SELECT * FROM owners", 3.0)] + loop)
+        save_request(storage, "r2", "/owners/{id}", loop)
+        save_request(storage, "r3", "/health", [("SELECT 1", 0.1)])
+
+        [finding] = storage.get_n_plus_one("r1")
+        assert finding["fingerprint"] == "SELECT * FROM items WHERE owner_id = ?"
+        assert finding["count"] == 10
+        assert finding["wasted_ms"] == pytest.approx(9.0)
+        assert storage.get_n_plus_one("r3") == []
+
+        [route] = storage.get_n_plus_one_routes()
+        assert (route["method"], route["route"]) == ("GET", "/owners/{id}")
+        assert (route["requests"], route["queries"]) == (2, 20)
+        assert route["wasted_ms"] == pytest.approx(18.0)
+        assert route["last_request_id"] == "r2"
+
+        stats = storage.get_stats_summary()
+        assert stats["n_plus_one"] == [route]
+        by_route = {r["route"]: r for r in stats["routes"]}
+        assert by_route["/owners/{id}"]["n_plus_one_count"] == 2
+        assert by_route["/health"]["n_plus_one_count"] == 0
+
+        windowed = storage.get_stats_summary(window_seconds=60)
+        assert windowed["n_plus_one"][0]["requests"] == 2
+        assert windowed["n_plus_one"][0]["wasted_ms"] == pytest.approx(18.0)
+
+    def test_route_is_taken_from_the_query_rows(self):
+        """Test findings for queries written before their request."""
+        storage = TimeGlassStorage(":memory:")
+        now = datetime.now()
+        storage.save_many_query_metrics([
+            QueryMetrics(
+                request_id="early", query=f"SELECT * FROM pets WHERE id = {i}",
+                duration_ms=1.0, timestamp=now, method="GET", route="/pets",
+            )
+            for i in range(6)
+        ] + [
+            QueryMetrics(
+                request_id="unknown", query=f"SELECT * FROM pets WHERE id = {i}",
+                duration_ms=1.0, timestamp=now,
+            )
+            for i in range(6)
+        ])
+
+        [route] = storage.get_n_plus_one_routes()
+        assert (route["method"], route["route"]) == ("GET", "/pets")
+        assert route["requests"] == 1
+        assert storage.get_n_plus_one("unknown") == []
@@ -0,0 +1,198 @@
+"""Unit tests for TimeGlass database query instrumentation."""
+
+import asyncio
+
+import pytest
+
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.queries import (
+    begin_request, current_request_id, end_request, instrument_asyncpg,
+    instrument_sqlalchemy, record_query,
+)
+from timeglass.storage import TimeGlassStorage
+
+
+class FakeConnection:
+    """Minimal object with the asyncpg connection query methods."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def execute(self, query, *args):
+        self.calls.append(query)
+        return "OK"
+
+    async def fetch(self, query, *args):
+        await asyncio.sleep(0.01)
+        self.calls.append(query)
+        return [args]
+
+    async def fetchval(self, query, *args):
+        raise RuntimeError("boom")
+
+
+class FakePool:
+    """Minimal object with the asyncpg pool acquire/release methods."""
+
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.released = []
+
+    async def acquire(self):
+        return self.connection
+
+    async def release(self, connection):
+        self.released.append(connection)
+
+
+class TestQueryContext:
+    """Test the per-request query buffer."""
+
+    def test_queries_outside_a_request_are_ignored(self):
+        """Test that nothing is recorded without a request scope."""
+        buffer, tokens = begin_request("req-1")
+        end_request(tokens)
+
+        record_query("SELECT 1", 1.0)
+
+        assert buffer.queries == []
+        assert current_request_id.get() is None
+
+    def test_child_tasks_record_into_the_request(self):
+        """Test that the scope follows the request into spawned tasks."""
+
+        async def handler():
+            buffer, tokens = begin_request("req-2")
+            try:
+                await asyncio.gather(
+                    asyncio.create_task(_query("SELECT 1")),
+                    asyncio.create_task(_query("SELECT 2")),
+                )
+            finally:
+                end_request(tokens)
+            return buffer
+
+        async def _query(sql):
+            assert current_request_id.get() == "req-2"
+            record_query(sql, 0.5)
+
+        buffer = asyncio.run(handler())
+
+        assert sorted(q.query for q in buffer.queries) == ["SELECT 1", "SELECT 2"]
+        assert all(q.request_id == "req-2" for q in buffer.queries)
+
+    def test_buffer_is_bounded(self):
+        """Test that queries past the per-request limit are counted."""
+        buffer, tokens = begin_request("req-3")
+        buffer.limit = 2
+        try:
+            for i in range(5):
+                record_query(f"SELECT {i}", 0.1)
+        finally:
+            end_request(tokens)
+
+        assert len(buffer.queries) == 2
+        assert buffer.dropped == 3
+
+
+class TestAsyncpgInstrumentation:
+    """Test the asyncpg connection and pool wrappers."""
+
+    def test_connection_queries_are_timed(self):
+        """Test that wrapped methods record duration, including failures."""
+        connection = instrument_asyncpg(FakeConnection())
+
+        async def handler():
+            buffer, tokens = begin_request("req-4")
+            try:
+                assert await connection.fetch("SELECT $1", 7) == [(7,)]
+                with pytest.raises(RuntimeError):
+                    await connection.fetchval("SELECT broken")
+            finally:
+                end_request(tokens)
+            return buffer
+
+        buffer = asyncio.run(handler())
+
+        assert [q.query for q in buffer.queries] == ["SELECT $1", "SELECT broken"]
+        assert buffer.queries[0].duration_ms >= 5
+        assert buffer.queries[0].connection_id is not None
+        assert connection.calls == ["SELECT $1"]
+
+    def test_pool_connections_are_wrapped(self):
+        """Test that connections acquired from a wrapped pool are timed."""
+        fake = FakePool()
+        pool = instrument_asyncpg(fake)
+
+        async def handler():
+            buffer, tokens = begin_request("req-5")
+            try:
+                async with pool.acquire() as conn:
+                    await conn.execute("UPDATE t SET x = 1")
+                conn = await pool.acquire()
+                await conn.execute("DELETE FROM t")
+                await pool.release(conn)
+            finally:
+                end_request(tokens)
+            return buffer
+
+        buffer = asyncio.run(handler())
+
+        assert [q.query for q in buffer.queries] == [
+            "UPDATE t SET x = 1", "DELETE FROM t",
+        ]
+        assert fake.released == [fake.connection, fake.connection]
+
+
+class TestSQLAlchemyInstrumentation:
+    """Test the SQLAlchemy engine event hooks."""
+
+    def test_statements_are_recorded(self):
+        """Test that cursor executions inside a request are recorded."""
+        sqlalchemy = pytest.importorskip("sqlalchemy")
+        engine = instrument_sqlalchemy(sqlalchemy.create_engine("sqlite://"))
+
+        buffer, tokens = begin_request("req-6")
+        try:
+            with engine.connect() as conn:
+                conn.execute(sqlalchemy.text("SELECT 1"))
+                with pytest.raises(sqlalchemy.exc.OperationalError):
+                    conn.execute(sqlalchemy.text("SELECT * FROM missing"))
+                conn.execute(sqlalchemy.text("SELECT 2"))
+        finally:
+            end_request(tokens)
+
+        assert [q.query for q in buffer.queries] == ["SELECT 1", "SELECT 2"]
+
+
+class TestMiddlewareQueries:
+    """Test that the middleware stores a request's queries."""
+
+    def test_queries_are_written_with_the_request(self):
+        """Test that queries are flushed in one batch after the request."""
+        storage = TimeGlassStorage(":memory:")
+        connection = instrument_asyncpg(FakeConnection())
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["request_id"] = current_request_id.get()
+            await connection.execute("SELECT id FROM users")
+            await connection.fetch("SELECT name FROM users")
+            await send({"type": "http.response.start", "status": 200})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        async def send(message):
+            pass
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, system_interval=None
+        )
+        asyncio.run(middleware({"type": "http"}, None, send))
+        middleware.writer.stop()
+
+        queries = storage.get_query_metrics(seen["request_id"])
+        assert [q.query for q in queries] == [
+            "SELECT id FROM users", "SELECT name FROM users",
+        ]
+        assert storage.get_profiling_metric(seen["request_id"]) is not None
+        assert middleware.writer.stats()["queries_written"] == 2
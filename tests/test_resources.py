@@ -0,0 +1,38 @@
+"""Unit tests for TimeGlass process resource readings."""
+
+import tracemalloc
+
+from timeglass.resources import ResourceSnapshot, rss_bytes
+
+
+class TestResources:
+    """Test per-request resource attribution."""
+
+    def test_rss_is_reported(self):
+        """Test that the process RSS can be read."""
+        assert rss_bytes() > 0
+
+    def test_cpu_time_delta_covers_busy_work(self):
+        """Test that CPU burnt between snapshots is attributed."""
+        start = ResourceSnapshot.take()
+        sum(i * i for i in range(200000))
+        usage = ResourceSnapshot.take().usage_since(start)
+
+        assert usage["process_cpu_ms"] > 0
+        assert usage["thread_cpu_ms"] > 0
+        assert usage["rss_bytes"] > 0
+        assert usage["rss_delta_bytes"] is not None
+        assert usage["alloc_delta_bytes"] is None
+
+    def test_allocation_delta_with_tracemalloc(self):
+        """Test that Python allocations are measured when tracing."""
+        tracemalloc.start()
+        try:
+            start = ResourceSnapshot.take()
+            kept = [bytes(1024) for _ in range(1000)]
+            usage = ResourceSnapshot.take().usage_since(start)
+        finally:
+            tracemalloc.stop()
+
+        assert len(kept) == 1000
+        assert usage["alloc_delta_bytes"] >= 1000 * 1024
@@ -0,0 +1,151 @@
+"""Unit tests for TimeGlass retention and compaction."""
+
+import pytest
+from datetime import datetime, timedelta
+from timeglass.storage import TimeGlassStorage
+from timeglass.models import ProfilingMetrics, QueryMetrics, Span, SystemMetrics
+from timeglass.retention import RetentionJob, RetentionPolicy, apply_retention
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Create a temporary file database for testing."""
+    db = TimeGlassStorage(str(tmp_path / "retention.db"))
+    yield db
+    db.close()
+
+
+def save_requests(db, count, age):
+    """Save ``count`` requests that started ``age`` ago."""
+    start = datetime.now() - age
+    db.save_many_profiling_metrics(
+        ProfilingMetrics(
+            request_id=f"{age.total_seconds()}-{i}",
+            start_time=start,
+            duration_ms=5.0,
+            status_code=200,
+        )
+        for i in range(count)
+    )
+
+
+class TestRetention:
+    """Test retention policies."""
+
+    def test_raw_rows_pruned_rollups_kept(self, temp_db):
+        """Test that old raw rows go while their rollups remain."""
+        save_requests(temp_db, 30, timedelta(hours=48))
+        save_requests(temp_db, 10, timedelta(minutes=5))
+
+        deleted = apply_retention(
+            temp_db, RetentionPolicy(raw_hours=24, batch_size=7)
+        )
+
+        assert deleted["profiling_metrics"] == 30
+        assert len(temp_db.get_profiling_metrics(limit=100)) == 10
+        assert temp_db.get_stats_summary()["total_requests"] == 40
+
+    def test_fine_rollups_are_downsampled(self, temp_db):
+        """Test that 1s rollups expire while 1h rollups are kept."""
+        save_requests(temp_db, 5, timedelta(hours=12))
+
+        deleted = apply_retention(temp_db, RetentionPolicy(raw_hours=None))
+
+        assert deleted["rollups_1s"] > 0
+        assert deleted["rollups_60s"] == 0
+        assert temp_db.get_stats_summary()["total_requests"] == 5
+
+    def test_max_rows_cap(self, temp_db):
+        """Test that the oldest rows are trimmed to the row cap."""
+        save_requests(temp_db, 20, timedelta(minutes=10))
+        save_requests(temp_db, 5, timedelta(minutes=1))
+
+        apply_retention(
+            temp_db,
+            RetentionPolicy(raw_hours=None, max_raw_rows=5, batch_size=3),
+        )
+
+        remaining = temp_db.get_profiling_metrics(limit=100)
+        assert len(remaining) == 5
+        assert all(m.request_id.startswith("60.0-") for m in remaining)
+
+    def test_size_cap_trims_the_tables_using_the_space(self, temp_db):
+        """Test that old system rows go before newer requests."""
+        save_requests(temp_db, 200, timedelta(minutes=1))
+        start = datetime.now() - timedelta(hours=48)
+        temp_db.save_many_system_metrics(
+            SystemMetrics(
+                timestamp=start + timedelta(seconds=i),
+                cpu_usage_percent=10.0, memory_usage_mb=100.0,
+                memory_usage_percent=5.0, total_memory_mb=2048, cpu_count=4,
+            )
+            for i in range(20000)
+        )
+        cap = temp_db.database_size_mb() / 2
+
+        deleted = temp_db.trim_raw_metrics(max_size_mb=cap)
+
+        assert temp_db.database_size_mb() <= cap
+        assert len(temp_db.get_profiling_metrics(limit=1000)) == 200
+        assert deleted.get("profiling_metrics", 0) == 0
+        assert 0 < deleted["system_metrics"] < 20000
+
+    def test_size_cap_stops_when_nothing_is_freed(self, temp_db):
+        """Test that trimming stops instead of emptying the requests."""
+        save_requests(temp_db, 50, timedelta(minutes=1))
+
+        # 20 small rows share a page, so the first pass frees nothing
+        deleted = temp_db.trim_raw_metrics(max_size_mb=0, batch_size=20)
+
+        assert deleted["profiling_metrics"] == 20
+        assert len(temp_db.get_profiling_metrics(limit=100)) == 30
+
+    def test_trimmed_requests_take_their_rows(self, temp_db):
+        """Test that queries and spans go with their request."""
+        save_requests(temp_db, 3, timedelta(minutes=10))
+        save_requests(temp_db, 2, timedelta(minutes=1))
+        request_ids = [
+            m.request_id for m in temp_db.get_profiling_metrics(limit=10)
+        ]
+        temp_db.save_many_query_metrics(
+            QueryMetrics(
+                request_id=request_id, query="SELECT 1", duration_ms=1.0,
+                timestamp=datetime.now(),
+            )
+            for request_id in request_ids
+        )
+        temp_db.save_many_spans(
+            Span(request_id, 1, None, "render", "custom", 0, 10)
+            for request_id in request_ids
+        )
+
+        deleted = temp_db.trim_raw_metrics(max_rows=2, batch_size=2)
+
+        assert deleted["profiling_metrics"] == 3
+        assert deleted["query_metrics"] == 3
+        assert deleted["spans"] == 3
+        kept = {m.request_id for m in temp_db.get_profiling_metrics(limit=10)}
+        for request_id in request_ids:
+            has_rows = request_id in kept
+            assert bool(temp_db.get_query_metrics(request_id)) == has_rows
+            assert bool(temp_db.get_spans(request_id)) == has_rows
+
+    def test_incremental_vacuum(self, temp_db):
+        """Test that new databases support incremental vacuum."""
+        save_requests(temp_db, 2000, timedelta(hours=48))
+        apply_retention(temp_db, RetentionPolicy())
+
+        with temp_db._connections.connect() as conn:
+            assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+        assert temp_db.incremental_vacuum()
+        with temp_db._connections.connect() as conn:
+            assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+    def test_job_run_once(self, temp_db):
+        """Test a single retention job pass."""
+        save_requests(temp_db, 3, timedelta(hours=48))
+        job = RetentionJob(temp_db, RetentionPolicy())
+
+        assert job.run_once()["profiling_metrics"] == 3
+        assert job.runs == 1
@@ -0,0 +1,122 @@
+"""Unit tests for TimeGlass route template resolution."""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.routes import RouteResolver, normalize_path
+from timeglass.storage import TimeGlassStorage
+
+
+def _profiled_routes(app, storage, *paths):
+    """Request ``paths`` through TimeGlassMiddleware; return stored routes."""
+    middleware = TimeGlassMiddleware(app, storage=storage)
+    client = TestClient(middleware)
+    for path in paths:
+        client.get(path)
+    middleware.writer.stop()
+    return {m.path: m.route for m in storage.get_profiling_metrics()}
+
+
+class TestNormalizePath:
+    """Test the regex fallback normalizer."""
+
+    def test_id_like_segments_are_replaced(self):
+        """Test that numbers, UUIDs, hashes and tokens become placeholders."""
+        assert normalize_path("/users/8123/orders/77") == (
+            "/users/{id}/orders/{id}"
+        )
+        assert normalize_path(
+            "/files/0b6c6f3e-6f1b-4d7a-9d55-0d5b1c1f2a3b"
+        ) == "/files/{uuid}"
+        assert normalize_path(
+            "/commits/3f786850e387550fdab836ed7e6dc881de23001b"
+        ) == "/commits/{hash}"
+        assert normalize_path("/s/aZ3kP9qLmN2xV8tR4wYb") == "/s/{token}"
+
+    def test_plain_segments_are_kept(self):
+        """Test that ordinary words and the root path are unchanged."""
+        assert normalize_path("/") == "/"
+        assert normalize_path("/api/v2/health") == "/api/v2/health"
+
+
+class TestRouteResolver:
+    """Test template resolution from the ASGI scope."""
+
+    def test_fastapi_route_template(self):
+        """Test that FastAPI's matched route supplies the template."""
+        app = FastAPI()
+
+        @app.get("/users/{user_id}/orders/{order_id}")
+        async def order(user_id: int, order_id: int):
+            return {}
+
+        routes = _profiled_routes(
+            app, TimeGlassStorage(":memory:"), "/users/8123/orders/77",
+            "/missing/42",
+        )
+        assert routes["/users/8123/orders/77"] == (
+            "/users/{user_id}/orders/{order_id}"
+        )
+        # No route matched: fall back to the normalizer
+        assert routes["/missing/42"] == "/missing/{id}"
+
+    def test_starlette_routes_are_matched_and_cached(self):
+        """Test that plain Starlette routes are matched from the app."""
+        async def item(request):
+            return PlainTextResponse("ok")
+
+        app = Starlette(routes=[Route("/items/{item_id}", item)])
+        routes = _profiled_routes(
+            app, TimeGlassStorage(":memory:"), "/items/abc"
+        )
+        assert routes["/items/abc"] == "/items/{item_id}"
+
+    def test_mounted_apps_keep_the_full_path(self):
+        """Test that requests into a mount are stored under the outer path."""
+        api = FastAPI()
+
+        @api.get("/items/{item_id}")
+        async def item(item_id: int):
+            return {}
+
+        async def page(request):
+            return PlainTextResponse("ok")
+
+        app = FastAPI()
+        app.mount("/api", api)
+        app.mount("/pages", Starlette(routes=[Route("/{slug}", page)]))
+        routes = _profiled_routes(
+            app, TimeGlassStorage(":memory:"), "/api/items/7", "/pages/about",
+            "/api/missing/5",
+        )
+
+        assert routes == {
+            "/api/items/7": "/api/items/{item_id}",
+            "/pages/about": "/pages/{slug}",
+            "/api/missing/5": "/api/missing/{id}",
+        }
+
+    def test_cache_is_bounded(self):
+        """Test that the path cache evicts its oldest entries."""
+        resolver = RouteResolver(max_size=2)
+        for i in range(5):
+            resolver.resolve({}, "GET", f"/x/{i}")
+        assert len(resolver._cache) == 2
+        assert ("GET", "/x/4") in resolver._cache
+
+    def test_early_resolution_matches_before_routing(self):
+        """Test that templates are found before the application runs."""
+        async def item(request):
+            return PlainTextResponse("ok")
+
+        app = Starlette(routes=[Route("/items/{item_id}", item)])
+        resolver = RouteResolver()
+        scope = {"type": "http", "method": "GET", "path": "/items/7", "app": app}
+
+        assert resolver.resolve_early(scope, "GET", "/items/7") == "/items/{item_id}"
+        assert resolver.resolve_early({}, "GET", "/other/7") == "/other/{id}"
+        assert resolver._cache == {}
@@ -0,0 +1,156 @@
+"""Unit tests for TimeGlass request sampling."""
+
+import asyncio
+import random
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.models import ProfilingMetrics
+from timeglass.sampling import (
+    AdaptiveSampler,
+    RateSampler,
+    RouteRateLimitSampler,
+    Sampler,
+    TailSampler,
+)
+from timeglass.storage import TimeGlassStorage
+
+
+def _metrics(status_code=200, duration_ms=5.0, path="/items"):
+    return ProfilingMetrics(
+        request_id="r", start_time=datetime.now(), duration_ms=duration_ms,
+        method="GET", path=path, status_code=status_code,
+    )
+
+
+class TestSamplers:
+    """Test the sampling strategies."""
+
+    def test_default_sampler_keeps_everything(self):
+        """Test that the base sampler keeps requests with weight 1."""
+        assert Sampler().sample(_metrics()) == 1.0
+
+    def test_rate_sampler_weight_is_inverse_rate(self):
+        """Test that kept requests carry weight 1/rate."""
+        sampler = RateSampler(0.25, rng=random.Random(1))
+        weights = [sampler.sample(_metrics()) for _ in range(4000)]
+        kept = [w for w in weights if w]
+        assert set(kept) == {4.0}
+        # The weighted count estimates the number of requests seen
+        assert sum(weights) == pytest.approx(4000, rel=0.1)
+
+    def test_rate_sampler_rejects_invalid_rate(self):
+        """Test that rates outside (0, 1] are rejected."""
+        with pytest.raises(ValueError):
+            RateSampler(0)
+
+    def test_tail_sampler_keeps_errors_and_slow_requests(self):
+        """Test that errors and slow requests bypass the base sampler."""
+        sampler = TailSampler(RateSampler(0.000001), slow_ms=500)
+        assert sampler.sample(_metrics(status_code=503)) == 1.0
+        assert sampler.sample(_metrics(duration_ms=750.0)) == 1.0
+
+    def test_outcome_independent_samplers_decide_up_front(self):
+        """Test that only tail sampling waits for the request to finish."""
+        assert RateSampler(1.0).sample_request("GET", None) == 1.0
+        assert AdaptiveSampler(100).sample_request("GET", None) == 1.0
+        assert RouteRateLimitSampler(100).sample_request("GET", "/a") == 1.0
+        assert TailSampler(RateSampler(0.5)).sample_request("GET", None) is None
+        assert Sampler().sample_request("GET", None) is None
+
+    def test_adaptive_sampler_starts_by_keeping_everything(self):
+        """Test that the first window is kept in full."""
+        sampler = AdaptiveSampler(max_per_second=100)
+        assert all(sampler.sample(_metrics()) == 1.0 for _ in range(50))
+
+    def test_route_limits_are_tracked_per_route(self, monkeypatch):
+        """Test that each route gets its own budget."""
+        clock = [0.0]
+        monkeypatch.setattr("timeglass.sampling.time.monotonic",
+                            lambda: clock[0])
+        sampler = RouteRateLimitSampler(
+            default_per_second=1000,
+            limits={("GET", "/hot"): 10},
+            rng=random.Random(1),
+        )
+        for _ in range(1000):
+            sampler.sample(_metrics(path="/hot"))
+            sampler.sample(_metrics(path="/cold"))
+        clock[0] = 1.0
+
+        hot = [sampler.sample(_metrics(path="/hot")) for _ in range(1000)]
+        cold = [sampler.sample(_metrics(path="/cold")) for _ in range(1000)]
+        assert set(w for w in hot if w) == {100.0}
+        assert set(cold) == {1.0}
+
+
+class TestMiddlewareSampling:
+    """Test sampling in TimeGlassMiddleware."""
+
+    def test_dropped_requests_are_not_stored(self):
+        """Test that requests with weight 0 never reach storage."""
+        storage = TimeGlassStorage(":memory:")
+
+        class DropAll(Sampler):
+            def sample(self, metrics):
+                return 0.0
+
+        async def app(scope, receive, send):
+            pass
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, sampler=DropAll()
+        )
+        asyncio.run(middleware({"type": "http"}, None, None))
+        middleware.writer.stop()
+
+        assert storage.get_profiling_metrics(limit=10) == []
+
+    def test_requests_dropped_up_front_are_not_instrumented(self):
+        """Test that an up-front drop skips measuring the request."""
+        storage = TimeGlassStorage(":memory:")
+        ran = []
+
+        class DropBefore(Sampler):
+            def sample_request(self, method, route):
+                return 0.0
+
+            def sample(self, metrics):
+                raise AssertionError("request was measured")
+
+        async def app(scope, receive, send):
+            ran.append(scope["path"])
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, sampler=DropBefore()
+        )
+        with patch("timeglass.middleware.ResourceSnapshot.take") as take:
+            asyncio.run(middleware(
+                {"type": "http", "method": "GET", "path": "/a"}, None, None
+            ))
+        middleware.writer.stop()
+
+        assert ran == ["/a"]
+        take.assert_not_called()
+        assert storage.get_profiling_metrics(limit=10) == []
+
+    def test_up_front_weight_is_stored(self):
+        """Test that a kept request carries the weight decided up front."""
+        storage = TimeGlassStorage(":memory:")
+
+        async def app(scope, receive, send):
+            pass
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, sampler=RateSampler(1.0)
+        )
+        asyncio.run(middleware(
+            {"type": "http", "method": "GET", "path": "/a"}, None, None
+        ))
+        middleware.writer.stop()
+
+        [stored] = storage.get_profiling_metrics(limit=10)
+        assert stored.sample_weight == 1.0
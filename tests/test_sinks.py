@@ -0,0 +1,91 @@
+"""Unit tests for TimeGlass record sinks."""
+
+import json
+import logging
+
+import pytest
+
+from timeglass.sinks import (
+    LoggingSink,
+    MultiSink,
+    NDJSONFileSink,
+    NullSink,
+    Sink,
+    StorageSink,
+)
+from timeglass.storage import TimeGlassStorage
+from timeglass.writer import BackgroundWriter
+
+
+class TestSinks:
+    """Test the built-in sinks."""
+
+    def test_ndjson_sink_writes_one_record_per_line(self, tmp_path, make_metrics):
+        """Test that records are appended as JSON lines."""
+        path = tmp_path / "requests.ndjson"
+        sink = NDJSONFileSink(str(path))
+        sink.write([make_metrics(0), make_metrics(1)])
+        sink.close()
+
+        lines = path.read_text().splitlines()
+        assert [json.loads(line)["request_id"] for line in lines] == [
+            "req-0", "req-1"
+        ]
+
+    def test_ndjson_sink_rotates_by_size(self, tmp_path, make_metrics):
+        """Test that the file rotates and old backups are discarded."""
+        path = tmp_path / "requests.ndjson"
+        line_size = len(json.dumps(make_metrics(10).to_dict(),
+                                   separators=(",", ":"))) + 1
+        max_bytes = line_size * 3
+        sink = NDJSONFileSink(str(path), max_bytes=max_bytes, backup_count=2)
+        for i in range(10, 30):
+            sink.write([make_metrics(i)])
+        sink.close()
+
+        assert path.exists()
+        assert (tmp_path / "requests.ndjson.1").exists()
+        assert (tmp_path / "requests.ndjson.2").exists()
+        assert not (tmp_path / "requests.ndjson.3").exists()
+        assert path.stat().st_size <= max_bytes
+
+    def test_logging_sink_attaches_record(self, caplog, make_metrics):
+        """Test that each request becomes one structured log record."""
+        with caplog.at_level(logging.INFO, logger="timeglass.requests"):
+            LoggingSink().write([make_metrics(0)])
+
+        (record,) = caplog.records
+        assert record.getMessage() == "GET /items/{item_id} 200 1.500ms"
+        assert record.timeglass["request_id"] == "req-0"
+
+    def test_sink_must_implement_write(self):
+        """Test that a sink without write cannot be instantiated."""
+        class Incomplete(Sink):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_multi_sink_tries_every_sink(self, tmp_path, make_metrics):
+        """Test that a failing sink does not starve the others."""
+        class Failing(Sink):
+            def write(self, batch):
+                raise OSError("disk full")
+
+        storage = TimeGlassStorage(":memory:")
+        sink = MultiSink(Failing(), StorageSink(storage), NullSink())
+        with pytest.raises(OSError):
+            sink.write([make_metrics(0)])
+        assert storage.get_profiling_metric("req-0") is not None
+
+    def test_writer_feeds_custom_sink(self, tmp_path, make_metrics):
+        """Test that the background writer drains into any sink."""
+        path = tmp_path / "requests.ndjson"
+        writer = BackgroundWriter(NDJSONFileSink(str(path)), batch_size=4)
+        writer.start()
+        for i in range(10):
+            writer.submit(make_metrics(i))
+        writer.stop()
+
+        assert len(path.read_text().splitlines()) == 10
+        assert writer.stats()["batches"] >= 3
@@ -0,0 +1,39 @@
+"""Unit tests for TimeGlass latency histograms."""
+
+import random
+from timeglass.sketch import (
+    RELATIVE_ACCURACY, bucket_index, bucket_value, quantile
+)
+
+
+class TestLatencySketch:
+    """Test log-bucketed quantile estimation."""
+
+    def test_bucket_value_within_accuracy(self):
+        """Test that a bucket's value is close to the values mapped to it."""
+        for value in (0.005, 0.8, 1.0, 42.0, 1500.0, 90000.0):
+            estimate = bucket_value(bucket_index(value))
+            assert abs(estimate - value) <= value * RELATIVE_ACCURACY
+
+    def test_quantiles_match_exact_values(self):
+        """Test quantile estimates against exact sorted percentiles."""
+        rng = random.Random(42)
+        values = [rng.lognormvariate(3, 1) for _ in range(10000)]
+        counts = {}
+        for value in values:
+            index = bucket_index(value)
+            counts[index] = counts.get(index, 0) + 1
+
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            estimate = quantile(counts, q)
+            assert abs(estimate - exact) <= exact * RELATIVE_ACCURACY * 2
+
+    def test_empty_histogram(self):
+        """Test that an empty histogram has no quantiles."""
+        assert quantile({}, 0.5) is None
+
+    def test_sub_millisecond_values_are_resolved(self):
+        """Test that sub-millisecond durations land in distinct buckets."""
+        assert bucket_index(0.05) < bucket_index(0.5) < bucket_index(1.0)
@@ -0,0 +1,175 @@
+"""Unit tests for TimeGlass request timeline spans."""
+
+import asyncio
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.queries import record_query
+from timeglass.spans import (
+    SpanTransport, begin_request, end_request, instrument_fastapi, span,
+)
+from timeglass.storage import TimeGlassStorage
+
+
+def _record(handler):
+    """Run ``handler`` inside a request scope and return its span buffer."""
+
+    async def run():
+        buffer, tokens = begin_request("req", 0)
+        try:
+            await handler()
+        finally:
+            end_request(tokens)
+        return buffer
+
+    return asyncio.run(run())
+
+
+class TestSpanContext:
+    """Test span recording and nesting."""
+
+    def test_spans_outside_a_request_are_ignored(self):
+        """Test that nothing is recorded without a request scope."""
+        buffer, tokens = begin_request("req", 0)
+        end_request(tokens)
+
+        with span("outside"):
+            pass
+
+        assert buffer.spans == []
+
+    def test_spans_nest_across_tasks(self):
+        """Test that tasks inherit the span open when they were created."""
+
+        async def child(name):
+            async with span(name):
+                await asyncio.sleep(0.01)
+
+        async def handler():
+            async with span("parent"):
+                await asyncio.gather(child("a"), child("b"))
+            with span("sibling"):
+                pass
+
+        buffer = _record(handler)
+
+        spans = {s.name: s for s in buffer.spans}
+        assert spans["parent"].parent_id is None
+        assert spans["a"].parent_id == spans["parent"].span_id
+        assert spans["b"].parent_id == spans["parent"].span_id
+        assert spans["sibling"].parent_id is None
+        assert spans["a"].duration_us >= 5000
+        assert spans["parent"].duration_us >= spans["a"].duration_us
+        assert len({s.span_id for s in buffer.spans}) == 4
+
+    def test_decorator_wraps_sync_and_async_functions(self):
+        """Test that each decorated call records its own span."""
+
+        @span("compute", kind="service")
+        def compute(x):
+            return x * 2
+
+        @span("fetch")
+        async def fetch(x):
+            return compute(x) + 1
+
+        async def handler():
+            assert await fetch(3) == 7
+            assert fetch.__name__ == "fetch"
+
+        buffer = _record(handler)
+
+        fetch_span, compute_span = sorted(buffer.spans, key=lambda s: s.span_id)
+        assert (fetch_span.name, fetch_span.kind) == ("fetch", "custom")
+        assert (compute_span.name, compute_span.kind) == ("compute", "service")
+        assert compute_span.parent_id == fetch_span.span_id
+
+    def test_buffer_is_bounded(self):
+        """Test that spans past the per-request limit are counted."""
+        buffer, tokens = begin_request("req", 0)
+        buffer.limit = 2
+        try:
+            for i in range(5):
+                with span(f"s{i}"):
+                    pass
+        finally:
+            end_request(tokens)
+
+        assert len(buffer.spans) == 2
+        assert buffer.dropped == 3
+
+    def test_queries_are_recorded_as_spans(self):
+        """Test that recorded queries become db spans under the open span."""
+
+        async def handler():
+            with span("load"):
+                record_query("SELECT 1", 2.0)
+
+        buffer = _record(handler)
+
+        load, query = sorted(buffer.spans, key=lambda s: s.span_id)
+        assert (query.kind, query.detail) == ("db", "SELECT 1")
+        assert query.parent_id == load.span_id
+        assert 1900 <= query.duration_us <= 2100
+
+
+class TestSpanTransport:
+    """Test the httpx transport wrapper."""
+
+    def test_outbound_requests_are_recorded(self):
+        """Test that each request through the transport is a span."""
+        transport = SpanTransport(
+            httpx.MockTransport(lambda request: httpx.Response(204))
+        )
+
+        async def handler():
+            async with httpx.AsyncClient(transport=transport) as client:
+                response = await client.get("https://api.example.com/v1/users?id=3")
+            assert response.status_code == 204
+
+        buffer = _record(handler)
+
+        (request,) = buffer.spans
+        assert request.name == "GET api.example.com"
+        assert request.kind == "http"
+        assert request.detail == "https://api.example.com/v1/users"
+
+
+class TestMiddlewareSpans:
+    """Test that the middleware stores a request's spans."""
+
+    def test_spans_are_written_with_the_request(self):
+        """Test that dependency and custom spans are stored after the request."""
+        storage = TimeGlassStorage(":memory:")
+        app = FastAPI()
+
+        async def current_user():
+            await asyncio.sleep(0.005)
+            return "ada"
+
+        @app.get("/profile")
+        async def profile(user: str = Depends(current_user)):
+            async with span("render"):
+                pass
+            return {"user": user}
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, system_interval=None
+        )
+        assert instrument_fastapi()
+        with TestClient(middleware) as client:
+            assert client.get("/profile").json() == {"user": "ada"}
+        middleware.writer.stop()
+
+        (request,) = storage.get_profiling_metrics()
+        spans = storage.get_spans(request.request_id)
+        assert [(s.name, s.kind) for s in spans] == [
+            ("dependencies", "dependency"), ("render", "custom"),
+        ]
+        assert spans[0].detail == "profile"
+        assert spans[0].duration_us >= 4000
+        assert spans[1].start_us >= spans[0].start_us + spans[0].duration_us
+        assert middleware.writer.stats()["spans_written"] == 2
@@ -0,0 +1,39 @@
+"""Unit tests for TimeGlass SQL fingerprints."""
+
+from timeglass.sql import normalize
+
+
+class TestNormalize:
+    """Test reducing statements to their fingerprint text."""
+
+    def test_literals_become_placeholders(self):
+        """Test that strings, numbers and bind parameters are replaced."""
+        assert normalize(
+            "SELECT * FROM users WHERE id = 42 AND name = 'O''Brien'"
+        ) == "SELECT * FROM users WHERE id = ? AND name = ?"
+        assert normalize(
+            "SELECT a FROM t WHERE x = $1 AND y = %s AND z = :z AND w = 1.5e3"
+        ) == "SELECT a FROM t WHERE x = ? AND y = ? AND z = ? AND w = ?"
+
+    def test_identifiers_and_casts_are_kept(self):
+        """Test that quoted names, digits in names and casts survive."""
+        assert normalize(
+            'SELECT "col 1", t2.c FROM t2 WHERE v::int > 3'
+        ) == 'SELECT "col 1", t2.c FROM t2 WHERE v::int > ?'
+
+    def test_lists_collapse(self):
+        """Test that IN lists and multi-row VALUES of any length match."""
+        assert normalize(
+            "SELECT a FROM t WHERE id IN (1, 2, 3)"
+        ) == normalize(
+            "SELECT a FROM t WHERE id IN ($1)"
+        ) == "SELECT a FROM t WHERE id IN (...)"
+        assert normalize(
+            "INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y');"
+        ) == "INSERT INTO t (a, b) VALUES (...)"
+
+    def test_comments_and_whitespace(self):
+        """Test that comments are dropped and whitespace collapsed."""
+        assert normalize(
+            "SELECT a  /* hint */\n  FROM t -- trailing\n WHERE b = 'x -- y'"
+        ) == "SELECT a FROM t WHERE b = ?"
@@ -0,0 +1,115 @@
+"""Unit tests for the TimeGlass stack sampler."""
+
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from timeglass.middleware import TimeGlassMiddleware
+from timeglass.models import StackSample
+from timeglass.stacks import StackSampler, track_request, untrack_request
+
+
+def spin(stop):
+    """Burn CPU until ``stop`` is set."""
+    while not stop.is_set():
+        sum(i for i in range(1000))
+
+
+class TestStackSampler:
+    """Test capturing and storing stack samples."""
+
+    def test_samples_are_tagged_with_the_request(self, storage):
+        """Test that stacks under a tracked frame carry its request ID."""
+        stop = threading.Event()
+        ready = threading.Event()
+
+        def handle_request():
+            frame = sys._getframe()
+            track_request(frame, "req-1")
+            ready.set()
+            try:
+                spin(stop)
+            finally:
+                untrack_request(frame)
+
+        worker = threading.Thread(target=handle_request)
+        worker.start()
+        ready.wait()
+        sampler = StackSampler(storage)
+        sampler.watch_thread(worker.ident)
+        try:
+            for _ in range(5):
+                sampler.sample()
+        finally:
+            stop.set()
+            worker.join()
+        sampler.flush()
+
+        [entry] = storage.get_stack_profile(request_id="req-1")
+        assert entry["count"] == 5
+        assert entry["stack"][-2].startswith("spin (test_stacks.py:")
+        assert any(".handle_request (" in label for label in entry["stack"])
+
+    def test_frames_and_stacks_are_interned(self, storage):
+        """Test that repeated stacks share rows and their counts merge."""
+        stack = (("app.py", "main", 1), ("app.py", "handler", 10))
+        now = datetime.now()
+        storage.save_stack_samples([StackSample("a", stack, 3, now)])
+        storage.save_stack_samples([
+            StackSample("b", stack, 2, now),
+            StackSample("b", stack[:1], 1, now),
+        ])
+
+        with storage._connections.connect() as conn:
+            for table in ("stack_frames", "stack_traces"):
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+                assert count == (2,)
+        assert storage.get_stack_profile() == [
+            {"stack": ["main (app.py:1)", "handler (app.py:10)"], "count": 5},
+            {"stack": ["main (app.py:1)"], "count": 1},
+        ]
+
+    def test_overhead_stays_bounded(self, storage):
+        """Test that sampling far too fast is throttled to the budget."""
+        sampler = StackSampler(storage, hz=100000, max_overhead=0.02)
+
+        # Cheap samples keep the configured rate
+        assert sampler.next_delay(1e-7) == pytest.approx(1e-5 - 1e-7)
+        # A 1ms sample is followed by 49ms idle: 2% of wall time
+        cost = 0.001
+        delay = sampler.next_delay(cost)
+        assert delay == pytest.approx(0.049)
+        assert cost / (cost + delay) == pytest.approx(0.02)
+
+    def test_middleware_samples_requests(self, storage):
+        """Test that the middleware ties samples to the request route."""
+
+        async def app(scope, receive, send):
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                sum(i for i in range(1000))
+            await send({"type": "http.response.start", "status": 200})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        async def send(message):
+            pass
+
+        middleware = TimeGlassMiddleware(
+            app, storage=storage, system_interval=None, stack_sampling_hz=500
+        )
+        scope = {"type": "http", "method": "GET", "path": "/busy"}
+        asyncio.run(middleware(scope, None, send))
+        middleware.writer.stop()
+        middleware._stack_sampler.stop()
+
+        profile = storage.get_stack_profile(route="/busy")
+        assert profile
+        assert any(
+            ".<locals>.app (test_stacks.py:" in label
+            for entry in profile
+            for label in entry["stack"]
+        )
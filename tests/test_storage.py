@@ -20,6 +20,25 @@ class TestTimeGlassStorage:
         """Test database initialization."""
         assert temp_db.db_path == ":memory:"
 
+    def test_saving_a_request_twice_counts_it_once(self, temp_db):
+        """Test that replayed records do not inflate the aggregates."""
+        metrics = ProfilingMetrics(
+            request_id="replayed", start_time=datetime.now(), duration_ms=8.0,
+            method="GET", path="/items", status_code=500,
+            error_type="ValueError", error_message="bad",
+            error_fingerprint="f1",
+        )
+
+        assert temp_db.save_many_profiling_metrics([metrics, metrics]) == 1
+        assert temp_db.save_many_profiling_metrics([metrics]) == 0
+
+        assert len(temp_db.get_profiling_metrics(limit=10)) == 1
+        assert temp_db.get_stats_summary()["total_requests"] == 1
+        windowed = temp_db.get_stats_summary(window_seconds=60)
+        assert windowed["total_requests"] == 1
+        [error] = temp_db.get_errors()
+        assert error["count"] == 1
+
     def test_save_and_retrieve_profiling_metrics(self, temp_db):
         """Test saving and retrieving profiling metrics."""
         start_time = datetime.now()
@@ -124,3 +143,522 @@ class TestTimeGlassStorage:
         assert stats["total_requests"] == 3
         assert stats["avg_duration_ms"] > 0
         assert stats["avg_cpu_percent"] > 0
+
+    def test_file_database_uses_wal(self, tmp_path):
+        """Test that file databases are opened in WAL mode."""
+        storage = TimeGlassStorage(str(tmp_path / "wal.db"))
+        with storage._connections.connect() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode.lower() == "wal"
+        storage.close()
+
+    def test_connections_are_persistent_per_thread(self, tmp_path):
+        """Test that each thread reuses its own connection."""
+        import threading
+
+        storage = TimeGlassStorage(str(tmp_path / "pool.db"))
+        with storage._connections.connect() as first:
+            pass
+        with storage._connections.connect() as second:
+            pass
+        assert first is second
+
+        other = []
+
+        def worker():
+            with storage._connections.connect() as conn:
+                other.append(conn)
+            storage.save_profiling_metrics(ProfilingMetrics(
+                request_id="from-thread", start_time=datetime.now()
+            ))
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        assert other[0] is not first
+        assert storage.get_profiling_metrics()[0].request_id == "from-thread"
+        storage.close()
+
+    def test_save_many_profiling_metrics_from_generator(self, temp_db):
+        """Test bulk saving profiling metrics in chunks."""
+        metrics = (
+            ProfilingMetrics(
+                request_id=f"bulk-{i}",
+                start_time=datetime.now(),
+                duration_ms=float(i),
+            )
+            for i in range(250)
+        )
+
+        written = temp_db.save_many_profiling_metrics(metrics, chunk_size=100)
+
+        assert written == 250
+        assert temp_db.get_stats_summary()["total_requests"] == 250
+
+    def test_save_many_system_and_query_metrics(self, temp_db):
+        """Test bulk saving system and query metrics."""
+        timestamp = datetime.now()
+        system = [
+            SystemMetrics(
+                timestamp=timestamp,
+                cpu_usage_percent=float(i),
+                memory_usage_mb=512.0,
+                memory_usage_percent=25.0,
+                total_memory_mb=2048,
+                cpu_count=4,
+            )
+            for i in range(5)
+        ]
+        queries = [
+            QueryMetrics(
+                request_id="bulk-query",
+                query=f"SELECT {i}",
+                duration_ms=1.5,
+                timestamp=timestamp,
+            )
+            for i in range(7)
+        ]
+
+        assert temp_db.save_many_system_metrics(system, chunk_size=2) == 5
+        assert temp_db.save_many_query_metrics(queries) == 7
+        assert len(temp_db.get_system_metrics(limit=10)) == 5
+
+    def test_save_many_rejects_invalid_chunk_size(self, temp_db):
+        """Test that a non-positive chunk size is rejected."""
+        with pytest.raises(ValueError):
+            temp_db.save_many_profiling_metrics([], chunk_size=0)
+
+    def test_get_profiling_metrics_filters_in_sql(self, temp_db):
+        """Test method, path and status filters are applied before the limit."""
+        rows = []
+        for i in range(30):
+            rows.append(ProfilingMetrics(
+                request_id=f"filter-{i}",
+                start_time=datetime(2025, 1, 1, 10, 0, i),
+                method="POST" if i % 3 == 0 else "GET",
+                path=f"/api/items/{i}" if i % 2 else "/health",
+                status_code=500 if i % 5 == 0 else 200,
+            ))
+        temp_db.save_many_profiling_metrics(rows)
+
+        posts = temp_db.get_profiling_metrics(limit=5, method="POST")
+        assert len(posts) == 5
+        assert all(m.method == "POST" for m in posts)
+
+        errors = temp_db.get_profiling_metrics(limit=100, status_code=500)
+        assert len(errors) == 6
+
+        health = temp_db.get_profiling_metrics(limit=100, path="/health")
+        assert len(health) == 15
+
+        items = temp_db.get_profiling_metrics(
+            limit=100, path_contains="ITEMS", method="GET", status_code=200
+        )
+        assert {m.request_id for m in items} == {
+            f"filter-{i}" for i in range(30)
+            if i % 2 and i % 3 and i % 5
+        }
+
+    def test_path_contains_escapes_wildcards(self, temp_db):
+        """Test that LIKE wildcards in path_contains match literally."""
+        for i, path in enumerate(["/a_b", "/axb"]):
+            temp_db.save_profiling_metrics(ProfilingMetrics(
+                request_id=f"like-{i}", start_time=datetime.now(), path=path
+            ))
+
+        results = temp_db.get_profiling_metrics(path_contains="a_b")
+        assert [m.path for m in results] == ["/a_b"]
+
+    def test_path_prefix_matches_leading_segments(self, temp_db):
+        """Test that path_prefix keeps paths starting with the prefix."""
+        for i, path in enumerate(["/api/items", "/api", "/apis", "/v1/api"]):
+            temp_db.save_profiling_metrics(ProfilingMetrics(
+                request_id=f"prefix-{i}", start_time=datetime.now(), path=path
+            ))
+
+        results = temp_db.get_profiling_metrics(path_prefix="/api")
+        assert sorted(m.path for m in results) == ["/api", "/api/items", "/apis"]
+        results = temp_db.get_profiling_metrics(path_prefix="/api/")
+        assert [m.path for m in results] == ["/api/items"]
+
+    def test_path_prefix_uses_index(self, temp_db):
+        """Test that the prefix range is served by the path index."""
+        from timeglass.storage import _prefix_bounds
+
+        with temp_db._connections.connect() as conn:
+            plan = conn.execute("""
+                EXPLAIN QUERY PLAN
+                SELECT request_id FROM profiling_metrics
+                WHERE path >= ? AND path < ?
+                ORDER BY start_time DESC LIMIT 10
+            """, _prefix_bounds("/api/")).fetchall()
+        assert "idx_profiling_path_start_time" in " ".join(
+            str(row[-1]) for row in plan
+        )
+
+    def test_status_filter_uses_index(self, temp_db):
+        """Test that status filtering is served by the composite index."""
+        with temp_db._connections.connect() as conn:
+            plan = conn.execute("""
+                EXPLAIN QUERY PLAN
+                SELECT request_id FROM profiling_metrics
+                WHERE status_code = ? ORDER BY start_time DESC LIMIT 10
+            """, (500,)).fetchall()
+        assert "idx_profiling_status_start_time" in " ".join(
+            str(row[-1]) for row in plan
+        )
+
+    def test_get_profiling_metric_by_request_id(self, temp_db):
+        """Test direct lookup of a single request."""
+        temp_db.save_many_profiling_metrics(
+            ProfilingMetrics(
+                request_id=f"lookup-{i}",
+                start_time=datetime.now(),
+                duration_ms=float(i),
+            )
+            for i in range(2000)
+        )
+
+        # Older than the newest 1000 rows
+        found = temp_db.get_profiling_metric("lookup-3")
+        assert found is not None
+        assert found.duration_ms == 3.0
+
+        assert temp_db.get_profiling_metric("missing") is None
+
+    def test_keyset_pagination_walks_all_rows(self, temp_db):
+        """Test that following cursors visits every row exactly once."""
+        same_time = datetime(2025, 1, 1, 12, 0, 0)
+        temp_db.save_many_profiling_metrics(
+            ProfilingMetrics(
+                request_id=f"page-{i}",
+                # Ties on start_time are broken by row id
+                start_time=same_time if i < 10 else datetime(2025, 1, 1, 12, 0, i),
+            )
+            for i in range(45)
+        )
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = temp_db.get_profiling_metrics_page(
+                limit=10, cursor=cursor
+            )
+            seen.extend(m.request_id for m in page)
+            if cursor is None:
+                break
+
+        assert len(seen) == 45
+        assert len(set(seen)) == 45
+        assert seen[0] == "page-44"
+
+    def test_invalid_cursor_is_rejected(self, temp_db):
+        """Test that a malformed cursor raises ValueError."""
+        with pytest.raises(ValueError):
+            temp_db.get_profiling_metrics_page(cursor="not-a-cursor")
+        with pytest.raises(ValueError):
+            temp_db.get_system_metrics_page(cursor="!!!")
+
+    def test_system_metrics_pagination(self, temp_db):
+        """Test keyset pagination of system metrics."""
+        temp_db.save_many_system_metrics(
+            SystemMetrics(
+                timestamp=datetime(2025, 1, 1, 0, 0, i),
+                cpu_usage_percent=float(i),
+                memory_usage_mb=1.0,
+                memory_usage_percent=1.0,
+                total_memory_mb=1,
+                cpu_count=1,
+            )
+            for i in range(5)
+        )
+
+        first, cursor = temp_db.get_system_metrics_page(limit=3)
+        second, last = temp_db.get_system_metrics_page(limit=3, cursor=cursor)
+
+        assert [m.cpu_usage_percent for m in first] == [4.0, 3.0, 2.0]
+        assert [m.cpu_usage_percent for m in second] == [1.0, 0.0]
+        assert last is None
+
+    def test_stats_summary_percentiles(self, temp_db):
+        """Test global and per-route latency percentiles."""
+        temp_db.save_many_profiling_metrics(
+            ProfilingMetrics(
+                request_id=f"pct-{i}",
+                start_time=datetime.now(),
+                duration_ms=float(i + 1),
+                method="GET",
+                path="/slow" if i >= 90 else "/fast",
+            )
+            for i in range(100)
+        )
+
+        stats = temp_db.get_stats_summary()
+        assert stats["p50_duration_ms"] == pytest.approx(50, rel=0.02)
+        assert stats["p90_duration_ms"] == pytest.approx(90, rel=0.02)
+        assert stats["p99_duration_ms"] == pytest.approx(99, rel=0.02)
+
+        routes = {r["route"]: r for r in stats["routes"]}
+        assert routes["/fast"]["count"] == 90
+        assert routes["/slow"]["count"] == 10
+        assert routes["/slow"]["p50_duration_ms"] == pytest.approx(95, rel=0.02)
+
+    def test_all_time_percentiles_follow_pruned_rollups(self, temp_db):
+        """Test that pruned hours drop out of all-time percentiles too."""
+        from datetime import timedelta
+
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id="recent", start_time=now, duration_ms=10.0,
+            ),
+            ProfilingMetrics(
+                request_id="old", start_time=now - timedelta(days=2),
+                duration_ms=1000.0,
+            ),
+        ])
+        temp_db.prune_rollups(3600, now - timedelta(days=1))
+
+        stats = temp_db.get_stats_summary()
+        assert stats["total_requests"] == 1
+        assert stats["p99_duration_ms"] == pytest.approx(10.0, rel=0.02)
+
+    def test_stats_summary_reads_rollups(self, temp_db):
+        """Test that windowed summaries come from the rollup tables."""
+        from datetime import timedelta
+
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id="recent-ok", start_time=now, duration_ms=10.0,
+                method="GET", path="/a", status_code=200,
+            ),
+            ProfilingMetrics(
+                request_id="recent-error", start_time=now, duration_ms=30.0,
+                method="GET", path="/a", status_code=500,
+            ),
+            ProfilingMetrics(
+                request_id="old", start_time=now - timedelta(days=2),
+                duration_ms=1000.0, method="GET", path="/a", status_code=200,
+            ),
+        ])
+
+        recent = temp_db.get_stats_summary(window_seconds=300)
+        assert recent["granularity_seconds"] == 1
+        assert recent["total_requests"] == 2
+        assert recent["avg_duration_ms"] == 20.0
+        assert recent["max_duration_ms"] == 30.0
+
+        day = temp_db.get_stats_summary(window_seconds=86400)
+        assert day["granularity_seconds"] == 60
+        assert day["total_requests"] == 2
+
+        everything = temp_db.get_stats_summary()
+        assert everything["total_requests"] == 3
+        assert everything["max_duration_ms"] == 1000.0
+
+        series = temp_db.get_rollup_series(window_seconds=300)
+        assert sum(b["count"] for b in series) == 2
+        assert sum(b["error_count"] for b in series) == 1
+
+    def test_rollups_backfill_existing_rows(self, tmp_path):
+        """Test that rollups are rebuilt for rows that predate them."""
+        db_path = str(tmp_path / "old.db")
+        storage = TimeGlassStorage(db_path)
+        storage.save_profiling_metrics(ProfilingMetrics(
+            request_id="old-row", start_time=datetime.now(), duration_ms=8.0,
+            status_code=200,
+        ))
+        with storage._connections.connect() as conn, conn:
+            conn.execute("DROP TABLE rollups")
+            conn.execute("DROP TABLE rollup_histograms")
+        storage.close()
+
+        reopened = TimeGlassStorage(db_path)
+        stats = reopened.get_stats_summary(window_seconds=60)
+        assert stats["total_requests"] == 1
+        assert stats["avg_duration_ms"] == 8.0
+        reopened.close()
+
+    def test_stats_summary_weights_sampled_requests(self, temp_db):
+        """Test that sample weights scale counts and weight averages."""
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id="sampled", start_time=now, duration_ms=10.0,
+                status_code=200, sample_weight=9.0,
+            ),
+            ProfilingMetrics(
+                request_id="kept", start_time=now, duration_ms=100.0,
+                status_code=500, sample_weight=1.0,
+            ),
+        ])
+
+        stats = temp_db.get_stats_summary(window_seconds=60)
+        assert stats["total_requests"] == 10
+        assert stats["avg_duration_ms"] == pytest.approx(19.0)
+        assert stats["throughput_rps"] == pytest.approx(10 / 60)
+        assert stats["p50_duration_ms"] == pytest.approx(10.0, rel=0.02)
+        assert temp_db.get_profiling_metric("sampled").sample_weight == 9.0
+
+    def test_sample_weight_column_added_to_old_database(self, tmp_path):
+        """Test that databases created before sampling gain sample_weight."""
+        db_path = str(tmp_path / "old.db")
+        storage = TimeGlassStorage(db_path)
+        with storage._connections.connect() as conn, conn:
+            conn.execute(
+                "ALTER TABLE profiling_metrics DROP COLUMN sample_weight"
+            )
+        storage.close()
+
+        reopened = TimeGlassStorage(db_path)
+        reopened.save_profiling_metrics(ProfilingMetrics(
+            request_id="new-row", start_time=datetime.now(), duration_ms=1.0,
+        ))
+        assert reopened.get_profiling_metric("new-row").sample_weight == 1.0
+        reopened.close()
+
+    def test_sub_millisecond_durations(self, temp_db):
+        """Test that sub-millisecond durations keep microsecond resolution."""
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id=f"fast-{i}", start_time=now,
+                duration_ms=(40 + i) / 1000, duration_us=40 + i,
+            )
+            for i in range(10)
+        ])
+        temp_db.save_profiling_metrics(ProfilingMetrics(
+            request_id="derived", start_time=now, duration_ms=0.25,
+        ))
+
+        assert temp_db.get_profiling_metric("fast-3").duration_us == 43
+        assert temp_db.get_profiling_metric("derived").duration_us == 250
+        stats = temp_db.get_stats_summary()
+        assert stats["p50_duration_ms"] == pytest.approx(0.045, rel=0.05)
+
+    def test_stats_summary_process_cpu_per_route(self, temp_db):
+        """Test that process CPU time is averaged per route."""
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id=f"cpu-{i}", start_time=now, duration_ms=50.0,
+                method="GET", path="/report" if i % 2 else "/health",
+                process_cpu_ms=40.0 if i % 2 else 0.5,
+                thread_cpu_ms=1.0, rss_bytes=1 << 20,
+            )
+            for i in range(10)
+        ])
+
+        stats = temp_db.get_stats_summary(window_seconds=60)
+        by_route = {r["route"]: r for r in stats["routes"]}
+        assert by_route["/report"]["avg_process_cpu_ms"] == 40.0
+        assert by_route["/health"]["avg_process_cpu_ms"] == 0.5
+        assert stats["avg_process_cpu_ms"] == 20.25
+        assert temp_db.get_profiling_metric("cpu-1").rss_bytes == 1 << 20
+
+    def test_aggregates_key_on_route_template(self, temp_db):
+        """Test that rollups and percentiles group by route template."""
+        now = datetime.now()
+        temp_db.save_many_profiling_metrics([
+            ProfilingMetrics(
+                request_id=f"user-{i}", start_time=now, duration_ms=5.0,
+                method="GET", path=f"/users/{i}", route="/users/{user_id}",
+            )
+            for i in range(20)
+        ])
+
+        stats = temp_db.get_stats_summary(window_seconds=60)
+        assert [r["route"] for r in stats["routes"]] == ["/users/{user_id}"]
+        assert stats["routes"][0]["count"] == 20
+        series = temp_db.get_rollup_series(60, route="/users/{user_id}")
+        assert sum(b["count"] for b in series) == 20
+        assert len(temp_db.get_profiling_metrics(route="/users/{user_id}")) == 20
+
+    def test_queries_aggregate_by_fingerprint(self, temp_db):
+        """Test that executions of one statement share a fingerprint row."""
+        now = datetime.now()
+        temp_db.save_many_query_metrics([
+            QueryMetrics(
+                request_id=f"q-{i}", query=f"SELECT * FROM users WHERE id = {i}",
+                duration_ms=float(i + 1), timestamp=now,
+            )
+            for i in range(10)
+        ] + [
+            QueryMetrics(
+                request_id="q-0", query="UPDATE users SET seen = 1",
+                duration_ms=100.0, timestamp=now,
+            )
+        ], chunk_size=4)
+
+        top = temp_db.get_top_queries(limit=5)
+        assert [q["fingerprint"] for q in top] == [
+            "UPDATE users SET seen = ?", "SELECT * FROM users WHERE id = ?",
+        ]
+        select = top[1]
+        assert select["count"] == 10
+        assert select["total_ms"] == pytest.approx(55.0)
+        assert (select["min_ms"], select["max_ms"]) == (1.0, 10.0)
+        assert select["p50_ms"] == pytest.approx(5.0, rel=0.25)
+        assert temp_db.get_top_queries(order_by="count")[0] == select
+        assert [q.query for q in temp_db.get_query_metrics("q-0")] == [
+            "SELECT * FROM users WHERE id = ?", "UPDATE users SET seen = ?",
+        ]
+        with pytest.raises(ValueError):
+            temp_db.get_top_queries(order_by="bogus")
+
+    def test_many_fingerprints_in_one_chunk(self, temp_db):
+        """Test that fingerprint IDs resolve past one lookup's parameters."""
+        now = datetime.now()
+        temp_db.save_many_query_metrics([
+            QueryMetrics(
+                request_id="many", query=f"SELECT c{i} FROM t",
+                duration_ms=1.0, timestamp=now,
+            )
+            for i in range(1200)
+        ] * 2, chunk_size=2400)
+
+        queries = temp_db.get_query_metrics("many")
+        assert len(queries) == 2400
+        assert {q.query for q in queries} == {
+            f"SELECT c{i} FROM t" for i in range(1200)
+        }
+        assert {q["count"] for q in temp_db.get_top_queries(limit=2000)} == {2}
+
+    def test_query_fingerprints_backfill_old_database(self, tmp_path):
+        """Test that raw query rows from before fingerprinting are counted."""
+        db_path = str(tmp_path / "old.db")
+        storage = TimeGlassStorage(db_path)
+        with storage._connections.connect() as conn, conn:
+            conn.executescript("""
+                DROP TABLE query_metrics;
+                DROP TABLE query_fingerprints;
+                DROP TABLE query_histogram;
+                CREATE TABLE query_metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    connection_id TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            conn.execute("""
+                INSERT INTO query_metrics (request_id, query, duration_ms, timestamp)
+                VALUES ('old', 'SELECT 1', 3.0, ?)
+            """, (datetime.now().isoformat(),))
+        storage.close()
+
+        reopened = TimeGlassStorage(db_path)
+        reopened.save_query_metrics(QueryMetrics(
+            request_id="new", query="SELECT 2", duration_ms=5.0,
+            timestamp=datetime.now(),
+        ))
+        [statement] = reopened.get_top_queries()
+        assert statement["fingerprint"] == "SELECT ?"
+        assert statement["count"] == 2
+        assert [q.query for q in reopened.get_query_metrics("old")] == ["SELECT 1"]
+        assert [q.query for q in reopened.get_query_metrics("new")] == ["SELECT ?"]
+        reopened.close()
@@ -0,0 +1,106 @@
+"""Unit tests for TimeGlass system metrics sampling."""
+
+import asyncio
+import gc
+import sys
+import time
+
+import pytest
+
+from timeglass.system import SystemSampler
+
+
+class TestSystemSampler:
+    """Test periodic host and process sampling."""
+
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"), reason="reads /proc"
+    )
+    def test_sample_reads_host_counters(self, storage):
+        """Test that a sample fills the /proc based fields."""
+        metrics = SystemSampler(storage).sample()
+
+        assert metrics.total_memory_mb > 0
+        assert 0 <= metrics.cpu_usage_percent <= 100
+        assert metrics.load_avg_1m is not None
+        assert metrics.process_count > 0
+        assert metrics.open_fds > 0
+        assert metrics.net_rx_bytes is not None
+        assert metrics.disk_read_bytes is not None
+        assert metrics.event_loop_lag_ms is None
+
+    def test_gc_collections_between_samples(self, storage):
+        """Test that collections are counted per sample interval."""
+        sampler = SystemSampler(storage)
+        sampler._gc.install()
+        try:
+            sampler.sample()
+            gc.collect()
+            gc.collect()
+            metrics = sampler.sample()
+        finally:
+            sampler._gc.uninstall()
+
+        assert metrics.gc_collections >= 2
+        assert metrics.gc_pause_ms > 0
+        assert sampler.sample().gc_collections == 0
+
+    def test_host_only_sampler_leaves_process_fields_empty(self, storage):
+        """Test that process_metrics=False records host figures only."""
+        metrics = SystemSampler(storage, process_metrics=False).sample()
+
+        assert metrics.total_memory_mb > 0
+        assert metrics.open_fds is None
+        assert metrics.gc_collections is None
+        assert metrics.gc_pause_ms is None
+        assert metrics.event_loop_lag_ms is None
+
+    def test_samples_are_written_in_batches(self, storage):
+        """Test that the sampler thread stores batched samples."""
+        sampler = SystemSampler(storage, interval=0.01, batch_size=3)
+        sampler.start()
+        deadline = time.monotonic() + 5
+        while (
+            not storage.get_system_metrics(limit=3)
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        sampler.stop()
+
+        rows = storage.get_system_metrics(limit=100)
+        assert len(rows) >= 3
+        assert sampler.errors == 0
+
+    def test_event_loop_lag_is_measured(self, storage):
+        """Test that lag is reported both while and after the loop blocks."""
+        sampler = SystemSampler(storage)
+        lags = []
+
+        async def busy():
+            sampler.watch_loop(asyncio.get_running_loop())
+            # Block the loop so the probe callback cannot run
+            time.sleep(0.1)
+            lags.append(sampler.sample().event_loop_lag_ms)
+            time.sleep(0.1)
+            await asyncio.sleep(0)
+            lags.append(sampler.sample().event_loop_lag_ms)
+
+        asyncio.run(busy())
+
+        blocked, measured = lags
+        assert blocked >= 100
+        assert measured >= 200
+        assert sampler.sample().event_loop_lag_ms is None
+
+    def test_recent_samples_feed_stats_summary(self, storage):
+        """Test that current CPU and memory come from recent samples."""
+        metrics = SystemSampler(storage).sample()
+        metrics.cpu_usage_percent = 42.0
+        storage.save_system_metrics(metrics)
+
+        summary = storage.get_stats_summary()
+
+        assert summary["current_cpu_percent"] == pytest.approx(42.0)
+        assert summary["current_memory_percent"] == pytest.approx(
+            metrics.memory_usage_percent
+        )
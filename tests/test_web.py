@@ -83,6 +83,59 @@ class TestTimeGlassWeb:
         assert "/api/test" in response.text
         assert "200" in response.text
 
+    def test_request_detail_shows_n_plus_one(self, client, tmp_path):
+        """Test that repeated statements are listed on the detail page."""
+        from timeglass.storage import TimeGlassStorage
+        from timeglass.models import ProfilingMetrics, QueryMetrics
+        from datetime import datetime
+
+        storage = TimeGlassStorage(str(tmp_path / "test.db"))
+        now = datetime.now()
+        storage.save_profiling_metrics(ProfilingMetrics(
+            request_id="loop-1", start_time=now, duration_ms=20.0,
+            method="GET", path="/orders",
+        ))
+        storage.save_many_query_metrics([
+            QueryMetrics(
+                request_id="loop-1",
+                query=f"SELECT * FROM lines WHERE order_id = {i}",
+                duration_ms=1.0, timestamp=now,
+            )
+            for i in range(6)
+        ])
+
+        response = client.get("/request/loop-1")
+        assert response.status_code == 200
+        assert "6 queries, 6.00ms in total" in response.text
+        assert "N+1 Queries" in response.text
+        assert "SELECT * FROM lines WHERE order_id = ?" in response.text
+        assert "5.00ms" in response.text
+
+    def test_request_detail_shows_timeline(self, client, tmp_path):
+        """Test that stored spans are drawn as nested timeline bars."""
+        from timeglass.storage import TimeGlassStorage
+        from timeglass.models import ProfilingMetrics, Span
+        from datetime import datetime
+
+        storage = TimeGlassStorage(str(tmp_path / "test.db"))
+        storage.save_profiling_metrics(ProfilingMetrics(
+            request_id="spans-1", start_time=datetime.now(), duration_ms=10.0,
+            duration_us=10000, method="GET", path="/orders",
+        ))
+        storage.save_many_spans([
+            Span("spans-1", 1, None, "load_orders", "custom", 0, 8000),
+            Span("spans-1", 2, 1, "query", "db", 1000, 2000,
+                 "SELECT * FROM orders WHERE id = 42"),
+        ])
+
+        response = client.get("/request/spans-1")
+        assert response.status_code == 200
+        assert "Timeline" in response.text
+        assert "load_orders" in response.text
+        assert "left: 10.00%; width: 20.00%" in response.text
+        assert "padding-left: 1rem" in response.text
+        assert "SELECT * FROM orders WHERE id = ?" in response.text
+
     def test_api_requests_with_filters(self, client):
         """Test requests API with filters."""
         # Test method filter
@@ -92,6 +145,8 @@ class TestTimeGlassWeb:
         # Test path filter
         response = client.get("/api/requests?path_contains=api")
         assert response.status_code == 200
+        response = client.get("/api/requests?path_prefix=/api")
+        assert response.status_code == 200
 
         # Test status code filter
         response = client.get("/api/requests?status_code=200")
@@ -105,3 +160,73 @@ class TestTimeGlassWeb:
         """Test system metrics API with parameters."""
         response = client.get("/api/system-metrics?limit=50")
         assert response.status_code == 200
+
+    def test_request_detail_not_found(self, client):
+        """Test request detail for an unknown request ID."""
+        response = client.get("/request/does-not-exist")
+        assert response.status_code == 404
+
+    def test_api_requests_cursor_pagination(self, client, tmp_path):
+        """Test that /api/requests exposes a next-page cursor."""
+        from timeglass.storage import TimeGlassStorage
+        from timeglass.models import ProfilingMetrics
+        from datetime import datetime
+
+        storage = TimeGlassStorage(str(tmp_path / "test.db"))
+        storage.save_many_profiling_metrics(
+            ProfilingMetrics(
+                request_id=f"cursor-{i}",
+                start_time=datetime(2025, 1, 1, 10, 0, i),
+            )
+            for i in range(3)
+        )
+
+        response = client.get("/api/requests?limit=2")
+        assert response.status_code == 200
+        assert [r["request_id"] for r in response.json()] == [
+            "cursor-2", "cursor-1"
+        ]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = client.get(f"/api/requests?limit=2&cursor={cursor}")
+        assert [r["request_id"] for r in response.json()] == ["cursor-0"]
+        assert "X-Next-Cursor" not in response.headers
+
+        response = client.get("/api/requests?cursor=bogus")
+        assert response.status_code == 400
+
+    def test_api_stats_window_and_timeseries(self, client):
+        """Test windowed stats and the rollup timeseries endpoint."""
+        response = client.get("/api/stats?window=600")
+        assert response.status_code == 200
+        assert response.json()["granularity_seconds"] == 1
+
+        response = client.get("/api/timeseries?window=3600")
+        assert response.status_code == 200
+        assert response.json() == []
+
+    def test_api_top_queries(self, client):
+        """Test the top statements endpoint and its ordering parameter."""
+        response = client.get("/api/queries/top?limit=5&order=avg")
+        assert response.status_code == 200
+        assert response.json() == []
+
+        response = client.get("/api/queries/top?order=bogus")
+        assert response.status_code == 422
+
+    def test_api_flamegraph_folded(self, client, tmp_path):
+        """Test folded stack output for flame graph tools."""
+        from timeglass.storage import TimeGlassStorage
+        from timeglass.models import StackSample
+        from datetime import datetime
+
+        storage = TimeGlassStorage(str(tmp_path / "test.db"))
+        storage.save_stack_samples([StackSample(
+            "req-1", (("app.py", "main", 1), ("db.py", "fetch", 7)), 4,
+            datetime.now(),
+        )])
+
+        response = client.get("/api/flamegraph?format=folded&window=60")
+        assert response.status_code == 200
+        assert response.text == "main (app.py:1);fetch (db.py:7) 4\n"
+        assert client.get("/api/flamegraph?request_id=other").json() == []
@@ -0,0 +1,119 @@
+"""Unit tests for the TimeGlass background writer."""
+
+import threading
+
+import pytest
+from datetime import datetime
+from timeglass.storage import TimeGlassStorage
+from timeglass.models import QueryMetrics
+from timeglass.sinks import Sink
+from timeglass.writer import BackgroundWriter
+
+
+@pytest.fixture
+def temp_db():
+    """Create temporary in-memory database for testing."""
+    return TimeGlassStorage(":memory:")
+
+
+def make_query(i):
+    """Create a query row for the record of ``make_metrics(i)``."""
+    return QueryMetrics(
+        request_id=f"req-{i}", query="SELECT 1", duration_ms=1.0,
+        timestamp=datetime.now(),
+    )
+
+
+class TestBackgroundWriter:
+    """Test BackgroundWriter functionality."""
+
+    def test_flush_writes_submitted_metrics(self, temp_db, make_metrics):
+        """Test that flushed records end up in storage."""
+        writer = BackgroundWriter(temp_db, batch_size=10, flush_interval=60)
+        writer.start()
+        try:
+            for i in range(25):
+                assert writer.submit(make_metrics(i))
+            writer.flush(timeout=5)
+
+            results = temp_db.get_profiling_metrics(limit=100)
+            assert len(results) == 25
+
+            stats = writer.stats()
+            assert stats["written"] == 25
+            assert stats["enqueued"] == 25
+            assert stats["queue_depth"] == 0
+            assert stats["batches"] >= 3
+        finally:
+            writer.stop()
+
+    def test_full_queue_drops_records(self, temp_db, make_metrics):
+        """Test that submit drops records instead of blocking."""
+        # Not started, so nothing drains the queue
+        writer = BackgroundWriter(temp_db, max_queue_size=2)
+
+        assert writer.submit(make_metrics(0))
+        assert writer.submit(make_metrics(1))
+        assert not writer.submit(make_metrics(2))
+
+        stats = writer.stats()
+        assert stats["dropped"] == 1
+        assert stats["queue_depth"] == 2
+
+    def test_stop_flushes_pending_records(self, temp_db, make_metrics):
+        """Test that stopping the writer writes queued records."""
+        writer = BackgroundWriter(temp_db, batch_size=1000, flush_interval=60)
+        writer.start()
+        for i in range(5):
+            writer.submit(make_metrics(i))
+        writer.stop()
+
+        assert len(temp_db.get_profiling_metrics(limit=10)) == 5
+
+    def test_queries_are_never_written_before_their_request(self, make_metrics):
+        """Test that rows submitted mid-drain wait for their record."""
+        written = []
+
+        class RecordingSink(Sink):
+            def write(self, batch):
+                written.extend(("request", m.request_id) for m in batch)
+
+            def write_queries(self, batch):
+                written.extend(("queries", q.request_id) for q in batch)
+                if len(written) == 2:
+                    # A request finishing while the writer is draining
+                    writer.submit(make_metrics(1))
+                    writer.submit_queries([make_query(1)])
+
+        writer = BackgroundWriter(RecordingSink(), flush_interval=60)
+        writer.start()
+        writer.submit(make_metrics(0))
+        writer.submit_queries([make_query(0)])
+        writer.stop()
+
+        assert written == [
+            ("request", "req-0"), ("queries", "req-0"),
+            ("request", "req-1"), ("queries", "req-1"),
+        ]
+
+    def test_stop_leaves_a_busy_sink_open(self, make_metrics):
+        """Test that the sink is not closed under a thread still writing."""
+        release = threading.Event()
+        closed = []
+
+        class SlowSink(Sink):
+            def write(self, batch):
+                release.wait(5)
+
+            def close(self):
+                closed.append(True)
+
+        writer = BackgroundWriter(SlowSink(), flush_interval=60)
+        writer.start()
+        thread = writer._thread
+        writer.submit(make_metrics(0))
+        writer.stop(timeout=0.05)
+        assert closed == []
+
+        release.set()
+        thread.join(5)
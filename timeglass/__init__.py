@@ -1,17 +1,21 @@
 """TimeGlass - A lightweight profiling tool for FastAPI applications."""
 
+import logging
+
 __version__ = "0.1.0"
 
 # Try to import the Rust extension
 try:
     from .timeglass_core import (
-        start_profiling, stop_profiling, get_system_info
+        start_profiling, stop_profiling, get_system_info,
+        ProfileHandle, ProfileResult,
     )
     _rust_available = True
 except ImportError:
     _rust_available = False
-    print("Warning: Rust extension not available, "
-          "using fallback implementation")
+    logging.getLogger(__name__).warning(
+        "Rust extension not available, using fallback implementation"
+    )
 
 from .middleware import TimeGlassMiddleware
 
@@ -1,8 +1,12 @@
 """TimeGlass CLI application."""
 
+import os
+from typing import Optional
+
 import typer
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 from rich.text import Text
 from timeglass import __version__
 from timeglass.web import start_dashboard
@@ -15,7 +19,9 @@ app = typer.Typer()
 def ui(
     host: str = typer.Option("127.0.0.1", "--host", help="Host to bind the server to"),
     port: int = typer.Option(8000, "--port", help="Port to bind the server to"),
-    db_path: str = typer.Option("timeglass.db", "--db", help="Path to the database file"),
+    db_path: str = typer.Option(
+        "timeglass.db", "--db", help="Path to the database file"
+    ),
 ):
     """Start the TimeGlass web dashboard."""
     console.print()
@@ -49,7 +55,12 @@ def version():
 
 
 @app.command()
-def stats(db_path: str = typer.Option("timeglass.db", "--db", help="Path to the database file")):
+def stats(
+    db_path: str = typer.Option(
+        "timeglass.db", "--db", help="Path to the database file"
+    ),
+    top: int = typer.Option(10, "--top", help="Number of routes to list"),
+):
     """Show profiling statistics summary."""
     from timeglass.storage import TimeGlassStorage
 
@@ -70,7 +81,17 @@ def stats(db_path: str = typer.Option("timeglass.db", "--db", help="Path to the
         console.print(f"[cyan]Avg Duration:[/cyan] {summary['avg_duration_ms']:.2f}ms")
         console.print(f"[cyan]Max Duration:[/cyan] {summary['max_duration_ms']:.2f}ms")
         console.print(f"[cyan]Min Duration:[/cyan] {summary['min_duration_ms']:.2f}ms")
+        console.print(
+            f"[cyan]Latency p50/p90/p99:[/cyan] "
+            f"{summary['p50_duration_ms']:.2f}ms / "
+            f"{summary['p90_duration_ms']:.2f}ms / "
+            f"{summary['p99_duration_ms']:.2f}ms"
+        )
         console.print(f"[cyan]Avg CPU Usage:[/cyan] {summary['avg_cpu_percent']:.1f}%")
+        console.print(
+            f"[cyan]Avg Process CPU Time:[/cyan] "
+            f"{summary['avg_process_cpu_ms']:.2f}ms"
+        )
         console.print(
             f"[cyan]Avg Memory Usage:[/cyan] {summary['avg_memory_percent']:.1f}%"
         )
@@ -82,11 +103,135 @@ def stats(db_path: str = typer.Option("timeglass.db", "--db", help="Path to the
         )
         console.print()
 
+        if summary["routes"]:
+            table = Table(title="Latency by Route")
+            table.add_column("Method", style="magenta")
+            table.add_column("Route", style="cyan")
+            table.add_column("Requests", justify="right")
+            table.add_column("p50", justify="right")
+            table.add_column("p90", justify="right")
+            table.add_column("p99", justify="right")
+            table.add_column("CPU Time", justify="right")
+            for route in summary["routes"][:top]:
+                table.add_row(
+                    route["method"] or "-",
+                    route["route"] or "-",
+                    f"{route['count']:,.0f}",
+                    f"{route['p50_duration_ms']:.2f}ms",
+                    f"{route['p90_duration_ms']:.2f}ms",
+                    f"{route['p99_duration_ms']:.2f}ms",
+                    f"{route['avg_process_cpu_ms']:.2f}ms"
+                    if route["avg_process_cpu_ms"] is not None else "-",
+                )
+            console.print(table)
+            console.print()
+
     except Exception as e:
         console.print(f"[red]✗ Error retrieving statistics: {e}[/red]")
         raise typer.Exit(1)
 
 
+@app.command()
+def compact(
+    db_path: str = typer.Option(
+        "timeglass.db", "--db", help="Path to the database file"
+    ),
+    raw_hours: float = typer.Option(
+        24.0, "--raw-hours", help="Keep raw request rows for this many hours"
+    ),
+    max_rows: Optional[int] = typer.Option(
+        None, "--max-rows", help="Cap the number of raw request rows"
+    ),
+    max_size_mb: Optional[float] = typer.Option(
+        None, "--max-size-mb", help="Cap the live database size in MB"
+    ),
+    full: bool = typer.Option(
+        False, "--full", help="Run a full VACUUM instead of an incremental one"
+    ),
+):
+    """Prune old profiling data and reclaim disk space."""
+    from timeglass.retention import RetentionPolicy, apply_retention
+    from timeglass.storage import TimeGlassStorage
+
+    try:
+        storage = TimeGlassStorage(db_path)
+        size_before = os.path.getsize(db_path)
+        policy = RetentionPolicy(
+            raw_hours=raw_hours, max_raw_rows=max_rows, max_size_mb=max_size_mb
+        )
+        deleted = apply_retention(storage, policy)
+
+        if full or not storage.incremental_vacuum():
+            console.print("[yellow]Running full VACUUM...[/yellow]")
+            storage.vacuum()
+        storage.checkpoint()
+        storage.close()
+        size_after = os.path.getsize(db_path)
+
+        console.print()
+        for table, count in deleted.items():
+            console.print(f"[cyan]{table}:[/cyan] {count:,} rows deleted")
+        console.print(
+            f"[green]✓[/green] {db_path}: {size_before / 1024 / 1024:.1f}MB → "
+            f"{size_after / 1024 / 1024:.1f}MB"
+        )
+        console.print()
+
+    except Exception as e:
+        console.print(f"[red]✗ Error compacting database: {e}[/red]")
+        raise typer.Exit(1)
+
+
+@app.command()
+def collect(
+    socket_path: Optional[str] = typer.Option(
+        None,
+        "--socket",
+        help="Unix socket to listen on [default: $XDG_RUNTIME_DIR or /tmp]",
+    ),
+    db_path: str = typer.Option(
+        "timeglass.db", "--db", help="Path to the database file"
+    ),
+    raw_hours: Optional[float] = typer.Option(
+        None,
+        "--raw-hours",
+        help="Apply retention, keeping raw rows this many hours",
+    ),
+):
+    """Collect profiling records from multiple workers into one database."""
+    import threading
+
+    from timeglass.collector import DEFAULT_SOCKET_PATH, Collector
+    from timeglass.retention import RetentionPolicy
+
+    socket_path = socket_path or DEFAULT_SOCKET_PATH
+
+    console.print()
+    console.print(
+        Panel.fit(
+            "[bold blue]TimeGlass Collector[/bold blue]",
+            title="📥 Collecting",
+            border_style="blue",
+        )
+    )
+
+    retention = RetentionPolicy(raw_hours=raw_hours) if raw_hours else None
+    collector = Collector(socket_path=socket_path, db_path=db_path, retention=retention)
+    try:
+        collector.start()
+        console.print(f"[green]✓[/green] Listening on {socket_path}")
+        console.print(f"[green]✓[/green] Writing to {db_path}")
+        console.print()
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        console.print("\n[yellow]⚠️  Collector stopped by user[/yellow]")
+    except Exception as e:
+        console.print(f"\n[red]✗ Error running collector: {e}[/red]")
+        raise typer.Exit(1)
+    finally:
+        collector.stop()
+
+
 @app.callback()
 def main():
     """TimeGlass - A lightweight profiling tool for FastAPI applications."""
@@ -0,0 +1,297 @@
+"""Single-writer collection for multi-worker deployments.
+
+With ``uvicorn --workers N`` or gunicorn every worker process would open
+the database and compete for SQLite's write lock. In collector mode the
+workers instead send their records over a local Unix domain socket to one
+collector process, which owns the database writer and retention job.
+
+Wire format: each message is a 4-byte big-endian length followed by UTF-8
+JSON. The first message on a connection names the record fields; every
+later message is a batch, as a list of records, each a list of values in
+that field order. Naming the fields once keeps batches compact and lets
+workers and collector run different TimeGlass versions. Since version 2
+the handshake also names the query fields, and a batch of database query
+rows is sent as ``{"queries": [...]}`` in the same way; version 3 adds
+span fields and ``{"spans": [...]}`` batches of request timeline spans.
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+from dataclasses import fields
+from typing import List, Optional
+
+from .models import ProfilingMetrics, QueryMetrics, Span
+from .retention import RetentionJob, RetentionPolicy
+from .sinks import Sink, StorageSink
+from .storage import TimeGlassStorage
+from .system import SystemSampler
+from .writer import BackgroundWriter
+
+logger = logging.getLogger(__name__)
+
+# The per-user runtime directory is private to the user, unlike /tmp
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", "timeglass.sock"
+)
+
+WIRE_VERSION = 3
+WIRE_FIELDS = [f.name for f in fields(ProfilingMetrics)]
+WIRE_QUERY_FIELDS = [f.name for f in fields(QueryMetrics)]
+WIRE_SPAN_FIELDS = [f.name for f in fields(Span)]
+
+# Versions a collector accepts from workers
+SUPPORTED_WIRE_VERSIONS = (1, 2, 3)
+
+_LENGTH = struct.Struct(">I")
+
+# Upper bound on a single message, to fail fast on a corrupt stream
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def _encode(payload) -> bytes:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return _LENGTH.pack(len(data)) + data
+
+
+def _read_exactly(stream, size: int) -> Optional[bytes]:
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+def _decode(stream):
+    """Read one message, or return None at end of stream."""
+    header = _read_exactly(stream, _LENGTH.size)
+    if header is None:
+        return None
+    (size,) = _LENGTH.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"message of {size} bytes exceeds limit")
+    data = _read_exactly(stream, size)
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def _rows(batch: list, names: List[str]) -> list:
+    rows = []
+    for m in batch:
+        record = m.to_dict()
+        rows.append([record[name] for name in names])
+    return rows
+
+
+class CollectorSink(Sink):
+    """Worker side: send batches to a collector over a Unix socket.
+
+    Runs on the worker's writer thread. The connection is opened on first
+    use and reopened after a failure; a batch that cannot be sent raises so
+    the writer counts it as an error.
+    """
+
+    def __init__(
+        self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 5.0
+    ):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(_encode({
+                "version": WIRE_VERSION,
+                "fields": WIRE_FIELDS,
+                "query_fields": WIRE_QUERY_FIELDS,
+                "span_fields": WIRE_SPAN_FIELDS,
+            }))
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+
+    def write(self, batch: List[ProfilingMetrics]):
+        self._send(_rows(batch, WIRE_FIELDS))
+
+    def write_queries(self, batch: List[QueryMetrics]):
+        self._send({"queries": _rows(batch, WIRE_QUERY_FIELDS)})
+
+    def write_spans(self, batch: List[Span]):
+        self._send({"spans": _rows(batch, WIRE_SPAN_FIELDS)})
+
+    def _send(self, payload):
+        if self._sock is None:
+            self._connect()
+        try:
+            self._sock.sendall(_encode(payload))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Read batches from one worker connection."""
+
+    def handle(self):
+        collector: "Collector" = self.server.collector
+        try:
+            hello = _decode(self.rfile)
+            if (
+                not isinstance(hello, dict)
+                or hello.get("version") not in SUPPORTED_WIRE_VERSIONS
+            ):
+                logger.warning("Rejected collector client: bad handshake")
+                return
+            names = hello["fields"]
+            query_names = hello.get("query_fields", WIRE_QUERY_FIELDS)
+            span_names = hello.get("span_fields", WIRE_SPAN_FIELDS)
+            while True:
+                rows = _decode(self.rfile)
+                if rows is None:
+                    return
+                if isinstance(rows, dict) and "spans" in rows:
+                    collector.submit_spans([
+                        Span.from_dict(dict(zip(span_names, values)))
+                        for values in rows["spans"]
+                    ])
+                    continue
+                if isinstance(rows, dict):
+                    collector.submit_queries([
+                        QueryMetrics.from_dict(dict(zip(query_names, values)))
+                        for values in rows["queries"]
+                    ])
+                    continue
+                collector.submit([
+                    ProfilingMetrics.from_dict(dict(zip(names, values)))
+                    for values in rows
+                ])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Collector connection failed: %s", e)
+
+
+def _is_listening(path: str) -> bool:
+    """Whether something accepts connections on the Unix socket ``path``."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Collector:
+    """Receive records from workers and write them from one process."""
+
+    def __init__(
+        self,
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        db_path: str = "timeglass.db",
+        storage: Optional[TimeGlassStorage] = None,
+        retention: Optional[RetentionPolicy] = None,
+        retention_interval: float = 300.0,
+        max_queue_size: int = 100000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        system_interval: Optional[float] = 5.0,
+    ):
+        self.socket_path = socket_path
+        self.storage = storage or TimeGlassStorage(db_path)
+        self.writer = BackgroundWriter(
+            StorageSink(self.storage),
+            max_queue_size=max_queue_size,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
+        self._retention_job = (
+            RetentionJob(self.storage, retention, retention_interval)
+            if retention is not None else None
+        )
+        # Workers leave system sampling to the collector, which shares
+        # their host; its own process figures would describe the collector,
+        # not the workers, so they are left empty
+        self._system_sampler = (
+            SystemSampler(self.storage, system_interval, process_metrics=False)
+            if system_interval else None
+        )
+        self._submit_lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, batch: List[ProfilingMetrics]):
+        """Queue records received from a worker."""
+        # The writer expects a single producer; connections share it
+        with self._submit_lock:
+            for metrics in batch:
+                self.writer.submit(metrics)
+
+    def submit_queries(self, batch: List[QueryMetrics]):
+        """Queue database query rows received from a worker."""
+        with self._submit_lock:
+            self.writer.submit_queries(batch)
+
+    def submit_spans(self, batch: List[Span]):
+        """Queue request timeline spans received from a worker."""
+        with self._submit_lock:
+            self.writer.submit_spans(batch)
+
+    def start(self):
+        """Listen on the socket and start writing in the background.
+
+        Raises OSError (EADDRINUSE) if another collector is already
+        listening on the socket.
+        """
+        if os.path.exists(self.socket_path):
+            if _is_listening(self.socket_path):
+                raise OSError(
+                    errno.EADDRINUSE,
+                    f"a collector is already listening on {self.socket_path}",
+                )
+            # Left behind by a collector that did not shut down cleanly
+            os.unlink(self.socket_path)
+        self._server = _Server(self.socket_path, _Handler)
+        # Only the collector's user may send records
+        os.chmod(self.socket_path, 0o600)
+        self._server.collector = self
+        self.writer.start()
+        if self._retention_job is not None:
+            self._retention_job.start()
+        if self._system_sampler is not None:
+            self._system_sampler.start()
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="timeglass-collector",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop listening, then flush and stop the writer."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self._retention_job is not None:
+            self._retention_job.stop()
+        if self._system_sampler is not None:
+            self._system_sampler.stop()
+        self.writer.stop()
@@ -0,0 +1,40 @@
+"""Exception summaries for failed requests.
+
+Exceptions are grouped by a fingerprint of their type and the innermost
+frames of their traceback, so repeats of the same failure are counted
+together however their messages differ. Frames are identified by file and
+function name only; line numbers would change the fingerprint on every
+unrelated edit to the file.
+"""
+
+import hashlib
+import traceback
+from typing import Tuple
+
+# Innermost traceback frames that make up a fingerprint
+FINGERPRINT_DEPTH = 5
+
+# Longest exception message kept, in characters
+MAX_MESSAGE_LENGTH = 500
+
+
+def exception_type(exc: BaseException) -> str:
+    """Qualified name of the exception's class."""
+    cls = type(exc)
+    if cls.__module__ == "builtins":
+        return cls.__qualname__
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def fingerprint(exc: BaseException, depth: int = FINGERPRINT_DEPTH) -> str:
+    """Stable short hash of the exception type and innermost frames."""
+    frames = traceback.extract_tb(exc.__traceback__)[-depth:]
+    digest = hashlib.sha1(exception_type(exc).encode())
+    for frame in frames:
+        digest.update(f"\n{frame.filename}:{frame.name}".encode())
+    return digest.hexdigest()[:16]
+
+
+def describe(exc: BaseException) -> Tuple[str, str, str]:
+    """Return ``(type, truncated message, fingerprint)`` for an exception."""
+    return exception_type(exc), str(exc)[:MAX_MESSAGE_LENGTH], fingerprint(exc)
@@ -0,0 +1,58 @@
+"""Logging helpers for TimeGlass.
+
+TimeGlass logs through the standard ``logging`` module under the
+``timeglass`` logger hierarchy, so applications decide where messages go.
+Warnings that can fire on every request go through ``log_limited`` so a
+persistent fault produces one line per interval rather than one per request.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Hashable
+
+logger = logging.getLogger("timeglass")
+
+# Default minimum seconds between two messages with the same key
+DEFAULT_INTERVAL = 60.0
+
+
+class RateLimiter:
+    """Allow at most one event per key per ``interval`` seconds."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last: Dict[Hashable, float] = {}
+        self._suppressed: Dict[Hashable, int] = {}
+
+    def allow(self, key: Hashable) -> int:
+        """Return how many events were suppressed plus one, or 0 to suppress.
+
+        A true result means the caller should emit; its value tells how many
+        events (including this one) it stands for.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return 0
+            self._last[key] = now
+            return self._suppressed.pop(key, 0) + 1
+
+
+_limiter = RateLimiter()
+
+
+def log_limited(
+    log: logging.Logger, level: int, key: Hashable, msg: str, *args
+):
+    """Log ``msg`` unless a message with ``key`` was logged recently."""
+    if not log.isEnabledFor(level):
+        return
+    count = _limiter.allow(key)
+    if count:
+        if count > 1:
+            msg += f" ({count - 1} similar messages suppressed)"
+        log.log(level, msg, *args)
@@ -1,9 +1,32 @@
 """TimeGlass FastAPI middleware for profiling."""
 
-from typing import Callable
+from typing import Callable, Optional
+from datetime import datetime
+import asyncio
+import logging
+import os
+import sys
 import time
+import tracemalloc
 import uuid
-import json
+
+from .collector import CollectorSink
+from .errors import describe as describe_error
+from .logs import log_limited
+from .models import ProfilingMetrics
+from .queries import begin_request, end_request
+from .resources import ResourceSnapshot
+from .retention import RetentionJob, RetentionPolicy
+from .routes import RouteResolver
+from .sampling import Sampler
+from .sinks import Sink, StorageSink
+from .spans import begin_request as begin_spans
+from .spans import end_request as end_spans
+from .spans import instrument_fastapi
+from .stacks import StackSampler, track_request, untrack_request
+from .storage import TimeGlassStorage
+from .system import SystemSampler
+from .writer import BackgroundWriter
 
 # Import Rust functions if available
 try:
@@ -12,58 +35,282 @@ try:
 except ImportError:
     _rust_available = False
 
+logger = logging.getLogger(__name__)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    """Return the first request header called ``name`` (lowercase)."""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
 
 class TimeGlassMiddleware:
-    """Middleware for profiling FastAPI requests."""
+    """Middleware for profiling FastAPI requests.
+
+    Records go to ``sink`` when given; with ``collector_socket`` they are
+    sent to a ``timeglass collect`` process (see timeglass.collector), which
+    is the way to run several workers; otherwise they go to ``storage`` (or
+    a TimeGlassStorage at ``db_path``). Nothing is printed per request; use
+    a LoggingSink to get a log line per request.
 
-    def __init__(self, app: Callable):
+    When writing to storage, host and process metrics are also sampled every
+    ``system_interval`` seconds (see timeglass.system); pass None to disable.
+    In collector mode the collector samples them instead, and workers skip
+    the Rust extension's host CPU and memory sampling, recording request
+    timing only.
+
+    ``stack_sampling_hz`` turns on the statistical stack sampler (see
+    timeglass.stacks), whose samples back flame graphs. It is off by
+    default and needs storage.
+
+    With ``spans`` (the default) each request also records a timeline of
+    spans (see timeglass.spans): database queries, dependency resolution,
+    outbound HTTP through a SpanTransport and blocks wrapped in ``span``.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        db_path: str = "timeglass.db",
+        storage: Optional[TimeGlassStorage] = None,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        retention: Optional[RetentionPolicy] = None,
+        retention_interval: float = 300.0,
+        sampler: Optional[Sampler] = None,
+        trace_allocations: bool = False,
+        sink: Optional[Sink] = None,
+        collector_socket: Optional[str] = None,
+        system_interval: Optional[float] = 5.0,
+        stack_sampling_hz: Optional[float] = None,
+        spans: bool = True,
+    ):
         self.app = app
+        self.db_path = db_path
+        self._storage = storage
+        if sink is None and collector_socket is not None:
+            sink = CollectorSink(collector_socket)
+        self._sink = sink
+        # The collector samples the shared host, so workers sending to it
+        # do not each run the Rust host sampler
+        self._host_sampling = not isinstance(sink, CollectorSink)
+        self._writer_options = {
+            "max_queue_size": max_queue_size,
+            "batch_size": batch_size,
+            "flush_interval": flush_interval,
+        }
+        self._writer: Optional[BackgroundWriter] = None
+        self.retention = retention
+        self.retention_interval = retention_interval
+        self._retention_job: Optional[RetentionJob] = None
+        self.system_interval = system_interval
+        self._system_sampler: Optional[SystemSampler] = None
+        self._loop_watched = False
+        self.stack_sampling_hz = stack_sampling_hz
+        self._stack_sampler: Optional[StackSampler] = None
+        self.spans = spans
+        if spans:
+            instrument_fastapi()
+        self.sampler = sampler
+        self._routes = RouteResolver()
+        # Python allocation deltas need tracemalloc, which slows every
+        # allocation in the process, so it is opt-in
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def writer(self) -> BackgroundWriter:
+        """Background writer, created and started on first use."""
+        if self._writer is None:
+            if self._sink is None:
+                if self._storage is None:
+                    self._storage = TimeGlassStorage(self.db_path)
+                self._sink = StorageSink(self._storage)
+            self._writer = BackgroundWriter(
+                self._sink, **self._writer_options
+            )
+            self._writer.start()
+            if self.retention is not None and self._storage is not None:
+                self._retention_job = RetentionJob(
+                    self._storage, self.retention, self.retention_interval
+                )
+                self._retention_job.start()
+            if self.system_interval and self._storage is not None:
+                self._system_sampler = SystemSampler(
+                    self._storage, self.system_interval
+                )
+                self._system_sampler.start()
+            if self.stack_sampling_hz and self._storage is not None:
+                self._stack_sampler = StackSampler(
+                    self._storage, self.stack_sampling_hz
+                )
+                self._stack_sampler.start()
+        return self._writer
+
+    def _sample_request(self, scope) -> Optional[float]:
+        """The sampler's weight for a request that has not run yet."""
+        method, path = scope.get("method"), scope.get("path")
+        route = (
+            self._routes.resolve_early(scope, method, path)
+            if self.sampler.uses_route else None
+        )
+        return self.sampler.sample_request(method, route)
 
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             await self.app(scope, receive, send)
             return
 
+        if not self._loop_watched:
+            # Start writing on the first request rather than the first
+            # submit, so the system sampler can watch the loop requests run on
+            self.writer.start()
+            if self._system_sampler is not None:
+                self._system_sampler.watch_loop(asyncio.get_running_loop())
+            if self._stack_sampler is not None:
+                self._stack_sampler.watch_thread()
+            self._loop_watched = True
+
+        # Samplers that ignore the outcome decide up front, so the requests
+        # they drop run without any instrumentation
+        weight = None
+        if self.sampler is not None:
+            try:
+                weight = self._sample_request(scope)
+            except Exception as e:
+                log_limited(
+                    logger, logging.WARNING, "sample-failed",
+                    "Failed to sample request: %s", e,
+                )
+            if weight == 0:
+                await self.app(scope, receive, send)
+                return
+
         # Generate unique request ID
         request_id = str(uuid.uuid4())
+        start_datetime = datetime.now()
+        start_ns = time.perf_counter_ns()
+        start_resources = ResourceSnapshot.take()
 
         # Start profiling with Rust extension
+        handle = None
+        if self._host_sampling:
+            try:
+                if _rust_available:
+                    handle = start_profiling(request_id)
+                else:
+                    raise Exception("Rust extension not available")
+            except Exception as e:
+                # Fallback to basic timing if Rust fails
+                log_limited(
+                    logger, logging.WARNING, "rust-start",
+                    "Rust profiling unavailable, using fallback timing: %s", e,
+                )
+
+        # Observe the response as it is sent
+        status_code = None
+        response_size = 0
+        first_byte_ns = None
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size, first_byte_ns
+            if message["type"] == "http.response.start":
+                first_byte_ns = time.perf_counter_ns()
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        # Process the request; mounted apps extend root_path in place.
+        # The metric is recorded even if the application raises.
+        root_path = scope.get("root_path", "")
+        method = scope.get("method")
+        path = scope.get("path")
+        error = None
+        # Instrumented database drivers record queries into this buffer
+        queries, query_tokens = begin_request(request_id)
+        timeline, span_tokens = (
+            begin_spans(request_id, start_ns) if self.spans else (None, None)
+        )
+        # Stack samples taken under this frame belong to the request
+        frame = sys._getframe() if self._stack_sampler is not None else None
+        if frame is not None:
+            track_request(frame, request_id)
         try:
-            if _rust_available:
-                start_metrics_json = start_profiling(request_id)
-                start_metrics = json.loads(start_metrics_json)
-            else:
-                raise Exception("Rust extension not available")
-        except Exception as e:
-            # Fallback to basic timing if Rust fails
-            print(f"Failed to start Rust profiling: {e}")
-            start_time = time.time()
-            start_metrics = None
-
-        # Process the request
-        await self.app(scope, receive, send)
-
-        # Stop profiling and collect metrics
-        try:
-            if start_metrics and _rust_available:
-                final_metrics_json = stop_profiling(
-                    request_id, start_metrics_json)
-                final_metrics = json.loads(final_metrics_json)
-
-                # Log the profiling results
-                duration = final_metrics.get('duration_ms', 0)
-                cpu_usage = final_metrics.get('cpu_usage_percent', 0)
-                memory_mb = final_metrics.get('memory_usage_mb', 0)
-                memory_percent = final_metrics.get('memory_usage_percent', 0)
-
-                print(f"Request {request_id}: {duration:.2f}ms, "
-                      f"CPU: {cpu_usage:.1f}%, "
-                      f"Memory: {memory_mb:.1f}MB ({memory_percent:.1f}%)")
-            else:
-                # Fallback timing
-                end_time = time.time()
-                duration = (end_time - start_time) * 1000
-                print(f"Request {request_id}: {duration:.2f}ms "
-                      "(fallback timing)")
-        except Exception as e:
-            print(f"Failed to collect profiling metrics: {e}")
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            end_request(query_tokens)
+            if span_tokens is not None:
+                end_spans(span_tokens)
+            if frame is not None:
+                untrack_request(frame)
+            # Stop profiling and collect metrics
+            try:
+                if handle is not None:
+                    result = stop_profiling(handle)
+                    duration_ns = result.duration_ns
+                    cpu_usage = result.cpu_usage_percent
+                    memory_mb = result.memory_usage_mb
+                    memory_percent = result.memory_usage_percent
+                else:
+                    # Fallback timing
+                    duration_ns = time.perf_counter_ns() - start_ns
+                    cpu_usage = memory_mb = memory_percent = None
+
+                client = scope.get("client")
+                metrics = ProfilingMetrics(
+                    request_id=request_id,
+                    start_time=start_datetime,
+                    end_time=datetime.now(),
+                    duration_ms=duration_ns / 1e6,
+                    duration_us=duration_ns // 1000,
+                    ttfb_us=(
+                        (first_byte_ns - start_ns) // 1000
+                        if first_byte_ns is not None else None
+                    ),
+                    method=method,
+                    path=path,
+                    route=self._routes.resolve(scope, method, path, root_path),
+                    status_code=status_code,
+                    response_size_bytes=response_size,
+                    user_agent=_header(scope, b"user-agent"),
+                    client_ip=client[0] if client else None,
+                    worker_pid=os.getpid(),
+                    cpu_usage_percent=cpu_usage,
+                    memory_usage_mb=memory_mb,
+                    memory_usage_percent=memory_percent,
+                    **ResourceSnapshot.take().usage_since(start_resources),
+                )
+                if error is not None:
+                    (metrics.error_type, metrics.error_message,
+                     metrics.error_fingerprint) = describe_error(error)
+                    if metrics.status_code is None:
+                        # The app failed before responding; the server
+                        # will answer 500
+                        metrics.status_code = 500
+                if weight is not None:
+                    metrics.sample_weight = weight
+                elif self.sampler is not None:
+                    metrics.sample_weight = self.sampler.sample(metrics)
+                if metrics.sample_weight > 0:
+                    # Queries and spans are kept only for requests that
+                    # are stored
+                    if self.writer.submit(metrics):
+                        if queries.queries:
+                            for query in queries.queries:
+                                query.method = metrics.method
+                                query.route = metrics.route
+                            self.writer.submit_queries(queries.queries)
+                        if timeline is not None and timeline.spans:
+                            self.writer.submit_spans(timeline.spans)
+            except Exception as e:
+                log_limited(
+                    logger, logging.WARNING, "collect-failed",
+                    "Failed to collect profiling metrics: %s", e,
+                )
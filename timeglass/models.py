@@ -2,7 +2,7 @@
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 
 
 @dataclass
@@ -13,15 +13,35 @@ class ProfilingMetrics:
     start_time: datetime
     end_time: Optional[datetime] = None
     duration_ms: Optional[float] = None
+    # Monotonic duration in whole microseconds
+    duration_us: Optional[int] = None
+    # Time from request start to the response headers, in microseconds
+    ttfb_us: Optional[int] = None
     cpu_usage_percent: Optional[float] = None
     memory_usage_mb: Optional[float] = None
     memory_usage_percent: Optional[float] = None
     method: Optional[str] = None
     path: Optional[str] = None
+    # Matched route template, e.g. /users/{user_id} (see timeglass.routes)
+    route: Optional[str] = None
     status_code: Optional[int] = None
     response_size_bytes: Optional[int] = None
     user_agent: Optional[str] = None
     client_ip: Optional[str] = None
+    # Inverse of the probability the request was sampled with
+    sample_weight: float = 1.0
+    # This process's resource usage across the request (timeglass.resources)
+    process_cpu_ms: Optional[float] = None
+    thread_cpu_ms: Optional[float] = None
+    rss_bytes: Optional[int] = None
+    rss_delta_bytes: Optional[int] = None
+    alloc_delta_bytes: Optional[int] = None
+    # Set when the application raised (see timeglass.errors)
+    error_type: Optional[str] = None
+    error_message: Optional[str] = None
+    error_fingerprint: Optional[str] = None
+    # PID of the worker process that served the request
+    worker_pid: Optional[int] = None
 
     def to_dict(self) -> dict:
         """Convert to dictionary for JSON serialization."""
@@ -31,15 +51,28 @@ class ProfilingMetrics:
             else None,
             "end_time": self.end_time.isoformat() if self.end_time else None,
             "duration_ms": self.duration_ms,
+            "duration_us": self.duration_us,
+            "ttfb_us": self.ttfb_us,
             "cpu_usage_percent": self.cpu_usage_percent,
             "memory_usage_mb": self.memory_usage_mb,
             "memory_usage_percent": self.memory_usage_percent,
             "method": self.method,
             "path": self.path,
+            "route": self.route,
             "status_code": self.status_code,
             "response_size_bytes": self.response_size_bytes,
             "user_agent": self.user_agent,
             "client_ip": self.client_ip,
+            "sample_weight": self.sample_weight,
+            "process_cpu_ms": self.process_cpu_ms,
+            "thread_cpu_ms": self.thread_cpu_ms,
+            "rss_bytes": self.rss_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "alloc_delta_bytes": self.alloc_delta_bytes,
+            "error_type": self.error_type,
+            "error_message": self.error_message,
+            "error_fingerprint": self.error_fingerprint,
+            "worker_pid": self.worker_pid,
         }
 
     @classmethod
@@ -58,15 +91,28 @@ class ProfilingMetrics:
                 else None
             ),
             duration_ms=data.get("duration_ms"),
+            duration_us=data.get("duration_us"),
+            ttfb_us=data.get("ttfb_us"),
             cpu_usage_percent=data.get("cpu_usage_percent"),
             memory_usage_mb=data.get("memory_usage_mb"),
             memory_usage_percent=data.get("memory_usage_percent"),
             method=data.get("method"),
             path=data.get("path"),
+            route=data.get("route"),
             status_code=data.get("status_code"),
             response_size_bytes=data.get("response_size_bytes"),
             user_agent=data.get("user_agent"),
             client_ip=data.get("client_ip"),
+            sample_weight=data.get("sample_weight", 1.0),
+            process_cpu_ms=data.get("process_cpu_ms"),
+            thread_cpu_ms=data.get("thread_cpu_ms"),
+            rss_bytes=data.get("rss_bytes"),
+            rss_delta_bytes=data.get("rss_delta_bytes"),
+            alloc_delta_bytes=data.get("alloc_delta_bytes"),
+            error_type=data.get("error_type"),
+            error_message=data.get("error_message"),
+            error_fingerprint=data.get("error_fingerprint"),
+            worker_pid=data.get("worker_pid"),
         )
 
 
@@ -80,6 +126,21 @@ class SystemMetrics:
     memory_usage_percent: float
     total_memory_mb: int
     cpu_count: int
+    load_avg_1m: Optional[float] = None
+    load_avg_5m: Optional[float] = None
+    load_avg_15m: Optional[float] = None
+    process_count: Optional[int] = None
+    # Open file descriptors of the sampling process
+    open_fds: Optional[int] = None
+    event_loop_lag_ms: Optional[float] = None
+    # Garbage collections and time spent in them since the previous sample
+    gc_collections: Optional[int] = None
+    gc_pause_ms: Optional[float] = None
+    # Cumulative host counters
+    net_rx_bytes: Optional[int] = None
+    net_tx_bytes: Optional[int] = None
+    disk_read_bytes: Optional[int] = None
+    disk_write_bytes: Optional[int] = None
 
     def to_dict(self) -> dict:
         """Convert to dictionary."""
@@ -90,8 +151,44 @@ class SystemMetrics:
             "memory_usage_percent": self.memory_usage_percent,
             "total_memory_mb": self.total_memory_mb,
             "cpu_count": self.cpu_count,
+            "load_avg_1m": self.load_avg_1m,
+            "load_avg_5m": self.load_avg_5m,
+            "load_avg_15m": self.load_avg_15m,
+            "process_count": self.process_count,
+            "open_fds": self.open_fds,
+            "event_loop_lag_ms": self.event_loop_lag_ms,
+            "gc_collections": self.gc_collections,
+            "gc_pause_ms": self.gc_pause_ms,
+            "net_rx_bytes": self.net_rx_bytes,
+            "net_tx_bytes": self.net_tx_bytes,
+            "disk_read_bytes": self.disk_read_bytes,
+            "disk_write_bytes": self.disk_write_bytes,
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "SystemMetrics":
+        """Create from dictionary."""
+        return cls(
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            cpu_usage_percent=data["cpu_usage_percent"],
+            memory_usage_mb=data["memory_usage_mb"],
+            memory_usage_percent=data["memory_usage_percent"],
+            total_memory_mb=data["total_memory_mb"],
+            cpu_count=data["cpu_count"],
+            load_avg_1m=data.get("load_avg_1m"),
+            load_avg_5m=data.get("load_avg_5m"),
+            load_avg_15m=data.get("load_avg_15m"),
+            process_count=data.get("process_count"),
+            open_fds=data.get("open_fds"),
+            event_loop_lag_ms=data.get("event_loop_lag_ms"),
+            gc_collections=data.get("gc_collections"),
+            gc_pause_ms=data.get("gc_pause_ms"),
+            net_rx_bytes=data.get("net_rx_bytes"),
+            net_tx_bytes=data.get("net_tx_bytes"),
+            disk_read_bytes=data.get("disk_read_bytes"),
+            disk_write_bytes=data.get("disk_write_bytes"),
+        )
+
 
 @dataclass
 class QueryMetrics:
@@ -102,6 +199,9 @@ class QueryMetrics:
     duration_ms: float
     timestamp: datetime
     connection_id: Optional[str] = None
+    # Of the request, set by the middleware when the request is stored
+    method: Optional[str] = None
+    route: Optional[str] = None
 
     def to_dict(self) -> dict:
         """Convert to dictionary."""
@@ -111,4 +211,87 @@ class QueryMetrics:
             "duration_ms": self.duration_ms,
             "timestamp": self.timestamp.isoformat(),
             "connection_id": self.connection_id,
+            "method": self.method,
+            "route": self.route,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QueryMetrics":
+        """Create from dictionary."""
+        return cls(
+            request_id=data["request_id"],
+            query=data["query"],
+            duration_ms=data["duration_ms"],
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            connection_id=data.get("connection_id"),
+            method=data.get("method"),
+            route=data.get("route"),
+        )
+
+
+@dataclass
+class Span:
+    """A timed section of a request, such as a query or an outbound call."""
+
+    request_id: str
+    # Numbered from 1 within the request, in the order spans start
+    span_id: int
+    parent_id: Optional[int]
+    name: str
+    kind: str
+    # Offset from the start of the request
+    start_us: int
+    duration_us: int
+    detail: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Convert to dictionary."""
+        return {
+            "request_id": self.request_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_us": self.start_us,
+            "duration_us": self.duration_us,
+            "detail": self.detail,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Span":
+        """Create from dictionary."""
+        return cls(
+            request_id=data["request_id"],
+            span_id=data["span_id"],
+            parent_id=data.get("parent_id"),
+            name=data["name"],
+            kind=data["kind"],
+            start_us=data["start_us"],
+            duration_us=data["duration_us"],
+            detail=data.get("detail"),
+        )
+
+
+# A stack frame as (filename, function, first line of the function)
+Frame = Tuple[str, str, int]
+
+
+@dataclass
+class StackSample:
+    """Times one Python stack was seen by the stack sampler."""
+
+    # Request running when the stack was captured, if any
+    request_id: Optional[str]
+    # Outermost frame first
+    stack: Tuple[Frame, ...]
+    count: int
+    timestamp: datetime
+
+    def to_dict(self) -> dict:
+        """Convert to dictionary."""
+        return {
+            "request_id": self.request_id,
+            "stack": [list(frame) for frame in self.stack],
+            "count": self.count,
+            "timestamp": self.timestamp.isoformat(),
         }
@@ -0,0 +1,58 @@
+"""N+1 query detection.
+
+A request that runs the same statement fingerprint (see timeglass.sql) at
+least ``threshold`` times almost always does so in a loop over rows it
+loaded earlier, where one batched query would do. Detection runs as a
+request's queries are written, so findings are available as soon as the
+request is stored.
+
+The time wasted by a finding is its total time less one average
+execution: roughly what batching the loop into a single query would save.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# Executions of one fingerprint within a request that count as N+1
+DEFAULT_THRESHOLD = 5
+
+
+@dataclass
+class NPlusOne:
+    """One statement repeated within one request."""
+
+    request_id: str
+    fingerprint_id: int
+    count: int
+    total_ms: float
+
+    @property
+    def wasted_ms(self) -> float:
+        """Time beyond a single average execution."""
+        return self.total_ms * (self.count - 1) / self.count
+
+
+class NPlusOneDetector:
+    """Count executions per (request, fingerprint) and report repeats."""
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._executions: Dict[Tuple[str, int], List[float]] = defaultdict(
+            lambda: [0, 0.0]
+        )
+
+    def add(self, request_id: str, fingerprint_id: int, duration_ms: float):
+        """Count one execution."""
+        executions = self._executions[(request_id, fingerprint_id)]
+        executions[0] += 1
+        executions[1] += duration_ms
+
+    def findings(self) -> List[NPlusOne]:
+        """Statements executed at least ``threshold`` times in a request."""
+        return [
+            NPlusOne(request_id, fingerprint_id, int(count), total_ms)
+            for (request_id, fingerprint_id), (count, total_ms)
+            in self._executions.items()
+            if count >= self.threshold
+        ]
@@ -0,0 +1,246 @@
+"""Database query instrumentation.
+
+``TimeGlassMiddleware`` opens a query scope for each request: the request ID
+and an empty buffer are stored in context variables, which asyncio copies
+into every task the request starts. Instrumented drivers append a
+``QueryMetrics`` row to the buffer as each query finishes, and the
+middleware hands the whole buffer to the writer in one batch when the
+request ends. Queries run outside a request are not recorded. Each query
+is also recorded as a ``db`` span of the request (see timeglass.spans).
+
+Two drivers are supported, neither of which TimeGlass depends on:
+
+* SQLAlchemy: ``instrument_sqlalchemy(engine)`` listens to the engine's
+  cursor events. It accepts sync engines and ``AsyncEngine``.
+* asyncpg: ``instrument_asyncpg(conn_or_pool)`` returns a wrapper that times
+  ``execute``, ``executemany`` and the ``fetch*`` methods. Connections
+  acquired from a wrapped pool are wrapped too.
+"""
+
+import time
+from contextvars import ContextVar, Token
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from .models import QueryMetrics
+from .spans import record_span
+
+# Queries kept per request; later ones are counted but not stored
+MAX_QUERIES_PER_REQUEST = 1000
+
+current_request_id: ContextVar[Optional[str]] = ContextVar(
+    "timeglass_request_id", default=None
+)
+
+
+class QueryBuffer:
+    """Queries recorded while one request is being handled."""
+
+    def __init__(self, request_id: str, limit: int = MAX_QUERIES_PER_REQUEST):
+        self.request_id = request_id
+        self.limit = limit
+        self.queries: List[QueryMetrics] = []
+        self.dropped = 0
+
+    def add(
+        self,
+        query: str,
+        duration_ms: float,
+        timestamp: datetime,
+        connection_id: Optional[str] = None,
+    ):
+        if len(self.queries) >= self.limit:
+            self.dropped += 1
+            return
+        self.queries.append(QueryMetrics(
+            request_id=self.request_id,
+            query=query,
+            duration_ms=duration_ms,
+            timestamp=timestamp,
+            connection_id=connection_id,
+        ))
+
+
+_current_buffer: ContextVar[Optional[QueryBuffer]] = ContextVar(
+    "timeglass_query_buffer", default=None
+)
+
+
+def begin_request(request_id: str) -> Tuple[QueryBuffer, Tuple[Token, Token]]:
+    """Start recording queries for ``request_id`` in the current context.
+
+    Returns the buffer and a token to pass to ``end_request``.
+    """
+    buffer = QueryBuffer(request_id)
+    tokens = (
+        current_request_id.set(request_id),
+        _current_buffer.set(buffer),
+    )
+    return buffer, tokens
+
+
+def end_request(tokens: Tuple[Token, Token]):
+    """Stop recording queries and restore the previous context."""
+    request_token, buffer_token = tokens
+    _current_buffer.reset(buffer_token)
+    current_request_id.reset(request_token)
+
+
+def record_query(
+    query: str,
+    duration_ms: float,
+    timestamp: Optional[datetime] = None,
+    connection_id: Optional[str] = None,
+):
+    """Record a finished query against the current request, if any.
+
+    Use this to instrument drivers other than SQLAlchemy and asyncpg.
+    """
+    end_ns = time.perf_counter_ns()
+    record_span("query", "db", end_ns - int(duration_ms * 1e6), end_ns, query)
+    buffer = _current_buffer.get()
+    if buffer is None:
+        return
+    buffer.add(query, duration_ms, timestamp or datetime.now(), connection_id)
+
+
+def _connection_id(connection: Any) -> str:
+    return f"{id(connection):x}"
+
+
+def instrument_sqlalchemy(engine):
+    """Record every statement executed through a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    # AsyncEngine emits events through its sync counterpart
+    engine = getattr(engine, "sync_engine", engine)
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if _current_buffer.get() is not None:
+            conn.info.setdefault("timeglass_started", []).append(
+                (datetime.now(), time.perf_counter_ns())
+            )
+
+    def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        started = conn.info.get("timeglass_started")
+        if not started:
+            return
+        timestamp, start_ns = started.pop()
+        record_query(
+            statement,
+            (time.perf_counter_ns() - start_ns) / 1e6,
+            timestamp,
+            _connection_id(conn.connection),
+        )
+
+    def handle_error(exception_context):
+        # The statement failed, so after_cursor_execute will not run
+        conn = exception_context.connection
+        started = conn.info.get("timeglass_started") if conn else None
+        if started:
+            started.pop()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    return engine
+
+
+class InstrumentedConnection:
+    """Wrap an asyncpg connection, timing its query methods.
+
+    Every other attribute is passed through to the connection.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def _timed(self, method: str, query: str, *args, **kwargs):
+        if _current_buffer.get() is None:
+            return await getattr(self._connection, method)(
+                query, *args, **kwargs
+            )
+        timestamp = datetime.now()
+        start_ns = time.perf_counter_ns()
+        try:
+            return await getattr(self._connection, method)(
+                query, *args, **kwargs
+            )
+        finally:
+            record_query(
+                query,
+                (time.perf_counter_ns() - start_ns) / 1e6,
+                timestamp,
+                _connection_id(self._connection),
+            )
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._timed("execute", query, *args, **kwargs)
+
+    async def executemany(self, command: str, args, **kwargs):
+        return await self._timed("executemany", command, args, **kwargs)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self._timed("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self._timed("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self._timed("fetchval", query, *args, **kwargs)
+
+
+class _AcquireContext:
+    """``pool.acquire()`` result, usable with ``await`` or ``async with``."""
+
+    def __init__(self, pool: "InstrumentedPool", *args, **kwargs):
+        self._pool = pool
+        self._args = args
+        self._kwargs = kwargs
+        self._connection: Optional[InstrumentedConnection] = None
+
+    async def _acquire(self) -> InstrumentedConnection:
+        connection = await self._pool._pool.acquire(*self._args, **self._kwargs)
+        return InstrumentedConnection(connection)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def __aenter__(self) -> InstrumentedConnection:
+        self._connection = await self._acquire()
+        return self._connection
+
+    async def __aexit__(self, *exc_info):
+        await self._pool.release(self._connection)
+
+
+class InstrumentedPool(InstrumentedConnection):
+    """Wrap an asyncpg pool; acquired connections are instrumented too."""
+
+    def __init__(self, pool):
+        super().__init__(pool)
+        self._pool = pool
+
+    def acquire(self, *args, **kwargs) -> _AcquireContext:
+        return _AcquireContext(self, *args, **kwargs)
+
+    async def release(self, connection, *args, **kwargs):
+        if isinstance(connection, InstrumentedConnection):
+            connection = connection._connection
+        return await self._pool.release(connection, *args, **kwargs)
+
+
+def instrument_asyncpg(conn_or_pool):
+    """Wrap an asyncpg connection or pool so its queries are recorded."""
+    if isinstance(conn_or_pool, InstrumentedConnection):
+        return conn_or_pool
+    if hasattr(conn_or_pool, "acquire") and hasattr(conn_or_pool, "release"):
+        return InstrumentedPool(conn_or_pool)
+    return InstrumentedConnection(conn_or_pool)
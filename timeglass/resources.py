@@ -0,0 +1,85 @@
+"""Process resource readings for per-request attribution.
+
+The Rust engine reports host-wide CPU and memory, which says little about a
+single request when several workers share the host. These readings are
+about this process only: a snapshot is taken when a request starts and when
+it finishes, and the difference is attributed to the request.
+
+Deltas taken across an ``await`` also include any other work the event loop
+ran in between, so under concurrency they are an upper bound for the
+request; per-route averages are still what makes CPU-bound routes stand out.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # Peak rather than current RSS: kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+@dataclass
+class ResourceSnapshot:
+    """Process resource counters at one point in time."""
+
+    process_cpu_ns: int
+    thread_cpu_ns: int
+    rss_bytes: Optional[int]
+    # Bytes currently allocated by Python, when tracemalloc is tracing
+    traced_bytes: Optional[int]
+
+    @classmethod
+    def take(cls) -> "ResourceSnapshot":
+        """Read the current counters."""
+        return cls(
+            process_cpu_ns=time.process_time_ns(),
+            thread_cpu_ns=time.thread_time_ns(),
+            rss_bytes=rss_bytes(),
+            traced_bytes=(
+                tracemalloc.get_traced_memory()[0]
+                if tracemalloc.is_tracing() else None
+            ),
+        )
+
+    def usage_since(self, start: "ResourceSnapshot") -> dict:
+        """Resource usage between ``start`` and this snapshot.
+
+        Keys match the ``ProfilingMetrics`` fields they populate.
+        """
+        return {
+            "process_cpu_ms": (self.process_cpu_ns - start.process_cpu_ns) / 1e6,
+            "thread_cpu_ms": (self.thread_cpu_ns - start.thread_cpu_ns) / 1e6,
+            "rss_bytes": self.rss_bytes,
+            "rss_delta_bytes": (
+                self.rss_bytes - start.rss_bytes
+                if self.rss_bytes is not None and start.rss_bytes is not None
+                else None
+            ),
+            "alloc_delta_bytes": (
+                self.traced_bytes - start.traced_bytes
+                if self.traced_bytes is not None
+                and start.traced_bytes is not None
+                else None
+            ),
+        }
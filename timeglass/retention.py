@@ -0,0 +1,121 @@
+"""Retention, downsampling and compaction for the TimeGlass database."""
+
+import atexit
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from .storage import TimeGlassStorage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """How long each kind of data is kept.
+
+    Raw rows are kept for ``raw_hours``; after that only rollups remain.
+    ``rollup_hours`` maps a rollup granularity (seconds) to how long its
+    buckets are kept, None meaning forever. ``max_raw_rows`` additionally
+    caps the stored requests and ``max_size_mb`` the database, oldest raw
+    rows first (see TimeGlassStorage.trim_raw_metrics).
+    """
+
+    raw_hours: Optional[float] = 24.0
+    rollup_hours: Dict[int, Optional[float]] = field(
+        default_factory=lambda: {1: 6.0, 60: 24.0 * 30, 3600: None}
+    )
+    max_raw_rows: Optional[int] = None
+    max_size_mb: Optional[float] = None
+    batch_size: int = 1000
+    vacuum_pages: Optional[int] = 1000
+
+
+def apply_retention(
+    storage: TimeGlassStorage,
+    policy: RetentionPolicy,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    """Prune ``storage`` according to ``policy``; returns rows deleted."""
+    now = now or datetime.now()
+    deleted: Dict[str, int] = {}
+
+    if policy.raw_hours is not None:
+        deleted.update(storage.prune_raw_metrics(
+            now - timedelta(hours=policy.raw_hours), policy.batch_size
+        ))
+
+    if policy.max_raw_rows is not None or policy.max_size_mb is not None:
+        trimmed = storage.trim_raw_metrics(
+            max_rows=policy.max_raw_rows,
+            max_size_mb=policy.max_size_mb,
+            batch_size=policy.batch_size,
+        )
+        for table, count in trimmed.items():
+            deleted[table] = deleted.get(table, 0) + count
+
+    for granularity, hours in policy.rollup_hours.items():
+        if hours is not None:
+            deleted[f"rollups_{granularity}s"] = storage.prune_rollups(
+                granularity, now - timedelta(hours=hours), policy.batch_size
+            )
+
+    return deleted
+
+
+class RetentionJob:
+    """Periodically apply a retention policy on a background thread."""
+
+    def __init__(
+        self,
+        storage: TimeGlassStorage,
+        policy: RetentionPolicy,
+        interval: float = 300.0,
+    ):
+        self.storage = storage
+        self.policy = policy
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_deleted: Dict[str, int] = {}
+
+    def start(self):
+        """Start the retention thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="timeglass-retention", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the retention thread."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+        atexit.unregister(self.stop)
+
+    def run_once(self) -> Dict[str, int]:
+        """Prune and incrementally vacuum once."""
+        self.last_deleted = apply_retention(self.storage, self.policy)
+        if self.policy.vacuum_pages:
+            self.storage.incremental_vacuum(pages=self.policy.vacuum_pages)
+        self.runs += 1
+        return self.last_deleted
+
+    def _run(self):
+        """Retention thread main loop."""
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning("Failed to apply retention policy: %s", e)
+                self.errors += 1
@@ -0,0 +1,125 @@
+"""Route template resolution for aggregation keys.
+
+Raw paths such as ``/users/8123/orders/77`` make every per-path aggregate
+grow with the number of distinct ids. Requests are instead keyed on the
+route template they matched (``/users/{user_id}/orders/{order_id}``). Paths
+that match no route (404s, raw ASGI apps) go through ``normalize_path``,
+which replaces id-like segments with placeholders.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+_SEGMENT_PATTERNS = (
+    (re.compile(
+        r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+        r"[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+    ), "{uuid}"),
+    (re.compile(r"^-?\d+$"), "{id}"),
+    (re.compile(r"^[0-9a-fA-F]{16,}$"), "{hash}"),
+    # Long opaque tokens: slugs with digits, base64 ids and the like
+    (re.compile(r"^(?=.*\d)[A-Za-z0-9_\-.~]{20,}$"), "{token}"),
+)
+
+
+def normalize_path(path: str) -> str:
+    """Replace id-like path segments with placeholders."""
+    segments = path.split("/")
+    for i, segment in enumerate(segments):
+        if not segment:
+            continue
+        for pattern, placeholder in _SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segments[i] = placeholder
+                break
+    return "/".join(segments)
+
+
+def _match_template(scope) -> Optional[str]:
+    """Find the template of the first route in ``scope["app"]`` that matches."""
+    routes = getattr(scope.get("app"), "routes", None)
+    if not routes:
+        return None
+    try:
+        from starlette.routing import Match
+    except ImportError:
+        return None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path_format", None) or getattr(
+                route, "path", None
+            )
+    return None
+
+
+class RouteResolver:
+    """Resolve a request's route template, caching the slow paths.
+
+    FastAPI records the matched route in ``scope["route"]``, which costs an
+    attribute read. Otherwise the application's routes are matched, or the
+    path is normalized, and the result is cached per (method, path) in a
+    dict of at most ``max_size`` entries.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._cache: Dict[Tuple[Optional[str], str], str] = {}
+        self._early_cache: Dict[Tuple[Optional[str], str], str] = {}
+
+    def resolve(
+        self,
+        scope,
+        method: Optional[str],
+        path: Optional[str],
+        root_path: str = "",
+    ) -> Optional[str]:
+        """Return the route template for a finished request.
+
+        Mounted applications rewrite the scope while routing, so ``method``,
+        ``path`` and ``root_path`` are the values read before the
+        application ran. Anything a mount appended to the root path is
+        prefixed to the matched template.
+        """
+        if path is None:
+            return None
+
+        mount_prefix = scope.get("root_path", "")[len(root_path):]
+        route = scope.get("route")
+        template = getattr(route, "path_format", None)
+        if template is not None:
+            return mount_prefix + template
+
+        key = (method, path)
+        template = self._cache.get(key)
+        if template is None:
+            matched = _match_template(scope)
+            template = (
+                mount_prefix + matched if matched else normalize_path(path)
+            )
+            self._remember(self._cache, key, template)
+        return template
+
+    def resolve_early(
+        self, scope, method: Optional[str], path: Optional[str]
+    ) -> Optional[str]:
+        """Return the route template before the application has run.
+
+        Only the routes of ``scope["app"]`` are matched, so a request to a
+        mounted application resolves to the mount's own template.
+        """
+        if path is None:
+            return None
+
+        key = (method, path)
+        template = self._early_cache.get(key)
+        if template is None:
+            template = _match_template(scope) or normalize_path(path)
+            self._remember(self._early_cache, key, template)
+        return template
+
+    def _remember(self, cache: dict, key: tuple, template: str):
+        if len(cache) >= self.max_size:
+            # Evict the oldest entry; dicts keep insertion order
+            del cache[next(iter(cache))]
+        cache[key] = template
@@ -0,0 +1,165 @@
+"""Request sampling strategies for TimeGlassMiddleware.
+
+A sampler looks at a finished request and returns the weight to store it
+with, or 0 to drop it. The weight is the inverse of the probability the
+request had of being kept, so weighted sums over the stored rows are
+unbiased estimates of the totals over all requests.
+
+Samplers that do not depend on the outcome decide in ``sample_request``,
+before the request runs, so the middleware can skip instrumenting requests
+it will drop. Samplers that return None there, such as ``TailSampler``,
+decide in ``sample`` once the request has finished and its status and
+duration are known.
+
+Samplers are called from the event loop thread and are not thread-safe.
+"""
+
+import random
+import time
+from typing import Dict, Hashable, Optional
+
+from .models import ProfilingMetrics
+
+
+class Sampler:
+    """Keep every request with weight 1."""
+
+    # Whether sample_request needs the route; resolving it before the
+    # application runs costs a route match per new path
+    uses_route = False
+
+    def sample_request(
+        self, method: Optional[str], route: Optional[str]
+    ) -> Optional[float]:
+        """Return the sample weight decided before the request runs.
+
+        None defers the decision to ``sample``. ``route`` is only resolved
+        for samplers that set ``uses_route``.
+        """
+        return None
+
+    def sample(self, metrics: ProfilingMetrics) -> float:
+        """Return the sample weight to keep ``metrics`` with, or 0 to drop."""
+        return 1.0
+
+
+class RateSampler(Sampler):
+    """Keep each request independently with a fixed probability."""
+
+    def __init__(self, rate: float, rng: Optional[random.Random] = None):
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be in (0, 1]")
+        self.rate = rate
+        self._random = (rng or random.Random()).random
+
+    def sample_request(
+        self, method: Optional[str], route: Optional[str]
+    ) -> Optional[float]:
+        return 1.0 / self.rate if self._random() < self.rate else 0.0
+
+    def sample(self, metrics: ProfilingMetrics) -> float:
+        return self.sample_request(metrics.method, None)
+
+
+class _RateBudget:
+    """Keep probability that holds an arrival rate to a per-second budget.
+
+    The probability for the current one-second window is derived from the
+    arrival rate seen in the previous window, so every request in a window is
+    kept with the same, known probability.
+    """
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.probability = 1.0
+        self._window_start = time.monotonic()
+        self._arrivals = 0
+
+    def next_probability(self) -> float:
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            rate = self._arrivals / elapsed
+            self.probability = min(1.0, self.per_second / rate) if rate else 1.0
+            self._window_start = now
+            self._arrivals = 0
+        self._arrivals += 1
+        return self.probability
+
+
+class AdaptiveSampler(Sampler):
+    """Adapt the keep probability to stay near a records/second budget."""
+
+    def __init__(
+        self, max_per_second: float, rng: Optional[random.Random] = None
+    ):
+        self._budget = _RateBudget(max_per_second)
+        self._random = (rng or random.Random()).random
+
+    def sample_request(
+        self, method: Optional[str], route: Optional[str]
+    ) -> Optional[float]:
+        probability = self._budget.next_probability()
+        return 1.0 / probability if self._random() < probability else 0.0
+
+    def sample(self, metrics: ProfilingMetrics) -> float:
+        return self.sample_request(metrics.method, None)
+
+
+class RouteRateLimitSampler(Sampler):
+    """Limit kept records per (method, route) to a per-second budget.
+
+    ``limits`` overrides ``default_per_second`` for individual routes, keyed
+    by ``(method, route)`` where route is the route template, or the raw path
+    when no template is known.
+    """
+
+    def __init__(
+        self,
+        default_per_second: float,
+        limits: Optional[Dict[Hashable, float]] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.default_per_second = default_per_second
+        self.limits = dict(limits or {})
+        self._budgets: Dict[Hashable, _RateBudget] = {}
+        self._random = (rng or random.Random()).random
+
+    uses_route = True
+
+    def sample_request(
+        self, method: Optional[str], route: Optional[str]
+    ) -> Optional[float]:
+        key = (method, route)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = _RateBudget(
+                self.limits.get(key, self.default_per_second)
+            )
+        probability = budget.next_probability()
+        return 1.0 / probability if self._random() < probability else 0.0
+
+    def sample(self, metrics: ProfilingMetrics) -> float:
+        return self.sample_request(metrics.method, metrics.route or metrics.path)
+
+
+class TailSampler(Sampler):
+    """Always keep errors and slow requests; sample the rest with ``base``.
+
+    Errors (5xx) and requests slower than ``slow_ms`` are kept with
+    probability 1, so their weight is 1 and the estimate stays unbiased.
+    """
+
+    def __init__(
+        self, base: Sampler, slow_ms: float = 1000.0, keep_errors: bool = True
+    ):
+        self.base = base
+        self.slow_ms = slow_ms
+        self.keep_errors = keep_errors
+
+    def sample(self, metrics: ProfilingMetrics) -> float:
+        if self.keep_errors and (metrics.status_code or 0) >= 500:
+            return 1.0
+        if metrics.duration_ms is not None and metrics.duration_ms >= self.slow_ms:
+            return 1.0
+        return self.base.sample(metrics)
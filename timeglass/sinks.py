@@ -0,0 +1,162 @@
+"""Destinations for profiling records.
+
+The background writer hands each batch of records to a sink. Sinks run on
+the writer thread, never on the event loop, so they may block on I/O.
+"""
+
+import abc
+import json
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from .models import ProfilingMetrics, QueryMetrics, Span
+from .storage import TimeGlassStorage
+
+
+class Sink(abc.ABC):
+    """Base class: receives batches of profiling records."""
+
+    @abc.abstractmethod
+    def write(self, batch: List[ProfilingMetrics]):
+        """Persist or forward one batch."""
+
+    def write_queries(self, batch: List[QueryMetrics]):
+        """Persist or forward database query rows; ignored by default."""
+
+    def write_spans(self, batch: List[Span]):
+        """Persist or forward request timeline spans; ignored by default."""
+
+    def close(self):
+        """Release any resources held by the sink."""
+
+
+class NullSink(Sink):
+    """Discard every record."""
+
+    def write(self, batch: List[ProfilingMetrics]):
+        pass
+
+
+class StorageSink(Sink):
+    """Write records to a TimeGlassStorage database."""
+
+    def __init__(self, storage: TimeGlassStorage):
+        self.storage = storage
+
+    def write(self, batch: List[ProfilingMetrics]):
+        self.storage.save_many_profiling_metrics(batch)
+
+    def write_queries(self, batch: List[QueryMetrics]):
+        self.storage.save_many_query_metrics(batch)
+
+    def write_spans(self, batch: List[Span]):
+        self.storage.save_many_spans(batch)
+
+
+class NDJSONFileSink(Sink):
+    """Append records as newline-delimited JSON, rotating by size.
+
+    When the file would grow past ``max_bytes`` it is renamed to
+    ``path.1`` (shifting older files up to ``backup_count``) and a new file
+    is started, like ``logging.handlers.RotatingFileHandler``.
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, batch: List[ProfilingMetrics]):
+        data = "".join(
+            json.dumps(m.to_dict(), separators=(",", ":")) + "\n" for m in batch
+        )
+        with self._lock:
+            if self.max_bytes and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+
+    def _rotate(self):
+        """Shift ``path.N`` files up by one and reopen ``path``."""
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class LoggingSink(Sink):
+    """Emit one structured log record per request.
+
+    The message is a short summary line; the full record is attached as the
+    ``timeglass`` attribute for JSON formatters and filters.
+    """
+
+    def __init__(
+        self, logger: Optional[logging.Logger] = None, level: int = logging.INFO
+    ):
+        self.logger = logger or logging.getLogger("timeglass.requests")
+        self.level = level
+
+    def write(self, batch: List[ProfilingMetrics]):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        for m in batch:
+            self.logger.log(
+                self.level,
+                "%s %s %s %.3fms",
+                m.method or "-",
+                m.route or m.path or "-",
+                m.status_code or "-",
+                m.duration_ms or 0.0,
+                extra={"timeglass": m.to_dict()},
+            )
+
+
+class MultiSink(Sink):
+    """Send every batch to several sinks.
+
+    A failing sink does not stop the others; the first error is re-raised
+    once all sinks have been tried.
+    """
+
+    def __init__(self, *sinks: Sink):
+        self.sinks = sinks
+
+    def write(self, batch: List[ProfilingMetrics]):
+        self._each("write", batch)
+
+    def write_queries(self, batch: List[QueryMetrics]):
+        self._each("write_queries", batch)
+
+    def write_spans(self, batch: List[Span]):
+        self._each("write_spans", batch)
+
+    def _each(self, method: str, batch: list):
+        error = None
+        for sink in self.sinks:
+            try:
+                getattr(sink, method)(batch)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,43 @@
+"""Log-bucketed latency histograms for percentile estimation.
+
+Durations are mapped to buckets whose boundaries grow geometrically, as in
+DDSketch: any quantile read back from the bucket counts is within
+``RELATIVE_ACCURACY`` of the true value, and the number of buckets needed to
+cover 1 microsecond to several hours is about a thousand. Bucket counts are
+plain integers (or weights), so histograms merge by adding counts, which is
+what lets storage keep them up to date incrementally in SQL.
+"""
+
+import math
+from typing import Mapping, Optional
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+# Values below this share the lowest bucket (1 microsecond, in ms)
+MIN_VALUE_MS = 0.001
+
+
+def bucket_index(value_ms: float) -> int:
+    """Return the histogram bucket for a duration in milliseconds."""
+    return math.ceil(math.log(max(value_ms, MIN_VALUE_MS)) / _LOG_GAMMA)
+
+
+def bucket_value(index: int) -> float:
+    """Return the representative duration (ms) of a bucket."""
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def quantile(counts: Mapping[int, float], q: float) -> Optional[float]:
+    """Estimate the ``q`` quantile (0..1) from bucket counts."""
+    total = sum(counts.values())
+    if total <= 0:
+        return None
+    rank = q * (total - 1)
+    cumulative = 0.0
+    for index in sorted(counts):
+        cumulative += counts[index]
+        if cumulative > rank:
+            return bucket_value(index)
+    return bucket_value(max(counts))
@@ -0,0 +1,268 @@
+"""Timeline spans within a request.
+
+A span times one section of a request: application code wrapped with
+``span``, a database query, an outbound HTTP call or FastAPI dependency
+resolution. Like the query buffer (see timeglass.queries), the middleware
+stores a per-request span buffer in a context variable, so spans opened
+in tasks the request starts are recorded against it, nested under the
+span that was open when the task was created. The buffer is written in
+one batch when the request ends.
+
+Spans are timed with ``time.perf_counter_ns`` and stored as microsecond
+offsets from the start of the request. Outside a request nothing is
+recorded and ``span`` costs one context variable lookup.
+
+Automatic spans:
+
+* database queries, from the drivers instrumented in timeglass.queries;
+* outbound HTTP, through ``SpanTransport`` wrapping an httpx transport;
+* dependency resolution, once ``instrument_fastapi`` has run (the
+  middleware calls it).
+"""
+
+import functools
+import inspect
+import time
+from contextvars import ContextVar, Token
+from typing import Callable, List, Optional, Tuple
+
+from .models import Span
+
+# Spans kept per request; later ones are counted but not stored
+MAX_SPANS_PER_REQUEST = 1000
+
+# Longest span detail kept, in characters
+MAX_DETAIL_LENGTH = 500
+
+
+class SpanBuffer:
+    """Spans recorded while one request is being handled."""
+
+    def __init__(
+        self,
+        request_id: str,
+        start_ns: int,
+        limit: int = MAX_SPANS_PER_REQUEST,
+    ):
+        self.request_id = request_id
+        self.start_ns = start_ns
+        self.limit = limit
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._last_id = 0
+
+    def next_id(self) -> int:
+        self._last_id += 1
+        return self._last_id
+
+    def add(
+        self,
+        span_id: int,
+        parent_id: Optional[int],
+        name: str,
+        kind: str,
+        start_ns: int,
+        end_ns: int,
+        detail: Optional[str] = None,
+    ):
+        if len(self.spans) >= self.limit:
+            self.dropped += 1
+            return
+        self.spans.append(Span(
+            request_id=self.request_id,
+            span_id=span_id,
+            parent_id=parent_id,
+            name=name,
+            kind=kind,
+            start_us=(start_ns - self.start_ns) // 1000,
+            duration_us=(end_ns - start_ns) // 1000,
+            detail=detail[:MAX_DETAIL_LENGTH] if detail else None,
+        ))
+
+
+_current_buffer: ContextVar[Optional[SpanBuffer]] = ContextVar(
+    "timeglass_span_buffer", default=None
+)
+_current_span: ContextVar[Optional[int]] = ContextVar(
+    "timeglass_span", default=None
+)
+
+
+def begin_request(
+    request_id: str, start_ns: int
+) -> Tuple[SpanBuffer, Tuple[Token, Token]]:
+    """Start recording spans for ``request_id`` in the current context.
+
+    ``start_ns`` is the request's ``perf_counter_ns`` start. Returns the
+    buffer and a token to pass to ``end_request``.
+    """
+    buffer = SpanBuffer(request_id, start_ns)
+    tokens = (_current_buffer.set(buffer), _current_span.set(None))
+    return buffer, tokens
+
+
+def end_request(tokens: Tuple[Token, Token]):
+    """Stop recording spans and restore the previous context."""
+    buffer_token, span_token = tokens
+    _current_span.reset(span_token)
+    _current_buffer.reset(buffer_token)
+
+
+def record_span(
+    name: str,
+    kind: str,
+    start_ns: int,
+    end_ns: int,
+    detail: Optional[str] = None,
+):
+    """Record an operation that has already finished, if in a request."""
+    buffer = _current_buffer.get()
+    if buffer is None:
+        return
+    buffer.add(
+        buffer.next_id(), _current_span.get(), name, kind, start_ns, end_ns,
+        detail,
+    )
+
+
+class span:
+    """Time a block or function as a span of the current request.
+
+    Use as a context manager, sync or async::
+
+        with span("render"):
+            ...
+
+    or as a decorator on sync or async functions::
+
+        @span("load_user", kind="service")
+        async def load_user(user_id): ...
+
+    Spans opened inside another span are nested under it. One instance
+    times one block at a time; the decorator opens a new one per call.
+    """
+
+    def __init__(
+        self, name: str, kind: str = "custom", detail: Optional[str] = None
+    ):
+        self.name = name
+        self.kind = kind
+        self.detail = detail
+        self._buffer: Optional[SpanBuffer] = None
+
+    def __enter__(self) -> "span":
+        self._buffer = _current_buffer.get()
+        if self._buffer is not None:
+            self._id = self._buffer.next_id()
+            self._parent_id = _current_span.get()
+            self._token = _current_span.set(self._id)
+            self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._buffer is None:
+            return
+        end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        self._buffer.add(
+            self._id, self._parent_id, self.name, self.kind,
+            self._start_ns, end_ns, self.detail,
+        )
+        self._buffer = None
+
+    async def __aenter__(self) -> "span":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+    def __call__(self, func: Callable) -> Callable:
+        name, kind, detail = self.name, self.kind, self.detail
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind, detail):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind, detail):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class SpanTransport:
+    """Wrap an httpx transport so each outbound request becomes a span.
+
+    ``httpx.AsyncClient(transport=SpanTransport(httpx.AsyncHTTPTransport()))``.
+    The span covers sending the request and receiving the response
+    headers; its detail is the URL without the query string.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+    @staticmethod
+    def _span(request) -> span:
+        url = request.url
+        return span(
+            f"{request.method} {url.host}",
+            "http",
+            f"{url.scheme}://{url.host}{url.path}",
+        )
+
+    def handle_request(self, request):
+        with self._span(request):
+            return self._transport.handle_request(request)
+
+    async def handle_async_request(self, request):
+        with self._span(request):
+            return await self._transport.handle_async_request(request)
+
+    def __enter__(self):
+        self._transport.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._transport.__exit__(*exc_info)
+
+    async def __aenter__(self):
+        await self._transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._transport.__aexit__(*exc_info)
+
+
+def instrument_fastapi() -> bool:
+    """Record FastAPI dependency resolution as a span of each request.
+
+    Patches ``fastapi.routing.solve_dependencies``; safe to call more than
+    once. Returns False if FastAPI is not installed.
+    """
+    try:
+        from fastapi import routing
+    except ImportError:
+        return False
+
+    solve = routing.solve_dependencies
+    if getattr(solve, "_timeglass", False):
+        return True
+
+    @functools.wraps(solve)
+    async def solve_dependencies(*args, **kwargs):
+        if _current_buffer.get() is None:
+            return await solve(*args, **kwargs)
+        dependant = kwargs.get("dependant")
+        call = getattr(dependant, "call", None)
+        with span("dependencies", "dependency", getattr(call, "__name__", None)):
+            return await solve(*args, **kwargs)
+
+    solve_dependencies._timeglass = True
+    routing.solve_dependencies = solve_dependencies
+    return True
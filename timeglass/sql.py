@@ -0,0 +1,54 @@
+"""SQL statement fingerprints.
+
+Executions of the same statement differ only in their literals and bind
+parameters, so ``normalize`` reduces a query to a fingerprint text in which
+every literal and placeholder becomes ``?``, ``IN`` lists and multi-row
+``VALUES`` lists collapse to ``(...)``, comments are dropped and whitespace
+is collapsed. Storage keeps one row per fingerprint with running
+aggregates, and query rows refer to it by ID.
+
+Identifiers and keywords are left as written; queries that differ only in
+keyword case get different fingerprints, which is rare for generated SQL.
+"""
+
+import re
+
+_TOKEN = re.compile(
+    r"""
+      (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[EeNnXxBb]?'(?:[^'\\]|''|\\.)*')
+    | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$)
+    | (?P<identifier>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<param>\$\d+|\?|%s|%\(\w+\)s|(?<![:\w]):\w+)
+    | (?P<number>(?<![\w.$])(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+))
+    | (?P<space>\s+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_PLACEHOLDER_LIST = r"\(\s*\?(?:\s*,\s*\?)*\s*\)"
+
+_IN_LIST = re.compile(rf"\b(IN)\s*{_PLACEHOLDER_LIST}", re.IGNORECASE)
+
+_VALUES_LIST = re.compile(
+    rf"\b(VALUES)\s*{_PLACEHOLDER_LIST}(?:\s*,\s*{_PLACEHOLDER_LIST})*",
+    re.IGNORECASE,
+)
+
+
+def _replace(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind in ("comment", "space"):
+        return " "
+    if kind == "identifier":
+        return match.group()
+    return "?"
+
+
+def normalize(query: str) -> str:
+    """Return the fingerprint text of a SQL statement."""
+    text = _TOKEN.sub(_replace, query)
+    text = " ".join(text.split())
+    text = _IN_LIST.sub(r"\1 (...)", text)
+    text = _VALUES_LIST.sub(r"\1 (...)", text)
+    return text.rstrip("; ")
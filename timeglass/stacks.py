@@ -0,0 +1,193 @@
+"""Statistical stack sampling for flame graphs.
+
+``StackSampler`` wakes ``hz`` times a second on a daemon thread, reads the
+Python stack of the event-loop thread from ``sys._current_frames()`` and
+counts identical stacks. Counts are written to storage every
+``flush_interval`` seconds as ``StackSample`` rows, which storage keeps as
+references into interned frame and stack tables.
+
+Samples are tagged with the request being handled: the middleware
+registers the frame of each request's ``__call__`` with ``track_request``,
+and the sampler looks for a registered frame while walking the stack.
+Stacks captured while the loop is waiting for I/O are not recorded.
+
+Overhead is bounded by ``max_overhead``, the fraction of wall time the
+sampler may spend holding the GIL: when taking a sample costs more than
+that share of the interval, the interval is stretched to match.
+"""
+
+import atexit
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from types import CodeType, FrameType
+from typing import Dict, Optional
+
+from .logs import log_limited
+from .models import Frame, StackSample
+from .storage import TimeGlassStorage
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames kept per stack
+MAX_DEPTH = 128
+
+# Files whose frames at the top of the stack mean the loop is idle
+_IDLE_FILES = ("selectors.py",)
+
+# id() of each tracked request frame -> request ID
+_request_frames: Dict[int, str] = {}
+
+
+def track_request(frame: FrameType, request_id: str):
+    """Tag samples taken under ``frame`` with ``request_id``."""
+    _request_frames[id(frame)] = request_id
+
+
+def untrack_request(frame: FrameType):
+    """Stop tagging samples under ``frame``."""
+    _request_frames.pop(id(frame), None)
+
+
+class StackSampler:
+    """Sample the stack of one thread into ``stack_samples``."""
+
+    def __init__(
+        self,
+        storage: TimeGlassStorage,
+        hz: float = 100.0,
+        flush_interval: float = 10.0,
+        max_overhead: float = 0.02,
+    ):
+        self.storage = storage
+        self.interval = 1.0 / hz
+        self.flush_interval = flush_interval
+        self.max_overhead = max_overhead
+        self.thread_id: Optional[int] = None
+        self._frames: Dict[CodeType, Frame] = {}
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.samples = 0
+        self.busy_seconds = 0.0
+        self.errors = 0
+        self._started_at: Optional[float] = None
+
+    def watch_thread(self, thread_id: Optional[int] = None):
+        """Sample ``thread_id``, by default the calling thread."""
+        self.thread_id = thread_id or threading.get_ident()
+
+    def start(self):
+        """Start the sampler thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="timeglass-stacks", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the sampler thread and write pending samples."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+        atexit.unregister(self.stop)
+        self.flush()
+
+    def overhead(self) -> float:
+        """Share of wall time spent sampling since the sampler started."""
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        return self.busy_seconds / elapsed if elapsed > 0 else 0.0
+
+    def next_delay(self, cost: float) -> float:
+        """Seconds to wait after a sample that took ``cost`` seconds.
+
+        The interval is stretched when needed so that sampling takes at
+        most ``max_overhead`` of wall time.
+        """
+        return max(self.interval, cost / self.max_overhead) - cost
+
+    def sample(self):
+        """Capture the watched thread's stack once."""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        if frame.f_code.co_filename.endswith(_IDLE_FILES):
+            return
+        stack = []
+        request_id = None
+        while frame is not None and len(stack) < MAX_DEPTH:
+            if request_id is None:
+                request_id = _request_frames.get(id(frame))
+            stack.append(self._frame(frame.f_code))
+            frame = frame.f_back
+        # The request frame may lie past MAX_DEPTH
+        while frame is not None and request_id is None:
+            request_id = _request_frames.get(id(frame))
+            frame = frame.f_back
+        stack.reverse()
+        with self._lock:
+            self._counts[(request_id, tuple(stack))] += 1
+
+    def _frame(self, code: CodeType) -> Frame:
+        """Intern a code object's frame key."""
+        frame = self._frames.get(code)
+        if frame is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            frame = (code.co_filename, name, code.co_firstlineno)
+            self._frames[code] = frame
+        return frame
+
+    def flush(self):
+        """Write the stacks counted since the last flush."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+        now = datetime.now()
+        try:
+            self.storage.save_stack_samples([
+                StackSample(request_id, stack, count, now)
+                for (request_id, stack), count in counts.items()
+            ])
+        except Exception as e:
+            self.errors += 1
+            log_limited(
+                logger, logging.WARNING, "stacks-write-failed",
+                "Failed to write stack samples: %s", e,
+            )
+
+    def _run(self):
+        """Sampler thread main loop."""
+        next_flush = time.monotonic() + self.flush_interval
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            started = time.perf_counter()
+            if self.thread_id is not None:
+                try:
+                    self.sample()
+                except Exception as e:
+                    self.errors += 1
+                    log_limited(
+                        logger, logging.WARNING, "stacks-sample-failed",
+                        "Failed to sample stack: %s", e,
+                    )
+            cost = time.perf_counter() - started
+            self.samples += 1
+            self.busy_seconds += cost
+            delay = self.next_delay(cost)
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
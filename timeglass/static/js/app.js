@@ -14,7 +14,8 @@ const Utils = {
      * Format duration in milliseconds
      */
     formatDuration: function(ms) {
-        if (!ms) return 'N/A';
+        if (ms === null || ms === undefined) return 'N/A';
+        if (ms < 1) return `${Math.round(ms * 1000)}µs`;
         if (ms < 1000) return `${ms.toFixed(2)}ms`;
         return `${(ms / 1000).toFixed(2)}s`;
     },
@@ -151,6 +152,12 @@ const API = {
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
+            if (options.paged) {
+                return {
+                    data: await response.json(),
+                    nextCursor: response.headers.get('X-Next-Cursor')
+                };
+            }
             return await response.json();
         } catch (error) {
             console.error(`API Error (${endpoint}):`, error);
@@ -164,12 +171,12 @@ const API = {
 
     async getRequests(params = {}) {
         const queryString = new URLSearchParams(params).toString();
-        return this.request(`/api/requests?${queryString}`);
+        return this.request(`/api/requests?${queryString}`, { paged: true });
     },
 
     async getSystemMetrics(params = {}) {
         const queryString = new URLSearchParams(params).toString();
-        return this.request(`/api/system-metrics?${queryString}`);
+        return this.request(`/api/system-metrics?${queryString}`, { paged: true });
     }
 };
 
@@ -4,7 +4,7 @@
 
 class Dashboard {
     constructor() {
-        this.currentOffset = 0;
+        this.nextCursor = null;
         this.limit = 50;
         this.filters = {};
 
@@ -53,6 +53,14 @@ class Dashboard {
                 <h3 class="text-lg font-semibold text-gray-800">Avg Duration</h3>
                 <p class="text-2xl font-bold text-green-600">${Utils.formatDuration(stats.avg_duration_ms)}</p>
             </div>
+            <div class="bg-white rounded-lg shadow p-6">
+                <h3 class="text-lg font-semibold text-gray-800">p90 Latency</h3>
+                <p class="text-2xl font-bold text-green-600">${Utils.formatDuration(stats.p90_duration_ms)}</p>
+            </div>
+            <div class="bg-white rounded-lg shadow p-6">
+                <h3 class="text-lg font-semibold text-gray-800">p99 Latency</h3>
+                <p class="text-2xl font-bold text-green-600">${Utils.formatDuration(stats.p99_duration_ms)}</p>
+            </div>
             <div class="bg-white rounded-lg shadow p-6">
                 <h3 class="text-lg font-semibold text-gray-800">Avg CPU</h3>
                 <p class="text-2xl font-bold text-yellow-600">${Utils.formatPercent(stats.avg_cpu_percent)}</p>
@@ -66,29 +74,28 @@ class Dashboard {
 
     async loadRequests(reset = true) {
         if (reset) {
-            this.currentOffset = 0;
+            this.nextCursor = null;
         }
 
         try {
             const params = {
                 limit: this.limit,
-                offset: this.currentOffset,
                 ...this.filters
             };
+            if (this.nextCursor) {
+                params.cursor = this.nextCursor;
+            }
 
             const response = await API.getRequests(params);
             const requests = response.data || response; // Handle different response formats
+            this.nextCursor = response.nextCursor || null;
 
             if (reset) {
                 this.clearRequestsTable();
             }
 
             this.renderRequests(requests);
-            this.updateLoadMoreButton(requests.length);
-
-            if (!reset) {
-                this.currentOffset += requests.length;
-            }
+            this.updateLoadMoreButton();
 
         } catch (error) {
             console.error('Error loading requests:', error);
@@ -145,9 +152,9 @@ class Dashboard {
         });
     }
 
-    updateLoadMoreButton(requestsCount) {
+    updateLoadMoreButton() {
         if (this.loadMoreBtn) {
-            if (requestsCount === this.limit) {
+            if (this.nextCursor) {
                 this.loadMoreBtn.classList.remove('hidden');
             } else {
                 this.loadMoreBtn.classList.add('hidden');
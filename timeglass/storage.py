@@ -1,9 +1,275 @@
 """SQLite storage layer for TimeGlass profiling data."""
 
+import base64
+import os
 import sqlite3
-from typing import List, Optional
-from datetime import datetime
-from .models import ProfilingMetrics, SystemMetrics, QueryMetrics
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+)
+from datetime import datetime, timedelta
+from .models import (
+    ProfilingMetrics, SystemMetrics, QueryMetrics, Span, StackSample
+)
+from .nplusone import DEFAULT_THRESHOLD, NPlusOne, NPlusOneDetector
+from .sketch import bucket_index, quantile
+from .sql import normalize as normalize_sql
+
+# Rows written per transaction by the save_many_* methods
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _prefix_bounds(prefix: str) -> Tuple[str, Optional[str]]:
+    """``[low, high)`` bounds of the strings starting with ``prefix``.
+
+    Comparing against a range, unlike LIKE, can use an index on the column.
+    High is None when no string sorts after every match.
+    """
+    stripped = prefix.rstrip(chr(0x10FFFF))
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so ``value`` matches literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Percentiles reported by get_stats_summary, as (label, quantile)
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+
+# N+1 statements listed by get_stats_summary, most time wasted first
+MAX_N_PLUS_ONE_ROUTES = 20
+
+# Interned stack frame and stack IDs cached in memory before the cache is
+# dropped and rebuilt from the database
+MAX_INTERNED_STACK_IDS = 100000
+
+# Rollup bucket widths in seconds: 1s, 1m and 1h
+ROLLUP_GRANULARITIES = (1, 60, 3600)
+
+# get_stats_summary picks the finest granularity that covers the requested
+# window in at most this many buckets
+MAX_ROLLUP_BUCKETS = 1500
+
+_UPSERT_ROLLUP_SQL = """
+    INSERT INTO rollups (
+        granularity, bucket_start, method, route, status_class,
+        count, sum_ms, min_ms, max_ms,
+        sum_cpu_percent, cpu_samples, sum_memory_percent, memory_samples,
+        sum_process_cpu_ms, process_cpu_samples
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket_start, method, route, status_class)
+    DO UPDATE SET
+        count = count + excluded.count,
+        sum_ms = sum_ms + excluded.sum_ms,
+        min_ms = MIN(min_ms, excluded.min_ms),
+        max_ms = MAX(max_ms, excluded.max_ms),
+        sum_cpu_percent = sum_cpu_percent + excluded.sum_cpu_percent,
+        cpu_samples = cpu_samples + excluded.cpu_samples,
+        sum_memory_percent = sum_memory_percent + excluded.sum_memory_percent,
+        memory_samples = memory_samples + excluded.memory_samples,
+        sum_process_cpu_ms = sum_process_cpu_ms + excluded.sum_process_cpu_ms,
+        process_cpu_samples = process_cpu_samples + excluded.process_cpu_samples
+"""
+
+_UPSERT_QUERY_FINGERPRINT_SQL = """
+    INSERT INTO query_fingerprints (
+        fingerprint, count, total_ms, min_ms, max_ms, first_seen, last_seen
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (fingerprint)
+    DO UPDATE SET
+        count = count + excluded.count,
+        total_ms = total_ms + excluded.total_ms,
+        min_ms = MIN(min_ms, excluded.min_ms),
+        max_ms = MAX(max_ms, excluded.max_ms),
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+"""
+
+# Host parameters per IN (...) lookup, under the 999 limit of older SQLite
+_MAX_LOOKUP_PARAMS = 500
+
+_UPSERT_QUERY_HISTOGRAM_SQL = """
+    INSERT INTO query_histogram (fingerprint_id, bucket, count)
+    VALUES (?, ?, ?)
+    ON CONFLICT (fingerprint_id, bucket)
+    DO UPDATE SET count = count + excluded.count
+"""
+
+_INSERT_N_PLUS_ONE_SQL = """
+    INSERT INTO n_plus_one (
+        request_id, fingerprint_id, method, route, count, total_ms,
+        wasted_ms, timestamp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPSERT_N_PLUS_ONE_ROUTE_SQL = """
+    INSERT INTO n_plus_one_routes (
+        method, route, fingerprint_id, requests, queries, wasted_ms,
+        first_seen, last_seen, last_request_id
+    ) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT (method, route, fingerprint_id)
+    DO UPDATE SET
+        requests = requests + 1,
+        queries = queries + excluded.queries,
+        wasted_ms = wasted_ms + excluded.wasted_ms,
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen),
+        last_request_id = CASE
+            WHEN excluded.last_seen >= last_seen
+            THEN excluded.last_request_id ELSE last_request_id
+        END
+"""
+
+_UPSERT_ERROR_SQL = """
+    INSERT INTO errors (
+        fingerprint, method, route, error_type, message, count,
+        first_seen, last_seen, last_request_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (fingerprint, method, route)
+    DO UPDATE SET
+        count = count + excluded.count,
+        message = excluded.message,
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen),
+        last_request_id = excluded.last_request_id
+"""
+
+_UPSERT_ROLLUP_HISTOGRAM_SQL = """
+    INSERT INTO rollup_histograms (
+        granularity, bucket_start, method, route, status_class, bucket, count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket_start, method, route, status_class, bucket)
+    DO UPDATE SET count = count + excluded.count
+"""
+
+
+def _status_class(status_code: Optional[int]) -> str:
+    """Rollup key for a status code: '2xx', '5xx', ... or '' if unknown."""
+    return f"{status_code // 100}xx" if status_code else ""
+
+
+def _epoch_seconds(timestamp: str) -> int:
+    """Unix seconds for a stored ISO timestamp (used from SQL)."""
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+def _pick_granularity(window_seconds: Optional[int]) -> int:
+    """Finest rollup granularity covering the window in few enough buckets."""
+    if window_seconds is None:
+        return ROLLUP_GRANULARITIES[-1]
+    for granularity in ROLLUP_GRANULARITIES:
+        if window_seconds / granularity <= MAX_ROLLUP_BUCKETS:
+            return granularity
+    return ROLLUP_GRANULARITIES[-1]
+
+
+def _percentiles(counts: Dict[int, float]) -> dict:
+    """Latency percentiles from histogram bucket counts, 0 when empty."""
+    return {
+        f"{label}_duration_ms": quantile(counts, q) or 0
+        for label, q in PERCENTILES
+    }
+
+
+def encode_cursor(sort_key: str, row_id: int) -> str:
+    """Encode a ``(sort_key, id)`` position as an opaque page cursor."""
+    raw = f"{sort_key}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Decode a page cursor produced by ``encode_cursor``."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_key, row_id = (
+            base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        )
+        return sort_key, int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+class ConnectionManager:
+    """Persistent per-thread SQLite connections.
+
+    Each thread gets its own long-lived connection, configured once with
+    the pragmas below, so the WAL journal lets readers (the dashboard) and
+    the writer thread work concurrently. In-memory databases exist only
+    inside a single connection, so for ``:memory:`` one connection is
+    shared and access to it is serialized with a lock.
+    """
+
+    PRAGMAS = {
+        # Must precede journal_mode, and only takes effect for new
+        # databases; `timeglass compact` converts existing ones
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # KiB, i.e. 16 MB of page cache
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    }
+
+    def __init__(self, db_path: str, cached_statements: int = 256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._connections: List[sqlite3.Connection] = []
+        self._shared: Optional[sqlite3.Connection] = None
+
+    @property
+    def is_memory(self) -> bool:
+        """Whether this manager serves an in-memory database."""
+        return self.db_path == ":memory:"
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.PRAGMAS.items():
+            if name == "journal_mode" and self.is_memory:
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield the connection for the calling thread."""
+        if self.is_memory:
+            with self._lock:
+                if self._shared is None:
+                    self._shared = self._open()
+                yield self._shared
+            return
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        yield conn
+
+    def close_all(self):
+        """Close every connection opened by this manager."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._shared = None
+        self._local = threading.local()
 
 
 class TimeGlassStorage:
@@ -12,22 +278,21 @@ class TimeGlassStorage:
     def __init__(self, db_path: str = "timeglass.db"):
         """Initialize database connection."""
         self.db_path = db_path  # Keep as string for sqlite3
-        # For in-memory databases, we need to keep the connection alive
-        if db_path == ":memory:":
-            self._connection = sqlite3.connect(db_path)
-            self._init_db()
-        else:
-            self._connection = None
+        # Executions of one statement in a request reported as N+1
+        self.n_plus_one_threshold = DEFAULT_THRESHOLD
+        # Interned stack frame and stack IDs, filled as they are written
+        self._stack_frame_ids: Dict[tuple, int] = {}
+        self._stack_ids: Dict[str, int] = {}
+        self._connections = ConnectionManager(db_path)
+        self._init_db()
 
-    def _get_connection(self):
-        """Get database connection, reusing for in-memory databases."""
-        if self.db_path == ":memory:" and self._connection:
-            return self._connection
-        return sqlite3.connect(self.db_path)
+    def close(self):
+        """Close all pooled database connections."""
+        self._connections.close_all()
 
     def _init_db(self):
         """Initialize database tables."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connections.connect() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS profiling_metrics (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -44,9 +309,23 @@ class TimeGlassStorage:
                     response_size_bytes INTEGER,
                     user_agent TEXT,
                     client_ip TEXT,
+                    sample_weight REAL NOT NULL DEFAULT 1.0,
+                    duration_us INTEGER,
+                    process_cpu_ms REAL,
+                    thread_cpu_ms REAL,
+                    rss_bytes INTEGER,
+                    rss_delta_bytes INTEGER,
+                    alloc_delta_bytes INTEGER,
+                    ttfb_us INTEGER,
+                    route TEXT,
+                    error_type TEXT,
+                    error_message TEXT,
+                    error_fingerprint TEXT,
+                    worker_pid INTEGER,
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            self._ensure_columns(conn, "profiling_metrics")
 
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS system_metrics (
@@ -57,22 +336,215 @@ class TimeGlassStorage:
                     memory_usage_percent REAL NOT NULL,
                     total_memory_mb INTEGER NOT NULL,
                     cpu_count INTEGER NOT NULL,
+                    load_avg_1m REAL,
+                    load_avg_5m REAL,
+                    load_avg_15m REAL,
+                    process_count INTEGER,
+                    open_fds INTEGER,
+                    event_loop_lag_ms REAL,
+                    gc_collections INTEGER,
+                    gc_pause_ms REAL,
+                    net_rx_bytes INTEGER,
+                    net_tx_bytes INTEGER,
+                    disk_read_bytes INTEGER,
+                    disk_write_bytes INTEGER,
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            self._ensure_columns(conn, "system_metrics")
 
+            # Query rows refer to their statement's fingerprint; the raw
+            # text is only present in rows written before fingerprints
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS query_metrics (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     request_id TEXT NOT NULL,
-                    query TEXT NOT NULL,
+                    query TEXT,
                     duration_ms REAL NOT NULL,
                     timestamp TEXT NOT NULL,
                     connection_id TEXT,
+                    fingerprint_id INTEGER,
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (request_id) REFERENCES profiling_metrics (request_id)
                 )
             """)
+            self._ensure_columns(conn, "query_metrics")
+            # Older databases declare the query text NOT NULL
+            self._query_text_required = any(
+                row[1] == "query" and row[3]
+                for row in conn.execute("PRAGMA table_info(query_metrics)")
+            )
+
+            # One row per normalized statement (see timeglass.sql) with
+            # running aggregates, plus its latency histogram
+            has_fingerprints = conn.execute("""
+                SELECT 1 FROM sqlite_master
+                WHERE type = 'table' AND name = 'query_fingerprints'
+            """).fetchone()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_fingerprints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fingerprint TEXT NOT NULL UNIQUE,
+                    count INTEGER NOT NULL,
+                    total_ms REAL NOT NULL,
+                    min_ms REAL NOT NULL,
+                    max_ms REAL NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_histogram (
+                    fingerprint_id INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (fingerprint_id, bucket)
+                ) WITHOUT ROWID
+            """)
+            if not has_fingerprints:
+                self._backfill_query_fingerprints(conn)
+
+            # Stack sampler counts (see timeglass.stacks). Frames and whole
+            # stacks are interned; a stack is its frame IDs, outermost first,
+            # joined with ";"
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stack_frames (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    function TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    UNIQUE (filename, function, line)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stack_traces (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    frames TEXT NOT NULL UNIQUE
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stack_samples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT,
+                    stack_id INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+
+            # N+1 findings (see timeglass.nplusone) per request, and their
+            # running totals per route and statement
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS n_plus_one (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL,
+                    fingerprint_id INTEGER NOT NULL,
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total_ms REAL NOT NULL,
+                    wasted_ms REAL NOT NULL,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS n_plus_one_routes (
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    fingerprint_id INTEGER NOT NULL,
+                    requests INTEGER NOT NULL,
+                    queries INTEGER NOT NULL,
+                    wasted_ms REAL NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    last_request_id TEXT,
+                    PRIMARY KEY (method, route, fingerprint_id)
+                ) WITHOUT ROWID
+            """)
+
+            # Request timeline spans (see timeglass.spans); ``timestamp`` is
+            # when they were written, for retention
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL,
+                    span_id INTEGER NOT NULL,
+                    parent_id INTEGER,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    start_us INTEGER NOT NULL,
+                    duration_us INTEGER NOT NULL,
+                    detail TEXT,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+
+            # All-time percentiles are read from the hourly rollup histograms,
+            # which are pruned along with the counts they summarize
+            conn.execute("DROP TABLE IF EXISTS latency_histogram")
+
+            # Time-bucketed rollups per (method, route, status class) at each
+            # of ROLLUP_GRANULARITIES, with matching histogram buckets
+            has_rollups = conn.execute("""
+                SELECT 1 FROM sqlite_master
+                WHERE type = 'table' AND name = 'rollups'
+            """).fetchone()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollups (
+                    granularity INTEGER NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    status_class TEXT NOT NULL,
+                    count REAL NOT NULL,
+                    sum_ms REAL NOT NULL,
+                    min_ms REAL NOT NULL,
+                    max_ms REAL NOT NULL,
+                    sum_cpu_percent REAL NOT NULL,
+                    cpu_samples REAL NOT NULL,
+                    sum_memory_percent REAL NOT NULL,
+                    memory_samples REAL NOT NULL,
+                    sum_process_cpu_ms REAL NOT NULL DEFAULT 0,
+                    process_cpu_samples REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (
+                        granularity, bucket_start, method, route, status_class
+                    )
+                ) WITHOUT ROWID
+            """)
+            self._ensure_columns(conn, "rollups")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_histograms (
+                    granularity INTEGER NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    status_class TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count REAL NOT NULL,
+                    PRIMARY KEY (
+                        granularity, bucket_start, method, route,
+                        status_class, bucket
+                    )
+                ) WITHOUT ROWID
+            """)
+            if not has_rollups:
+                self._backfill_rollups(conn)
+
+            # Failed requests deduplicated by exception fingerprint
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS errors (
+                    fingerprint TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    error_type TEXT NOT NULL,
+                    message TEXT,
+                    count REAL NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    last_request_id TEXT,
+                    PRIMARY KEY (fingerprint, method, route)
+                ) WITHOUT ROWID
+            """)
 
             # Create indexes for better query performance
             conn.execute("""
@@ -85,146 +557,776 @@ class TimeGlassStorage:
                 ON profiling_metrics (start_time)
             """)
 
+            # Composite indexes backing the /api/requests filters
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_profiling_path_start_time
+                ON profiling_metrics (path, start_time)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_profiling_status_start_time
+                ON profiling_metrics (status_code, start_time)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_profiling_method_start_time
+                ON profiling_metrics (method, start_time)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_profiling_route_start_time
+                ON profiling_metrics (route, start_time)
+            """)
+
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_system_timestamp
                 ON system_metrics (timestamp)
             """)
 
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_timestamp
+                ON query_metrics (timestamp)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_fingerprints_total_ms
+                ON query_fingerprints (total_ms)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_stack_samples_request_id
+                ON stack_samples (request_id)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_stack_samples_timestamp
+                ON stack_samples (timestamp)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_n_plus_one_request_id
+                ON n_plus_one (request_id)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_n_plus_one_timestamp
+                ON n_plus_one (timestamp)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_request_id
+                ON query_metrics (request_id, timestamp)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_spans_request_id
+                ON spans (request_id, span_id)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_spans_timestamp
+                ON spans (timestamp)
+            """)
+
             conn.commit()
 
-    def _ensure_tables(self, conn):
-        """Ensure database tables exist."""
+    # Columns added after the first release, by table, for databases created
+    # before them. CREATE TABLE above already includes them.
+    _ADDED_COLUMNS = {
+        "profiling_metrics": {
+            "sample_weight": "REAL NOT NULL DEFAULT 1.0",
+            "duration_us": "INTEGER",
+            "process_cpu_ms": "REAL",
+            "thread_cpu_ms": "REAL",
+            "rss_bytes": "INTEGER",
+            "rss_delta_bytes": "INTEGER",
+            "alloc_delta_bytes": "INTEGER",
+            "ttfb_us": "INTEGER",
+            "route": "TEXT",
+            "error_type": "TEXT",
+            "error_message": "TEXT",
+            "error_fingerprint": "TEXT",
+            "worker_pid": "INTEGER",
+        },
+        "system_metrics": {
+            "load_avg_1m": "REAL",
+            "load_avg_5m": "REAL",
+            "load_avg_15m": "REAL",
+            "process_count": "INTEGER",
+            "open_fds": "INTEGER",
+            "event_loop_lag_ms": "REAL",
+            "gc_collections": "INTEGER",
+            "gc_pause_ms": "REAL",
+            "net_rx_bytes": "INTEGER",
+            "net_tx_bytes": "INTEGER",
+            "disk_read_bytes": "INTEGER",
+            "disk_write_bytes": "INTEGER",
+        },
+        "query_metrics": {
+            "fingerprint_id": "INTEGER",
+        },
+        "rollups": {
+            "sum_process_cpu_ms": "REAL NOT NULL DEFAULT 0",
+            "process_cpu_samples": "REAL NOT NULL DEFAULT 0",
+        },
+    }
+
+    @classmethod
+    def _ensure_columns(cls, conn: sqlite3.Connection, table: str):
+        """Add any ``_ADDED_COLUMNS`` missing from an existing table."""
+        existing = {
+            row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+        }
+        for name, definition in cls._ADDED_COLUMNS[table].items():
+            if name not in existing:
+                conn.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {name} {definition}"
+                )
+
+    @staticmethod
+    def _backfill_query_fingerprints(conn: sqlite3.Connection):
+        """Fingerprint query rows written before the fingerprint table."""
+        conn.create_function("tg_normalize_sql", 1, normalize_sql)
+        conn.create_function("tg_bucket", 1, bucket_index, deterministic=True)
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS profiling_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                request_id TEXT UNIQUE NOT NULL,
-                start_time TEXT NOT NULL,
-                end_time TEXT,
-                duration_ms REAL,
-                cpu_usage_percent REAL,
-                memory_usage_mb REAL,
-                memory_usage_percent REAL,
-                method TEXT,
-                path TEXT,
-                status_code INTEGER,
-                response_size_bytes INTEGER,
-                user_agent TEXT,
-                client_ip TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            INSERT INTO query_fingerprints (
+                fingerprint, count, total_ms, min_ms, max_ms,
+                first_seen, last_seen
             )
+            SELECT tg_normalize_sql(query), COUNT(*), TOTAL(duration_ms),
+                   MIN(duration_ms), MAX(duration_ms),
+                   MIN(timestamp), MAX(timestamp)
+            FROM query_metrics
+            WHERE query IS NOT NULL
+            GROUP BY 1
         """)
-
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS system_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                cpu_usage_percent REAL NOT NULL,
-                memory_usage_mb REAL NOT NULL,
-                memory_usage_percent REAL NOT NULL,
-                total_memory_mb INTEGER NOT NULL,
-                cpu_count INTEGER NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            UPDATE query_metrics SET fingerprint_id = (
+                SELECT id FROM query_fingerprints
+                WHERE fingerprint = tg_normalize_sql(query_metrics.query)
             )
+            WHERE query IS NOT NULL
         """)
-
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS query_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                request_id TEXT NOT NULL,
-                query TEXT NOT NULL,
-                duration_ms REAL NOT NULL,
-                timestamp TEXT NOT NULL,
-                connection_id TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (request_id) REFERENCES profiling_metrics (request_id)
-            )
+            INSERT INTO query_histogram (fingerprint_id, bucket, count)
+            SELECT fingerprint_id, tg_bucket(duration_ms), COUNT(*)
+            FROM query_metrics
+            WHERE fingerprint_id IS NOT NULL
+            GROUP BY 1, 2
         """)
 
+    @staticmethod
+    def _backfill_rollups(conn: sqlite3.Connection):
+        """Build rollups for rows written before the rollup tables existed."""
+        conn.create_function("tg_bucket", 1, bucket_index, deterministic=True)
+        conn.create_function("tg_epoch", 1, _epoch_seconds, deterministic=True)
+        conn.create_function(
+            "tg_status_class", 1, _status_class, deterministic=True
+        )
+        for granularity in ROLLUP_GRANULARITIES:
+            conn.execute("""
+                INSERT INTO rollups
+                SELECT ?1, tg_epoch(start_time) / ?1 * ?1,
+                       COALESCE(method, ''), COALESCE(route, path, ''),
+                       tg_status_class(status_code),
+                       TOTAL(sample_weight),
+                       TOTAL(duration_ms * sample_weight),
+                       MIN(duration_ms), MAX(duration_ms),
+                       TOTAL(cpu_usage_percent * sample_weight),
+                       TOTAL(CASE WHEN cpu_usage_percent IS NOT NULL
+                                  THEN sample_weight END),
+                       TOTAL(memory_usage_percent * sample_weight),
+                       TOTAL(CASE WHEN memory_usage_percent IS NOT NULL
+                                  THEN sample_weight END),
+                       TOTAL(process_cpu_ms * sample_weight),
+                       TOTAL(CASE WHEN process_cpu_ms IS NOT NULL
+                                  THEN sample_weight END)
+                FROM profiling_metrics
+                WHERE duration_ms IS NOT NULL
+                GROUP BY 2, 3, 4, 5
+            """, (granularity,))
+            conn.execute("""
+                INSERT INTO rollup_histograms
+                SELECT ?1, tg_epoch(start_time) / ?1 * ?1,
+                       COALESCE(method, ''), COALESCE(route, path, ''),
+                       tg_status_class(status_code),
+                       tg_bucket(duration_ms), TOTAL(sample_weight)
+                FROM profiling_metrics
+                WHERE duration_ms IS NOT NULL
+                GROUP BY 2, 3, 4, 5, 6
+            """, (granularity,))
+
+    # Requests already stored are skipped, so replaying records cannot
+    # count them twice in the aggregates
+    _INSERT_PROFILING_SQL = """
+        INSERT INTO profiling_metrics (
+            request_id, start_time, end_time, duration_ms,
+            cpu_usage_percent, memory_usage_mb, memory_usage_percent,
+            method, path, status_code, response_size_bytes,
+            user_agent, client_ip, sample_weight, duration_us,
+            process_cpu_ms, thread_cpu_ms, rss_bytes, rss_delta_bytes,
+            alloc_delta_bytes, ttfb_us, route,
+            error_type, error_message, error_fingerprint, worker_pid
+        ) VALUES (
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?
+        )
+        ON CONFLICT (request_id) DO NOTHING
+    """
+
+    @staticmethod
+    def _profiling_row(metrics: ProfilingMetrics) -> tuple:
+        """Convert profiling metrics into an insert parameter tuple."""
+        duration_us = metrics.duration_us
+        if duration_us is None and metrics.duration_ms is not None:
+            duration_us = round(metrics.duration_ms * 1000)
+        return (
+            metrics.request_id,
+            metrics.start_time.isoformat() if metrics.start_time else None,
+            metrics.end_time.isoformat() if metrics.end_time else None,
+            metrics.duration_ms,
+            metrics.cpu_usage_percent,
+            metrics.memory_usage_mb,
+            metrics.memory_usage_percent,
+            metrics.method,
+            metrics.path,
+            metrics.status_code,
+            metrics.response_size_bytes,
+            metrics.user_agent,
+            metrics.client_ip,
+            metrics.sample_weight,
+            duration_us,
+            metrics.process_cpu_ms,
+            metrics.thread_cpu_ms,
+            metrics.rss_bytes,
+            metrics.rss_delta_bytes,
+            metrics.alloc_delta_bytes,
+            metrics.ttfb_us,
+            metrics.route,
+            metrics.error_type,
+            metrics.error_message,
+            metrics.error_fingerprint,
+            metrics.worker_pid,
+        )
+
+    _PROFILING_COLUMNS = (
+        "request_id", "start_time", "end_time", "duration_ms",
+        "cpu_usage_percent", "memory_usage_mb", "memory_usage_percent",
+        "method", "path", "status_code", "response_size_bytes",
+        "user_agent", "client_ip", "sample_weight", "duration_us",
+        "process_cpu_ms", "thread_cpu_ms", "rss_bytes", "rss_delta_bytes",
+        "alloc_delta_bytes", "ttfb_us", "route",
+        "error_type", "error_message", "error_fingerprint", "worker_pid",
+    )
+    _PROFILING_SELECT = ", ".join(_PROFILING_COLUMNS)
+
+    @classmethod
+    def _profiling_from_row(cls, row: tuple) -> ProfilingMetrics:
+        """Build profiling metrics from a ``_PROFILING_SELECT`` row."""
+        return ProfilingMetrics.from_dict(dict(zip(cls._PROFILING_COLUMNS, row)))
+
     def save_profiling_metrics(self, metrics: ProfilingMetrics):
         """Save profiling metrics to database."""
-        conn = self._get_connection()
-        try:
-            self._ensure_tables(conn)
-            conn.execute("""
-                INSERT OR REPLACE INTO profiling_metrics (
-                    request_id, start_time, end_time, duration_ms,
-                    cpu_usage_percent, memory_usage_mb, memory_usage_percent,
-                    method, path, status_code, response_size_bytes,
-                    user_agent, client_ip
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                metrics.request_id,
-                metrics.start_time.isoformat() if metrics.start_time else None,
-                metrics.end_time.isoformat() if metrics.end_time else None,
-                metrics.duration_ms,
-                metrics.cpu_usage_percent,
-                metrics.memory_usage_mb,
-                metrics.memory_usage_percent,
-                metrics.method,
-                metrics.path,
-                metrics.status_code,
-                metrics.response_size_bytes,
-                metrics.user_agent,
-                metrics.client_ip,
-            ))
-            conn.commit()
-        finally:
-            if self.db_path != ":memory:":
-                conn.close()
+        self.save_many_profiling_metrics([metrics])
+
+    _SYSTEM_COLUMNS = (
+        "timestamp", "cpu_usage_percent", "memory_usage_mb",
+        "memory_usage_percent", "total_memory_mb", "cpu_count",
+        "load_avg_1m", "load_avg_5m", "load_avg_15m", "process_count",
+        "open_fds", "event_loop_lag_ms", "gc_collections", "gc_pause_ms",
+        "net_rx_bytes", "net_tx_bytes", "disk_read_bytes", "disk_write_bytes",
+    )
+
+    _INSERT_SYSTEM_SQL = f"""
+        INSERT INTO system_metrics ({", ".join(_SYSTEM_COLUMNS)})
+        VALUES ({", ".join("?" * len(_SYSTEM_COLUMNS))})
+    """
+
+    @classmethod
+    def _system_row(cls, metrics: SystemMetrics) -> tuple:
+        """Convert system metrics into an insert parameter tuple."""
+        record = metrics.to_dict()
+        return tuple(record[name] for name in cls._SYSTEM_COLUMNS)
 
     def save_system_metrics(self, metrics: SystemMetrics):
         """Save system metrics to database."""
-        conn = self._get_connection()
-        try:
-            self._ensure_tables(conn)
-            conn.execute("""
-                INSERT INTO system_metrics (
-                    timestamp, cpu_usage_percent, memory_usage_mb,
-                    memory_usage_percent, total_memory_mb, cpu_count
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                metrics.timestamp.isoformat(),
-                metrics.cpu_usage_percent,
-                metrics.memory_usage_mb,
-                metrics.memory_usage_percent,
-                metrics.total_memory_mb,
-                metrics.cpu_count,
-            ))
-            conn.commit()
-        finally:
-            if self.db_path != ":memory:":
-                conn.close()
+        with self._connections.connect() as conn, conn:
+            conn.execute(self._INSERT_SYSTEM_SQL, self._system_row(metrics))
+
+    _INSERT_QUERY_SQL = """
+        INSERT INTO query_metrics (
+            request_id, query, duration_ms, timestamp, connection_id,
+            fingerprint_id
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+    def _query_row(self, metrics: QueryMetrics, fingerprint_id: int) -> tuple:
+        """Convert query metrics into an insert parameter tuple."""
+        return (
+            metrics.request_id,
+            # The statement is stored once, in query_fingerprints
+            "" if self._query_text_required else None,
+            metrics.duration_ms,
+            metrics.timestamp.isoformat(),
+            metrics.connection_id,
+            fingerprint_id,
+        )
 
     def save_query_metrics(self, metrics: QueryMetrics):
         """Save query metrics to database."""
-        with sqlite3.connect(self.db_path) as conn:
-            self._ensure_tables(conn)
-            conn.execute("""
-                INSERT INTO query_metrics (
-                    request_id, query, duration_ms, timestamp, connection_id
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (
-                metrics.request_id,
-                metrics.query,
-                metrics.duration_ms,
-                metrics.timestamp.isoformat(),
-                metrics.connection_id,
+        self.save_many_query_metrics([metrics])
+
+    def save_many_profiling_metrics(
+        self,
+        metrics: Iterable[ProfilingMetrics],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Save profiling metrics in chunked transactions.
+
+        ``metrics`` may be any iterable, including a generator; it is consumed
+        lazily, ``chunk_size`` records per transaction. Records whose
+        request_id is already stored are skipped. Returns the number of
+        records written.
+        """
+        return self._save_many(
+            self._INSERT_PROFILING_SQL,
+            metrics,
+            self._profiling_row,
+            chunk_size,
+            on_chunk=self._update_aggregates,
+            select=self._new_requests,
+        )
+
+    @staticmethod
+    def _new_requests(
+        conn: sqlite3.Connection, chunk: List[ProfilingMetrics]
+    ) -> List[ProfilingMetrics]:
+        """The records of ``chunk`` whose request_id is not stored yet."""
+        seen = set()
+        request_ids = list({m.request_id for m in chunk})
+        for start in range(0, len(request_ids), _MAX_LOOKUP_PARAMS):
+            batch = request_ids[start:start + _MAX_LOOKUP_PARAMS]
+            seen.update(request_id for (request_id,) in conn.execute(f"""
+                SELECT request_id FROM profiling_metrics
+                WHERE request_id IN ({", ".join("?" * len(batch))})
+            """, batch))
+        new = []
+        for m in chunk:
+            if m.request_id not in seen:
+                seen.add(m.request_id)
+                new.append(m)
+        return new
+
+    def save_many_system_metrics(
+        self,
+        metrics: Iterable[SystemMetrics],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Save system metrics in chunked transactions."""
+        return self._save_many(
+            self._INSERT_SYSTEM_SQL, metrics, self._system_row, chunk_size
+        )
+
+    def save_many_query_metrics(
+        self,
+        metrics: Iterable[QueryMetrics],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Save query metrics in chunked transactions.
+
+        Each query is normalized (see timeglass.sql) and stored as a
+        reference to its fingerprint, whose aggregates and histogram are
+        updated in the same transaction.
+
+        Requests are checked for N+1 patterns across the whole call, so a
+        request's queries should be saved together. Findings are stored
+        under the ``method`` and ``route`` carried by the query rows, or
+        else those of the request if it is already stored; findings whose
+        route cannot be resolved are not stored.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        records = iter(metrics)
+        detector = NPlusOneDetector(self.n_plus_one_threshold)
+        # request_id -> (method, route, timestamp) from the query rows
+        requests: Dict[str, Tuple[str, Optional[str], str]] = {}
+        total = 0
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            fingerprints = [normalize_sql(m.query) for m in chunk]
+            with self._connections.connect() as conn, conn:
+                ids = self._update_query_fingerprints(conn, chunk, fingerprints)
+                conn.executemany(self._INSERT_QUERY_SQL, [
+                    self._query_row(m, ids[fingerprint])
+                    for m, fingerprint in zip(chunk, fingerprints)
+                ])
+            for m, fingerprint in zip(chunk, fingerprints):
+                detector.add(m.request_id, ids[fingerprint], m.duration_ms)
+                if m.route and m.request_id not in requests:
+                    requests[m.request_id] = (
+                        m.method or "", m.route, m.timestamp.isoformat()
+                    )
+            total += len(chunk)
+
+        findings = detector.findings()
+        if findings:
+            with self._connections.connect() as conn, conn:
+                self._record_n_plus_one(conn, findings, requests)
+        return total
+
+    @staticmethod
+    def _record_n_plus_one(
+        conn: sqlite3.Connection,
+        findings: List[NPlusOne],
+        requests: Dict[str, Tuple[str, Optional[str], str]],
+    ):
+        """Store N+1 findings under their request's method and route.
+
+        Requests missing from ``requests`` are looked up in
+        profiling_metrics; findings of requests found in neither are
+        dropped rather than stored without a route.
+        """
+        requests = dict(requests)
+        missing = list({
+            f.request_id for f in findings if f.request_id not in requests
+        })
+        for start in range(0, len(missing), _MAX_LOOKUP_PARAMS):
+            batch = missing[start:start + _MAX_LOOKUP_PARAMS]
+            for request_id, method, route, start_time in conn.execute(f"""
+                SELECT request_id, method, COALESCE(route, path), start_time
+                FROM profiling_metrics
+                WHERE request_id IN ({", ".join("?" * len(batch))})
+            """, batch):
+                if route:
+                    requests[request_id] = (method or "", route, start_time)
+        rows = []
+        for f in findings:
+            if f.request_id not in requests:
+                continue
+            method, route, timestamp = requests[f.request_id]
+            rows.append((
+                f.request_id, f.fingerprint_id, method, route,
+                f.count, f.total_ms, f.wasted_ms, timestamp,
             ))
-            conn.commit()
+        conn.executemany(_INSERT_N_PLUS_ONE_SQL, rows)
+        conn.executemany(_UPSERT_N_PLUS_ONE_ROUTE_SQL, [
+            (method, route, fingerprint_id, count, wasted_ms,
+             timestamp, timestamp, request_id)
+            for (request_id, fingerprint_id, method, route, count, _,
+                 wasted_ms, timestamp) in rows
+        ])
+
+    @staticmethod
+    def _update_query_fingerprints(
+        conn: sqlite3.Connection,
+        chunk: List[QueryMetrics],
+        fingerprints: List[str],
+    ) -> Dict[str, int]:
+        """Add a chunk of queries to the per-fingerprint aggregates.
+
+        Returns the ID of every fingerprint in the chunk. IDs are looked up
+        after the upsert rather than with RETURNING, which needs SQLite 3.35.
+        """
+        groups: Dict[str, list] = {}
+        for m, fingerprint in zip(chunk, fingerprints):
+            timestamp = m.timestamp.isoformat()
+            group = groups.get(fingerprint)
+            if group is None:
+                groups[fingerprint] = [
+                    1, m.duration_ms, m.duration_ms, m.duration_ms,
+                    timestamp, timestamp,
+                ]
+            else:
+                group[0] += 1
+                group[1] += m.duration_ms
+                group[2] = min(group[2], m.duration_ms)
+                group[3] = max(group[3], m.duration_ms)
+                group[4] = min(group[4], timestamp)
+                group[5] = max(group[5], timestamp)
+
+        conn.executemany(_UPSERT_QUERY_FINGERPRINT_SQL, [
+            (fingerprint, *group) for fingerprint, group in groups.items()
+        ])
+        ids: Dict[str, int] = {}
+        keys = list(groups)
+        for start in range(0, len(keys), _MAX_LOOKUP_PARAMS):
+            batch = keys[start:start + _MAX_LOOKUP_PARAMS]
+            ids.update(conn.execute(f"""
+                SELECT fingerprint, id FROM query_fingerprints
+                WHERE fingerprint IN ({", ".join("?" * len(batch))})
+            """, batch))
+
+        buckets: Counter = Counter(
+            (ids[fingerprint], bucket_index(m.duration_ms))
+            for m, fingerprint in zip(chunk, fingerprints)
+        )
+        conn.executemany(
+            _UPSERT_QUERY_HISTOGRAM_SQL,
+            [(*key, count) for key, count in buckets.items()],
+        )
+        return ids
+
+    _INSERT_SPAN_SQL = """
+        INSERT INTO spans (
+            request_id, span_id, parent_id, name, kind, start_us,
+            duration_us, detail, timestamp
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def save_many_spans(
+        self,
+        spans: Iterable[Span],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Save request timeline spans in chunked transactions.
+
+        The detail of ``db`` spans is stored as the statement's fingerprint
+        text (see timeglass.sql), so literals are kept out of the table.
+        """
+        timestamp = datetime.now().isoformat()
+
+        def to_row(s: Span) -> tuple:
+            detail = s.detail
+            if s.kind == "db" and detail:
+                detail = normalize_sql(detail)
+            return (
+                s.request_id, s.span_id, s.parent_id, s.name, s.kind,
+                s.start_us, s.duration_us, detail, timestamp,
+            )
+
+        return self._save_many(self._INSERT_SPAN_SQL, spans, to_row, chunk_size)
+
+    def save_stack_samples(self, samples: List[StackSample]) -> int:
+        """Save stack sampler counts, interning new frames and stacks."""
+        frame_ids = dict(self._stack_frame_ids)
+        stack_ids = dict(self._stack_ids)
+        rows = []
+        with self._connections.connect() as conn, conn:
+            for sample in samples:
+                ids = []
+                for frame in sample.stack:
+                    frame_id = frame_ids.get(frame)
+                    if frame_id is None:
+                        frame_id = frame_ids[frame] = self._intern(
+                            conn, "stack_frames",
+                            ("filename", "function", "line"), frame,
+                        )
+                    ids.append(str(frame_id))
+                frames = ";".join(ids)
+                stack_id = stack_ids.get(frames)
+                if stack_id is None:
+                    stack_id = stack_ids[frames] = self._intern(
+                        conn, "stack_traces", ("frames",), (frames,)
+                    )
+                rows.append((
+                    sample.request_id, stack_id, sample.count,
+                    sample.timestamp.isoformat(),
+                ))
+            conn.executemany("""
+                INSERT INTO stack_samples (request_id, stack_id, count, timestamp)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+        # Only cache IDs once they are committed
+        if len(frame_ids) + len(stack_ids) > MAX_INTERNED_STACK_IDS:
+            frame_ids, stack_ids = {}, {}
+        self._stack_frame_ids, self._stack_ids = frame_ids, stack_ids
+        return len(rows)
+
+    @staticmethod
+    def _intern(
+        conn: sqlite3.Connection, table: str, columns: tuple, values: tuple
+    ) -> int:
+        """Return the ID of the row with ``values``, inserting it if new."""
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            values,
+        )
+        where = " AND ".join(f"{column} = ?" for column in columns)
+        return conn.execute(
+            f"SELECT id FROM {table} WHERE {where}", values
+        ).fetchone()[0]
+
+    def _save_many(
+        self,
+        sql: str,
+        records: Iterable,
+        to_row: Callable[[Any], tuple],
+        chunk_size: int,
+        on_chunk: Optional[Callable[[sqlite3.Connection, list], None]] = None,
+        select: Optional[Callable[[sqlite3.Connection, list], list]] = None,
+    ) -> int:
+        """Run ``executemany`` over ``records`` one chunk per transaction.
+
+        ``select``, if given, picks the records of each chunk to write.
+        ``on_chunk`` runs on those inside the same transaction so derived
+        aggregates stay consistent with the raw rows.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        records = iter(records)
+        total = 0
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return total
+            with self._connections.connect() as conn, conn:
+                if select is not None:
+                    chunk = select(conn, chunk)
+                conn.executemany(sql, [to_row(r) for r in chunk])
+                if on_chunk is not None and chunk:
+                    on_chunk(conn, chunk)
+            total += len(chunk)
+
+    @classmethod
+    def _update_aggregates(
+        cls, conn: sqlite3.Connection, chunk: List[ProfilingMetrics]
+    ):
+        """Fold a chunk of requests into the aggregate tables."""
+        cls._update_rollups(conn, chunk)
+        cls._update_errors(conn, chunk)
+
+    @staticmethod
+    def _update_errors(conn: sqlite3.Connection, chunk: List[ProfilingMetrics]):
+        """Count failed requests per (fingerprint, method, route)."""
+        errors: Dict[tuple, list] = {}
+        for m in chunk:
+            if m.error_fingerprint is None:
+                continue
+            key = (m.error_fingerprint, m.method or "", m.route or m.path or "")
+            seen = m.start_time.isoformat()
+            agg = errors.get(key)
+            if agg is None:
+                errors[key] = [
+                    m.error_type, m.error_message, m.sample_weight,
+                    seen, seen, m.request_id,
+                ]
+            else:
+                agg[0], agg[1] = m.error_type, m.error_message
+                agg[2] += m.sample_weight
+                agg[3] = min(agg[3], seen)
+                if seen >= agg[4]:
+                    agg[4], agg[5] = seen, m.request_id
+        if errors:
+            conn.executemany(
+                _UPSERT_ERROR_SQL,
+                [(*key, *agg) for key, agg in errors.items()],
+            )
+
+    @staticmethod
+    def _update_rollups(conn: sqlite3.Connection, chunk: List[ProfilingMetrics]):
+        """Add a chunk of requests to the 1s/1m/1h rollups."""
+        rollups: Dict[tuple, list] = {}
+        histograms: Counter = Counter()
+        for m in chunk:
+            if m.duration_ms is None or m.start_time is None:
+                continue
+            epoch = int(m.start_time.timestamp())
+            bucket = bucket_index(m.duration_ms)
+            cpu = m.cpu_usage_percent
+            memory = m.memory_usage_percent
+            weight = m.sample_weight
+            process_cpu = m.process_cpu_ms
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (
+                    granularity,
+                    epoch - epoch % granularity,
+                    m.method or "",
+                    m.route or m.path or "",
+                    _status_class(m.status_code),
+                )
+                agg = rollups.get(key)
+                if agg is None:
+                    agg = rollups[key] = [
+                        0.0, 0.0, m.duration_ms, m.duration_ms,
+                        0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                    ]
+                agg[0] += weight
+                agg[1] += m.duration_ms * weight
+                agg[2] = min(agg[2], m.duration_ms)
+                agg[3] = max(agg[3], m.duration_ms)
+                if cpu is not None:
+                    agg[4] += cpu * weight
+                    agg[5] += weight
+                if memory is not None:
+                    agg[6] += memory * weight
+                    agg[7] += weight
+                if process_cpu is not None:
+                    agg[8] += process_cpu * weight
+                    agg[9] += weight
+                histograms[key + (bucket,)] += weight
+
+        if rollups:
+            conn.executemany(
+                _UPSERT_ROLLUP_SQL,
+                [(*key, *agg) for key, agg in rollups.items()],
+            )
+            conn.executemany(
+                _UPSERT_ROLLUP_HISTOGRAM_SQL,
+                [(*key, count) for key, count in histograms.items()],
+            )
 
     def get_profiling_metrics(
         self,
         limit: int = 100,
         offset: int = 0,
         start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None
+        end_time: Optional[datetime] = None,
+        method: Optional[str] = None,
+        path: Optional[str] = None,
+        path_contains: Optional[str] = None,
+        status_code: Optional[int] = None,
+        route: Optional[str] = None,
+        path_prefix: Optional[str] = None,
     ) -> List[ProfilingMetrics]:
-        """Get profiling metrics with optional filtering."""
-        query = """
-            SELECT request_id, start_time, end_time, duration_ms,
-                   cpu_usage_percent, memory_usage_mb, memory_usage_percent,
-                   method, path, status_code, response_size_bytes,
-                   user_agent, client_ip
+        """Get profiling metrics with optional filtering.
+
+        ``method``, ``path``, ``route`` and ``status_code`` are exact matches
+        served by the composite ``(column, start_time)`` indexes, as is the
+        case-sensitive ``path_prefix``. ``path_contains`` is a
+        case-insensitive substring match that no index can serve: it scans
+        every row in the ``start_time`` range, so bound that range on large
+        tables.
+        """
+        metrics, _ = self.get_profiling_metrics_page(
+            limit=limit,
+            offset=offset,
+            start_time=start_time,
+            end_time=end_time,
+            method=method,
+            path=path,
+            path_contains=path_contains,
+            status_code=status_code,
+            route=route,
+            path_prefix=path_prefix,
+        )
+        return metrics
+
+    def get_profiling_metrics_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        method: Optional[str] = None,
+        path: Optional[str] = None,
+        path_contains: Optional[str] = None,
+        status_code: Optional[int] = None,
+        route: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> Tuple[List[ProfilingMetrics], Optional[str]]:
+        """Get one page of profiling metrics, newest first.
+
+        Pages are keyed on ``(start_time, id)``: pass the returned cursor back
+        to get the next page at the same cost regardless of depth. The
+        returned cursor is None on the last page. Raises ValueError for a
+        malformed cursor. Filters are as for ``get_profiling_metrics``.
+        """
+        query = f"""
+            SELECT id, {self._PROFILING_SELECT}
             FROM profiling_metrics
             WHERE 1=1
         """
@@ -238,38 +1340,90 @@ class TimeGlassStorage:
             query += " AND start_time <= ?"
             params.append(end_time.isoformat())
 
-        query += " ORDER BY start_time DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        if method:
+            query += " AND method = ?"
+            params.append(method.upper())
 
-        conn = self._get_connection()
-        try:
-            self._ensure_tables(conn)
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
-        finally:
-            if self.db_path != ":memory:":
-                conn.close()
+        if path:
+            query += " AND path = ?"
+            params.append(path)
 
-        metrics = []
-        for row in rows:
-            data = {
-                "request_id": row[0],
-                "start_time": row[1],
-                "end_time": row[2],
-                "duration_ms": row[3],
-                "cpu_usage_percent": row[4],
-                "memory_usage_mb": row[5],
-                "memory_usage_percent": row[6],
-                "method": row[7],
-                "path": row[8],
-                "status_code": row[9],
-                "response_size_bytes": row[10],
-                "user_agent": row[11],
-                "client_ip": row[12],
-            }
-            metrics.append(ProfilingMetrics.from_dict(data))
+        if path_contains:
+            query += " AND path LIKE ? ESCAPE '\\'"
+            params.append(f"%{_escape_like(path_contains)}%")
 
-        return metrics
+        if path_prefix:
+            low, high = _prefix_bounds(path_prefix)
+            query += " AND path >= ?"
+            params.append(low)
+            if high is not None:
+                query += " AND path < ?"
+                params.append(high)
+
+        if status_code is not None:
+            query += " AND status_code = ?"
+            params.append(status_code)
+
+        if route:
+            query += " AND route = ?"
+            params.append(route)
+
+        if cursor:
+            query += " AND (start_time, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+
+        # Fetch one extra row to learn whether another page exists
+        query += " ORDER BY start_time DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, offset])
+
+        with self._connections.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][2], rows[-1][0])
+
+        return [self._profiling_from_row(row[1:]) for row in rows], next_cursor
+
+    def get_profiling_metric(self, request_id: str) -> Optional[ProfilingMetrics]:
+        """Get a single request's profiling metrics by request ID."""
+        with self._connections.connect() as conn:
+            row = conn.execute(f"""
+                SELECT {self._PROFILING_SELECT}
+                FROM profiling_metrics
+                WHERE request_id = ?
+            """, (request_id,)).fetchone()
+
+        return self._profiling_from_row(row) if row else None
+
+    def get_query_metrics(self, request_id: str) -> List[QueryMetrics]:
+        """Get the database queries recorded for a request, oldest first.
+
+        ``query`` is the statement's fingerprint text, or the raw text for
+        rows written before fingerprinting.
+        """
+        with self._connections.connect() as conn:
+            rows = conn.execute("""
+                SELECT q.request_id,
+                       COALESCE(NULLIF(q.query, ''), f.fingerprint),
+                       q.duration_ms, q.timestamp, q.connection_id
+                FROM query_metrics q
+                LEFT JOIN query_fingerprints f ON f.id = q.fingerprint_id
+                WHERE q.request_id = ?
+                ORDER BY q.timestamp, q.id
+            """, (request_id,)).fetchall()
+
+        return [
+            QueryMetrics(
+                request_id=row[0],
+                query=row[1],
+                duration_ms=row[2],
+                timestamp=datetime.fromisoformat(row[3]),
+                connection_id=row[4],
+            )
+            for row in rows
+        ]
 
     def get_system_metrics(
         self,
@@ -278,9 +1432,21 @@ class TimeGlassStorage:
         end_time: Optional[datetime] = None
     ) -> List[SystemMetrics]:
         """Get system metrics with optional time filtering."""
-        query = """
-            SELECT timestamp, cpu_usage_percent, memory_usage_mb,
-                   memory_usage_percent, total_memory_mb, cpu_count
+        metrics, _ = self.get_system_metrics_page(
+            limit=limit, start_time=start_time, end_time=end_time
+        )
+        return metrics
+
+    def get_system_metrics_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> Tuple[List[SystemMetrics], Optional[str]]:
+        """Get one page of system metrics keyed on ``(timestamp, id)``."""
+        query = f"""
+            SELECT id, {", ".join(self._SYSTEM_COLUMNS)}
             FROM system_metrics
             WHERE 1=1
         """
@@ -294,70 +1460,693 @@ class TimeGlassStorage:
             query += " AND timestamp <= ?"
             params.append(end_time.isoformat())
 
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limit)
+        if cursor:
+            query += " AND (timestamp, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
 
-        conn = self._get_connection()
-        try:
-            self._ensure_tables(conn)
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
-        finally:
-            if self.db_path != ":memory:":
-                conn.close()
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
 
-        metrics = []
-        for row in rows:
-            metrics.append(SystemMetrics(
-                timestamp=datetime.fromisoformat(row[0]),
-                cpu_usage_percent=row[1],
-                memory_usage_mb=row[2],
-                memory_usage_percent=row[3],
-                total_memory_mb=row[4],
-                cpu_count=row[5],
-            ))
+        with self._connections.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
 
-        return metrics
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+        metrics = [
+            SystemMetrics.from_dict(dict(zip(self._SYSTEM_COLUMNS, row[1:])))
+            for row in rows
+        ]
+
+        return metrics, next_cursor
 
-    def get_stats_summary(self) -> dict:
-        """Get summary statistics."""
-        conn = self._get_connection()
-        try:
-            self._ensure_tables(conn)
+    def get_stats_summary(self, window_seconds: Optional[int] = None) -> dict:
+        """Get summary statistics.
+
+        Request figures are read from the rollup tables, so the cost scales
+        with the number of buckets rather than raw requests. With
+        ``window_seconds`` only the most recent window is summarized, at the
+        finest granularity that covers it in at most ``MAX_ROLLUP_BUCKETS``
+        buckets; without it the summary covers all retained data.
+
+        Counts and averages are weighted by each request's sample weight, so
+        they estimate the totals over all requests when sampling is enabled.
+        """
+        granularity = _pick_granularity(window_seconds)
+        since = 0
+        if window_seconds is not None:
+            since = int(time.time()) - window_seconds
+            since -= since % granularity
+
+        with self._connections.connect() as conn:
             # Request statistics
             cursor = conn.execute("""
                 SELECT
-                    COUNT(*) as total_requests,
-                    AVG(duration_ms) as avg_duration,
-                    MAX(duration_ms) as max_duration,
-                    MIN(duration_ms) as min_duration,
-                    AVG(cpu_usage_percent) as avg_cpu,
-                    AVG(memory_usage_percent) as avg_memory
-                FROM profiling_metrics
-                WHERE duration_ms IS NOT NULL
-            """)
+                    SUM(count) as total_requests,
+                    SUM(sum_ms) / SUM(count) as avg_duration,
+                    MAX(max_ms) as max_duration,
+                    MIN(min_ms) as min_duration,
+                    SUM(sum_cpu_percent) / SUM(cpu_samples) as avg_cpu,
+                    SUM(sum_memory_percent) / SUM(memory_samples) as avg_memory,
+                    MIN(bucket_start) as first_bucket,
+                    MAX(bucket_start) as last_bucket,
+                    SUM(sum_process_cpu_ms) / SUM(process_cpu_samples)
+                        as avg_process_cpu
+                FROM rollups
+                WHERE granularity = ? AND bucket_start >= ?
+            """, (granularity, since))
             req_stats = cursor.fetchone()
 
-            # Recent system metrics
+            # Process CPU time per route
+            route_cpu = {
+                (method, route): avg_cpu
+                for method, route, avg_cpu in conn.execute("""
+                    SELECT method, route,
+                           SUM(sum_process_cpu_ms) / SUM(process_cpu_samples)
+                    FROM rollups
+                    WHERE granularity = ? AND bucket_start >= ?
+                    GROUP BY method, route
+                """, (granularity, since))
+            }
+
+            # Recent system metrics. Timestamps are stored as local
+            # isoformat, so compare against a cutoff in the same form
             cursor = conn.execute("""
                 SELECT
                     AVG(cpu_usage_percent) as current_cpu,
                     AVG(memory_usage_percent) as current_memory
                 FROM system_metrics
-                WHERE timestamp >= datetime('now', '-1 hour')
-            """)
+                WHERE timestamp >= ?
+            """, ((datetime.now() - timedelta(hours=1)).isoformat(),))
             sys_stats = cursor.fetchone()
-        finally:
-            if self.db_path != ":memory:":
-                conn.close()
+
+            # Percentiles come from the same rollup rows as the counts
+            histogram_rows = conn.execute("""
+                SELECT method, route, bucket, SUM(count)
+                FROM rollup_histograms
+                WHERE granularity = ? AND bucket_start >= ?
+                GROUP BY method, route, bucket
+            """, (granularity, since)).fetchall()
+
+        overall: Dict[int, float] = defaultdict(float)
+        per_route: Dict[tuple, Dict[int, float]] = defaultdict(dict)
+        for method, route, bucket, count in histogram_rows:
+            overall[bucket] += count
+            per_route[(method, route)][bucket] = count
+
+        routes = []
+        for (method, route), counts in per_route.items():
+            routes.append({
+                "method": method or None,
+                "route": route or None,
+                "count": round(sum(counts.values())),
+                **_percentiles(counts),
+                "avg_process_cpu_ms": route_cpu.get((method, route)),
+            })
+        routes.sort(key=lambda r: r["count"], reverse=True)
+
+        total = req_stats[0] or 0
+        if window_seconds is not None:
+            span = window_seconds
+        elif req_stats[6] is not None:
+            span = req_stats[7] - req_stats[6] + granularity
+        else:
+            span = 0
+
+        n_plus_one_since = (
+            datetime.fromtimestamp(since) if window_seconds is not None else None
+        )
+        n_plus_one = self.get_n_plus_one_routes(
+            limit=MAX_N_PLUS_ONE_ROUTES, since=n_plus_one_since
+        )
+        per_route_n_plus_one = self._n_plus_one_by_route(n_plus_one_since)
+        for route in routes:
+            found, wasted_ms = per_route_n_plus_one.get(
+                (route["method"] or "", route["route"] or ""), (0, 0.0)
+            )
+            # Findings are (request, statement) pairs
+            route["n_plus_one_count"] = found
+            route["n_plus_one_wasted_ms"] = wasted_ms
 
         return {
-            "total_requests": req_stats[0] if req_stats[0] else 0,
+            "total_requests": round(total),
+            "throughput_rps": total / span if span else 0,
             "avg_duration_ms": req_stats[1] if req_stats[1] else 0,
             "max_duration_ms": req_stats[2] if req_stats[2] else 0,
             "min_duration_ms": req_stats[3] if req_stats[3] else 0,
             "avg_cpu_percent": req_stats[4] if req_stats[4] else 0,
             "avg_memory_percent": req_stats[5] if req_stats[5] else 0,
+            "avg_process_cpu_ms": req_stats[8] if req_stats[8] else 0,
             "current_cpu_percent": sys_stats[0] if sys_stats and sys_stats[0] else 0,
             "current_memory_percent": sys_stats[1] if sys_stats and sys_stats[1] else 0,
+            **_percentiles(overall),
+            "routes": routes,
+            "n_plus_one": n_plus_one,
+            "window_seconds": window_seconds,
+            "granularity_seconds": granularity,
         }
+
+    def get_rollup_series(
+        self,
+        window_seconds: int,
+        method: Optional[str] = None,
+        route: Optional[str] = None,
+    ) -> List[dict]:
+        """Per-bucket request counts and latency for a recent window."""
+        granularity = _pick_granularity(window_seconds)
+        since = int(time.time()) - window_seconds
+        since -= since % granularity
+
+        query = """
+            SELECT bucket_start, SUM(count), SUM(sum_ms), MAX(max_ms),
+                   SUM(CASE WHEN status_class = '5xx' THEN count ELSE 0 END)
+            FROM rollups
+            WHERE granularity = ? AND bucket_start >= ?
+        """
+        params: list = [granularity, since]
+        if method:
+            query += " AND method = ?"
+            params.append(method.upper())
+        if route:
+            query += " AND route = ?"
+            params.append(route)
+        query += " GROUP BY bucket_start ORDER BY bucket_start"
+
+        with self._connections.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "bucket_start": datetime.fromtimestamp(start).isoformat(),
+                "granularity_seconds": granularity,
+                "count": round(count),
+                "avg_duration_ms": sum_ms / count if count else 0,
+                "max_duration_ms": max_ms,
+                "error_count": round(errors),
+            }
+            for start, count, sum_ms, max_ms, errors in rows
+        ]
+
+    def get_errors(
+        self, limit: int = 50, since: Optional[datetime] = None
+    ) -> List[dict]:
+        """Distinct errors, most frequent first.
+
+        Each entry is one exception fingerprint on one route, with its
+        (sample-weighted) count and first/last occurrence. ``since`` keeps
+        only errors seen at or after that time.
+        """
+        query = """
+            SELECT fingerprint, method, route, error_type, message, count,
+                   first_seen, last_seen, last_request_id
+            FROM errors
+        """
+        params: list = []
+        if since is not None:
+            query += " WHERE last_seen >= ?"
+            params.append(since.isoformat())
+        query += " ORDER BY count DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connections.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "fingerprint": fingerprint,
+                "method": method or None,
+                "route": route or None,
+                "error_type": error_type,
+                "message": message,
+                "count": round(count),
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+                "last_request_id": last_request_id,
+            }
+            for (fingerprint, method, route, error_type, message, count,
+                 first_seen, last_seen, last_request_id) in rows
+        ]
+
+    def get_spans(self, request_id: str) -> List[Span]:
+        """Get the timeline spans recorded for a request, in start order."""
+        with self._connections.connect() as conn:
+            rows = conn.execute("""
+                SELECT request_id, span_id, parent_id, name, kind, start_us,
+                       duration_us, detail
+                FROM spans
+                WHERE request_id = ?
+                ORDER BY start_us, span_id
+            """, (request_id,)).fetchall()
+
+        return [Span(*row) for row in rows]
+
+    def get_n_plus_one(self, request_id: str) -> List[dict]:
+        """Get the N+1 statements found in a request, most time wasted first."""
+        with self._connections.connect() as conn:
+            rows = conn.execute("""
+                SELECT f.fingerprint, n.count, n.total_ms, n.wasted_ms
+                FROM n_plus_one n
+                JOIN query_fingerprints f ON f.id = n.fingerprint_id
+                WHERE n.request_id = ?
+                ORDER BY n.wasted_ms DESC
+            """, (request_id,)).fetchall()
+
+        return [
+            {
+                "fingerprint": fingerprint,
+                "count": count,
+                "total_ms": total_ms,
+                "wasted_ms": wasted_ms,
+            }
+            for fingerprint, count, total_ms, wasted_ms in rows
+        ]
+
+    def get_n_plus_one_routes(
+        self, limit: int = 50, since: Optional[datetime] = None
+    ) -> List[dict]:
+        """N+1 statements per route, most time wasted first.
+
+        Each entry is one statement on one route, with the number of
+        requests that repeated it, the repeated executions and the time
+        wasted. Without ``since`` the running totals are read; with it the
+        per-request findings since then are summed.
+        """
+        if since is None:
+            query = """
+                SELECT n.method, n.route, f.fingerprint, n.requests,
+                       n.queries, n.wasted_ms, n.last_seen, n.last_request_id
+                FROM n_plus_one_routes n
+                JOIN query_fingerprints f ON f.id = n.fingerprint_id
+                ORDER BY n.wasted_ms DESC
+                LIMIT ?
+            """
+            params: list = [limit]
+        else:
+            query = """
+                SELECT n.method, n.route, f.fingerprint, COUNT(*),
+                       SUM(n.count), SUM(n.wasted_ms), MAX(n.timestamp),
+                       MAX(n.request_id)
+                FROM n_plus_one n
+                JOIN query_fingerprints f ON f.id = n.fingerprint_id
+                WHERE n.timestamp >= ?
+                GROUP BY n.method, n.route, n.fingerprint_id
+                ORDER BY SUM(n.wasted_ms) DESC
+                LIMIT ?
+            """
+            params = [since.isoformat(), limit]
+
+        with self._connections.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "method": method or None,
+                "route": route or None,
+                "fingerprint": fingerprint,
+                "requests": requests,
+                "queries": queries,
+                "wasted_ms": wasted_ms,
+                "last_seen": last_seen,
+                "last_request_id": last_request_id,
+            }
+            for (method, route, fingerprint, requests, queries, wasted_ms,
+                 last_seen, last_request_id) in rows
+        ]
+
+    def _n_plus_one_by_route(
+        self, since: Optional[datetime]
+    ) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        """Number of N+1 findings and time wasted per (method, route)."""
+        if since is None:
+            query = """
+                SELECT method, route, SUM(requests), SUM(wasted_ms)
+                FROM n_plus_one_routes
+                GROUP BY method, route
+            """
+            params: list = []
+        else:
+            query = """
+                SELECT method, route, COUNT(*), SUM(wasted_ms)
+                FROM n_plus_one
+                WHERE timestamp >= ?
+                GROUP BY method, route
+            """
+            params = [since.isoformat()]
+        with self._connections.connect() as conn:
+            return {
+                (method, route): (found, wasted_ms)
+                for method, route, found, wasted_ms
+                in conn.execute(query, params)
+            }
+
+    # get_top_queries orderings, as SQL expressions over query_fingerprints
+    TOP_QUERY_ORDERS = {
+        "total": "total_ms",
+        "avg": "total_ms / count",
+        "max": "max_ms",
+        "count": "count",
+    }
+
+    def get_top_queries(self, limit: int = 20, order_by: str = "total") -> list:
+        """Get the most expensive statements from the fingerprint aggregates.
+
+        ``order_by`` is one of ``TOP_QUERY_ORDERS``. Only the fingerprint
+        table and the selected statements' histograms are read, so the cost
+        does not depend on how many queries were recorded.
+        """
+        if order_by not in self.TOP_QUERY_ORDERS:
+            raise ValueError(f"order_by must be one of {list(self.TOP_QUERY_ORDERS)}")
+        with self._connections.connect() as conn:
+            rows = conn.execute(f"""
+                SELECT id, fingerprint, count, total_ms, min_ms, max_ms,
+                       first_seen, last_seen
+                FROM query_fingerprints
+                ORDER BY {self.TOP_QUERY_ORDERS[order_by]} DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+            histograms: Dict[int, Dict[int, float]] = defaultdict(dict)
+            if rows:
+                ids = [row[0] for row in rows]
+                for fingerprint_id, bucket, count in conn.execute(f"""
+                    SELECT fingerprint_id, bucket, count
+                    FROM query_histogram
+                    WHERE fingerprint_id IN ({", ".join("?" * len(ids))})
+                """, ids):
+                    histograms[fingerprint_id][bucket] = count
+
+        statements = []
+        for (fingerprint_id, fingerprint, count, total_ms, min_ms, max_ms,
+             first_seen, last_seen) in rows:
+            statement = {
+                "id": fingerprint_id,
+                "fingerprint": fingerprint,
+                "count": count,
+                "total_ms": total_ms,
+                "avg_ms": total_ms / count if count else None,
+                "min_ms": min_ms,
+                "max_ms": max_ms,
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+            }
+            for label, q in PERCENTILES:
+                statement[f"{label}_ms"] = quantile(histograms[fingerprint_id], q)
+            statements.append(statement)
+        return statements
+
+    def get_stack_profile(
+        self,
+        route: Optional[str] = None,
+        request_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+    ) -> List[dict]:
+        """Merged stack sample counts, for rendering a flame graph.
+
+        Each entry is a stack, as frame labels outermost first, with the
+        number of samples it was seen in. ``route`` keeps samples from
+        requests on that route (template, or path when unresolved) and
+        ``request_id`` those of one request.
+        """
+        query = """
+            SELECT s.stack_id, SUM(s.count)
+            FROM stack_samples s
+        """
+        params: list = []
+        if route is not None:
+            query += """
+                JOIN profiling_metrics p ON p.request_id = s.request_id
+                WHERE COALESCE(p.route, p.path) = ?
+            """
+            params.append(route)
+        else:
+            query += " WHERE 1=1"
+        if request_id is not None:
+            query += " AND s.request_id = ?"
+            params.append(request_id)
+        if since is not None:
+            query += " AND s.timestamp >= ?"
+            params.append(since.isoformat())
+        query += " GROUP BY s.stack_id ORDER BY 2 DESC"
+
+        with self._connections.connect() as conn:
+            counts = conn.execute(query, params).fetchall()
+            if not counts:
+                return []
+            stack_ids = [stack_id for stack_id, _ in counts]
+            stacks = dict(conn.execute(f"""
+                SELECT id, frames FROM stack_traces
+                WHERE id IN ({", ".join("?" * len(stack_ids))})
+            """, stack_ids).fetchall())
+            frame_ids = {
+                int(frame_id)
+                for frames in stacks.values()
+                for frame_id in frames.split(";")
+            }
+            labels = {
+                frame_id: f"{function} ({os.path.basename(filename)}:{line})"
+                for frame_id, filename, function, line in conn.execute(f"""
+                    SELECT id, filename, function, line FROM stack_frames
+                    WHERE id IN ({", ".join("?" * len(frame_ids))})
+                """, list(frame_ids))
+            }
+
+        return [
+            {
+                "stack": [
+                    labels[int(frame_id)]
+                    for frame_id in stacks[stack_id].split(";")
+                ],
+                "count": count,
+            }
+            for stack_id, count in counts
+        ]
+
+    def prune_raw_metrics(
+        self, older_than: datetime, batch_size: int = 1000
+    ) -> Dict[str, int]:
+        """Delete raw profiling, query, span and system rows before a cutoff.
+
+        Rows are deleted oldest first, ``batch_size`` per transaction, so the
+        write lock is only ever held briefly. Rollups are kept.
+        """
+        cutoff = older_than.isoformat()
+        return {
+            "profiling_metrics": self._delete_in_batches("""
+                DELETE FROM profiling_metrics WHERE id IN (
+                    SELECT id FROM profiling_metrics
+                    WHERE start_time < ? ORDER BY start_time LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+            "stack_samples": self._delete_in_batches("""
+                DELETE FROM stack_samples WHERE id IN (
+                    SELECT id FROM stack_samples
+                    WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+            "n_plus_one": self._delete_in_batches("""
+                DELETE FROM n_plus_one WHERE id IN (
+                    SELECT id FROM n_plus_one
+                    WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+            "spans": self._delete_in_batches("""
+                DELETE FROM spans WHERE id IN (
+                    SELECT id FROM spans
+                    WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+            "query_metrics": self._delete_in_batches("""
+                DELETE FROM query_metrics WHERE id IN (
+                    SELECT id FROM query_metrics
+                    WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+            "system_metrics": self._delete_in_batches("""
+                DELETE FROM system_metrics WHERE id IN (
+                    SELECT id FROM system_metrics
+                    WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff,), batch_size),
+        }
+
+    def prune_rollups(
+        self, granularity: int, older_than: datetime, batch_size: int = 1000
+    ) -> int:
+        """Delete rollup buckets of one granularity older than a cutoff.
+
+        Deletes ``batch_size`` time buckets per transaction.
+        """
+        params = (granularity, int(older_than.timestamp()))
+        deleted = self._delete_in_batches("""
+            DELETE FROM rollups
+            WHERE granularity = ?1 AND bucket_start IN (
+                SELECT DISTINCT bucket_start FROM rollups
+                WHERE granularity = ?1 AND bucket_start < ?2
+                ORDER BY bucket_start LIMIT ?3
+            )
+        """, params, batch_size)
+        self._delete_in_batches("""
+            DELETE FROM rollup_histograms
+            WHERE granularity = ?1 AND bucket_start IN (
+                SELECT DISTINCT bucket_start FROM rollup_histograms
+                WHERE granularity = ?1 AND bucket_start < ?2
+                ORDER BY bucket_start LIMIT ?3
+            )
+        """, params, batch_size)
+        return deleted
+
+    # Raw tables trimmed by size, with the column that orders them by age
+    _RAW_TABLES = (
+        ("profiling_metrics", "start_time"),
+        ("query_metrics", "timestamp"),
+        ("spans", "timestamp"),
+        ("stack_samples", "timestamp"),
+        ("system_metrics", "timestamp"),
+    )
+
+    # Tables whose rows belong to one request and are deleted with it
+    _REQUEST_TABLES = ("query_metrics", "spans", "n_plus_one", "stack_samples")
+
+    def trim_raw_metrics(
+        self,
+        max_rows: Optional[int] = None,
+        max_size_mb: Optional[float] = None,
+        batch_size: int = 1000,
+    ) -> Dict[str, int]:
+        """Delete the oldest raw rows until under a row or size cap.
+
+        ``max_rows`` caps the stored requests. ``max_size_mb`` caps the
+        database: each pass deletes the ``batch_size`` oldest rows across
+        every raw table, and trimming stops once a pass frees no space.
+        The queries, spans, N+1 findings and stack samples of a deleted
+        request go in the same transaction. Returns rows deleted per table.
+        """
+        deleted: Counter = Counter()
+
+        if max_rows is not None:
+            with self._connections.connect() as conn:
+                rows = conn.execute(
+                    "SELECT COUNT(*) FROM profiling_metrics"
+                ).fetchone()[0]
+            while rows > max_rows:
+                with self._connections.connect() as conn, conn:
+                    count = self._delete_requests(
+                        conn, "ORDER BY start_time, id LIMIT ?",
+                        (min(rows - max_rows, batch_size),), deleted,
+                    )
+                if count <= 0:
+                    break
+                rows -= count
+
+        if max_size_mb is not None:
+            size = self.database_size_mb()
+            while size > max_size_mb:
+                with self._connections.connect() as conn, conn:
+                    cutoff = self._raw_cutoff(conn, batch_size)
+                    if cutoff is None:
+                        break
+                    self._delete_requests(
+                        conn,
+                        "WHERE start_time <= ? ORDER BY start_time, id LIMIT ?",
+                        (cutoff, batch_size), deleted,
+                    )
+                    for table, column in self._RAW_TABLES[1:]:
+                        deleted[table] += conn.execute(f"""
+                            DELETE FROM {table} WHERE id IN (
+                                SELECT id FROM {table}
+                                WHERE {column} <= ? ORDER BY {column} LIMIT ?
+                            )
+                        """, (cutoff, batch_size)).rowcount
+                previous, size = size, self.database_size_mb()
+                if size >= previous:
+                    break
+
+        return dict(deleted)
+
+    def _raw_cutoff(
+        self, conn: sqlite3.Connection, batch_size: int
+    ) -> Optional[str]:
+        """Timestamp of the ``batch_size``-th oldest row over the raw tables."""
+        oldest = " UNION ALL ".join(
+            f"SELECT * FROM (SELECT {column} AS t FROM {table} "
+            f"ORDER BY {column} LIMIT ?1)"
+            for table, column in self._RAW_TABLES
+        )
+        rows = conn.execute(
+            f"SELECT t FROM ({oldest}) ORDER BY t LIMIT ?1", (batch_size,)
+        ).fetchall()
+        return rows[-1][0] if rows else None
+
+    def _delete_requests(
+        self,
+        conn: sqlite3.Connection,
+        clause: str,
+        params: tuple,
+        deleted: Counter,
+    ) -> int:
+        """Delete the requests selected by ``clause`` and their rows."""
+        selected = f"SELECT request_id FROM profiling_metrics {clause}"
+        for table in self._REQUEST_TABLES:
+            deleted[table] += conn.execute(
+                f"DELETE FROM {table} WHERE request_id IN ({selected})", params
+            ).rowcount
+        count = conn.execute(f"""
+            DELETE FROM profiling_metrics WHERE id IN (
+                SELECT id FROM profiling_metrics {clause}
+            )
+        """, params).rowcount
+        deleted["profiling_metrics"] += count
+        return count
+
+    def _delete_in_batches(
+        self, sql: str, params: tuple, batch_size: int
+    ) -> int:
+        """Repeat a ``... LIMIT ?`` delete until it removes a short batch."""
+        deleted = 0
+        while True:
+            with self._connections.connect() as conn, conn:
+                cursor = conn.execute(sql, (*params, batch_size))
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+    def database_size_mb(self) -> float:
+        """Size of the live (non-free) pages in the database, in MB."""
+        with self._connections.connect() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size / 1024 / 1024
+
+    def incremental_vacuum(self, pages: Optional[int] = None) -> bool:
+        """Return up to ``pages`` free pages (all if None) to the filesystem.
+
+        Returns False without doing anything if the database is not in
+        incremental auto-vacuum mode; ``vacuum`` converts it.
+        """
+        with self._connections.connect() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return False
+            pragma = "PRAGMA incremental_vacuum"
+            if pages is not None:
+                pragma += f"({int(pages)})"
+            # execute() would only step the pragma once (one page);
+            # executescript runs it to completion
+            conn.executescript(pragma + ";")
+        return True
+
+    def checkpoint(self):
+        """Copy the WAL back into the database file and truncate it."""
+        with self._connections.connect() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    def vacuum(self):
+        """Rewrite the database with a full VACUUM.
+
+        Also switches databases created before incremental auto-vacuum was
+        enabled over to it. Holds an exclusive lock for the whole rewrite.
+        """
+        with self._connections.connect() as conn:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
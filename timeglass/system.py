@@ -0,0 +1,327 @@
+"""Periodic host and process metrics sampling.
+
+``SystemSampler`` wakes every ``interval`` seconds on a daemon thread, reads
+a handful of cheap counters and stores a ``SystemMetrics`` row, batching
+inserts ``batch_size`` samples at a time. Host figures come from ``/proc``
+on Linux; elsewhere the fields that cannot be read are left empty.
+
+Network and disk figures are cumulative byte counters as reported by the
+kernel; rates are the difference between two rows. Event-loop lag is the
+delay before a callback scheduled from the sampler thread runs on the
+watched loop, and is only measured once a loop is registered with
+``watch_loop``. While a callback is still waiting, as when the loop is
+blocked for longer than the interval, the time it has waited so far is
+reported instead.
+
+With ``process_metrics=False`` only host figures are recorded and the
+per-process ones (open file descriptors, GC activity, event-loop lag) are
+left empty, for a sampler that runs in a different process from the
+application, such as the collector.
+"""
+
+import asyncio
+import atexit
+import gc
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .logs import log_limited
+from .models import SystemMetrics
+from .storage import TimeGlassStorage
+
+logger = logging.getLogger(__name__)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cpu_times() -> Optional[Tuple[int, int]]:
+    """(busy, total) jiffies across all CPUs from /proc/stat."""
+    stat = _read("/proc/stat")
+    if stat is None:
+        return None
+    values = [int(v) for v in stat.split("\n", 1)[0].split()[1:]]
+    # idle + iowait count as not busy
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    total = sum(values[:8])
+    return total - idle, total
+
+
+def _memory() -> Tuple[float, float, int]:
+    """(used MB, used percent, total MB) for the host."""
+    meminfo = _read("/proc/meminfo")
+    if meminfo is not None:
+        fields: Dict[str, int] = {}
+        for line in meminfo.splitlines():
+            name, _, rest = line.partition(":")
+            fields[name] = int(rest.split()[0])
+        total_kb = fields.get("MemTotal", 0)
+        available_kb = fields.get("MemAvailable", fields.get("MemFree", 0))
+        used_kb = total_kb - available_kb
+        percent = used_kb / total_kb * 100 if total_kb else 0.0
+        return used_kb / 1024, percent, total_kb // 1024
+    try:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        total = 0
+    return 0.0, 0.0, total // (1024 * 1024)
+
+
+def _process_count() -> Optional[int]:
+    """Number of processes/threads on the host, from /proc/loadavg."""
+    loadavg = _read("/proc/loadavg")
+    if loadavg is None:
+        return None
+    return int(loadavg.split()[3].split("/")[1])
+
+
+def _open_fds() -> Optional[int]:
+    """Open file descriptors of this process."""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _network_bytes() -> Tuple[Optional[int], Optional[int]]:
+    """Cumulative (received, sent) bytes over non-loopback interfaces."""
+    dev = _read("/proc/net/dev")
+    if dev is None:
+        return None, None
+    rx = tx = 0
+    for line in dev.splitlines()[2:]:
+        name, _, counters = line.partition(":")
+        if name.strip() == "lo":
+            continue
+        values = counters.split()
+        rx += int(values[0])
+        tx += int(values[8])
+    return rx, tx
+
+
+def _block_devices() -> List[str]:
+    """Whole-disk device names, so partitions are not counted twice."""
+    try:
+        return os.listdir("/sys/block")
+    except OSError:
+        return []
+
+
+def _disk_bytes(devices: List[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Cumulative (read, written) bytes across whole disks."""
+    stats = _read("/proc/diskstats")
+    if stats is None:
+        return None, None
+    wanted = set(devices)
+    read = written = 0
+    for line in stats.splitlines():
+        values = line.split()
+        if len(values) > 9 and values[2] in wanted:
+            # Sectors are always 512 bytes in /proc/diskstats
+            read += int(values[5]) * 512
+            written += int(values[9]) * 512
+    return read, written
+
+
+class _GCMonitor:
+    """Count collections and total pause time through ``gc.callbacks``."""
+
+    def __init__(self):
+        self.collections = 0
+        self.pause_ns = 0
+        self._started = 0
+
+    def __call__(self, phase: str, info: dict):
+        if phase == "start":
+            self._started = time.perf_counter_ns()
+        else:
+            self.collections += 1
+            self.pause_ns += time.perf_counter_ns() - self._started
+
+    def install(self):
+        if self not in gc.callbacks:
+            gc.callbacks.append(self)
+
+    def uninstall(self):
+        if self in gc.callbacks:
+            gc.callbacks.remove(self)
+
+
+class SystemSampler:
+    """Sample host and process metrics into ``system_metrics``."""
+
+    def __init__(
+        self,
+        storage: TimeGlassStorage,
+        interval: float = 5.0,
+        batch_size: int = 6,
+        process_metrics: bool = True,
+    ):
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self.process_metrics = process_metrics
+        self._pending: List[SystemMetrics] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lag_ms: Optional[float] = None
+        # perf_counter_ns when the pending probe was scheduled
+        self._probe_scheduled: Optional[int] = None
+        self._gc = _GCMonitor()
+        self._gc_seen = (0, 0)
+        self._cpu_seen = _cpu_times()
+        self._devices = _block_devices()
+        self.errors = 0
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop):
+        """Measure scheduling lag on ``loop`` from now on."""
+        self._loop = loop
+        self._lag_ms = None
+        self._probe_scheduled = None
+        self._probe_loop()
+
+    def start(self):
+        """Start the sampler thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        if self.process_metrics:
+            self._gc.install()
+        self._thread = threading.Thread(
+            target=self._run, name="timeglass-system", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the sampler thread and write any pending samples."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._gc.uninstall()
+        atexit.unregister(self.stop)
+        self.flush()
+
+    def flush(self):
+        """Write pending samples."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            self.storage.save_many_system_metrics(pending)
+        except Exception as e:
+            self.errors += 1
+            log_limited(
+                logger, logging.WARNING, "system-write-failed",
+                "Failed to write system metrics: %s", e,
+            )
+
+    def sample(self) -> SystemMetrics:
+        """Take one sample of every metric."""
+        cpu_percent = 0.0
+        cpu = _cpu_times()
+        if cpu is not None and self._cpu_seen is not None:
+            busy = cpu[0] - self._cpu_seen[0]
+            total = cpu[1] - self._cpu_seen[1]
+            cpu_percent = busy / total * 100 if total > 0 else 0.0
+        elif cpu is None and hasattr(os, "getloadavg"):
+            # No /proc: approximate from the 1-minute load average
+            cpu_count = os.cpu_count() or 1
+            cpu_percent = min(100.0, os.getloadavg()[0] / cpu_count * 100)
+        self._cpu_seen = cpu
+
+        memory_mb, memory_percent, total_memory_mb = _memory()
+        load = os.getloadavg() if hasattr(os, "getloadavg") else (None,) * 3
+        rx, tx = _network_bytes()
+        disk_read, disk_written = _disk_bytes(self._devices)
+
+        metrics = SystemMetrics(
+            timestamp=datetime.now(),
+            cpu_usage_percent=cpu_percent,
+            memory_usage_mb=memory_mb,
+            memory_usage_percent=memory_percent,
+            total_memory_mb=total_memory_mb,
+            cpu_count=os.cpu_count() or 0,
+            load_avg_1m=load[0],
+            load_avg_5m=load[1],
+            load_avg_15m=load[2],
+            process_count=_process_count(),
+            net_rx_bytes=rx,
+            net_tx_bytes=tx,
+            disk_read_bytes=disk_read,
+            disk_write_bytes=disk_written,
+        )
+        if self.process_metrics:
+            collections, pause_ns = self._gc.collections, self._gc.pause_ns
+            seen_collections, seen_pause_ns = self._gc_seen
+            self._gc_seen = (collections, pause_ns)
+            metrics.open_fds = _open_fds()
+            metrics.event_loop_lag_ms = self._loop_lag_ms()
+            metrics.gc_collections = collections - seen_collections
+            metrics.gc_pause_ms = (pause_ns - seen_pause_ns) / 1e6
+        return metrics
+
+    def _loop_lag_ms(self) -> Optional[float]:
+        """Lag of the last probe, or how long the pending one has waited."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return None
+        scheduled = self._probe_scheduled
+        if scheduled is not None:
+            return (time.perf_counter_ns() - scheduled) / 1e6
+        return self._lag_ms
+
+    def _probe_loop(self):
+        """Schedule a callback on the watched loop to time its lag.
+
+        Nothing is scheduled while the previous probe has not run, so its
+        waiting time keeps growing until the loop is free again.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._lag_ms = None
+            self._probe_scheduled = None
+            return
+        if self._probe_scheduled is not None:
+            return
+        scheduled = self._probe_scheduled = time.perf_counter_ns()
+
+        def measured():
+            self._lag_ms = (time.perf_counter_ns() - scheduled) / 1e6
+            if self._probe_scheduled == scheduled:
+                self._probe_scheduled = None
+
+        try:
+            loop.call_soon_threadsafe(measured)
+        except RuntimeError:
+            # Loop closed between the check and the call
+            self._loop = None
+            self._probe_scheduled = None
+
+    def _run(self):
+        """Sampler thread main loop."""
+        self._probe_loop()
+        while not self._stopped.wait(self.interval):
+            try:
+                self._pending.append(self.sample())
+            except Exception as e:
+                self.errors += 1
+                log_limited(
+                    logger, logging.WARNING, "system-sample-failed",
+                    "Failed to sample system metrics: %s", e,
+                )
+            self._probe_loop()
+            if len(self._pending) >= self.batch_size:
+                self.flush()
@@ -2,20 +2,47 @@
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta
 import os
 import logging
 
+from .models import Span
 from .storage import TimeGlassStorage
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 
+def _page_response(items: list, next_cursor: Optional[str]) -> JSONResponse:
+    """JSON list response carrying the next page cursor in a header."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(content=items, headers=headers)
+
+
+def _timeline(spans: List[Span], duration_us: Optional[int]) -> List[dict]:
+    """Lay out spans as bars positioned relative to the request duration."""
+    end_us = max([duration_us or 0] + [s.start_us + s.duration_us for s in spans])
+    depths = {}
+    rows = []
+    for s in spans:
+        depth = depths[s.span_id] = depths.get(s.parent_id, -1) + 1
+        rows.append({
+            "name": s.name,
+            "kind": s.kind,
+            "detail": s.detail or "",
+            "depth": depth,
+            "start": f"{s.start_us / 1000:.2f}ms",
+            "duration": f"{s.duration_us / 1000:.2f}ms",
+            "left": 100 * s.start_us / end_us if end_us else 0,
+            "width": max(100 * s.duration_us / end_us if end_us else 0, 0.2),
+        })
+    return rows
+
+
 def create_app(db_path: str = "timeglass.db") -> FastAPI:
     """Create FastAPI application for TimeGlass dashboard."""
     app = FastAPI(
@@ -46,21 +73,119 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
             raise HTTPException(status_code=500, detail="Internal server error")
 
     @app.get("/api/stats")
-    async def get_stats():
+    async def get_stats(
+        window: Optional[int] = Query(
+            None, ge=1, description="Only summarize the last N seconds"
+        ),
+    ):
         """Get profiling statistics summary."""
         try:
-            summary = storage.get_stats_summary()
+            summary = storage.get_stats_summary(window_seconds=window)
             return JSONResponse(content=summary)
         except Exception as e:
             logger.error(f"Error getting stats: {e}")
             raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
 
+    @app.get("/api/timeseries")
+    async def get_timeseries(
+        window: int = Query(3600, ge=1, description="Window length in seconds"),
+        method: Optional[str] = Query(None, description="Filter by HTTP method"),
+        route: Optional[str] = Query(None, description="Filter by route"),
+    ):
+        """Get per-bucket request counts and latency from the rollups."""
+        try:
+            series = storage.get_rollup_series(
+                window_seconds=window, method=method, route=route
+            )
+            return JSONResponse(content=series)
+        except Exception as e:
+            logger.error(f"Error getting timeseries: {e}")
+            raise HTTPException(
+                status_code=500, detail="Failed to retrieve timeseries"
+            )
+
+    @app.get("/api/errors")
+    async def get_errors(
+        limit: int = Query(
+            50, ge=1, le=1000, description="Number of errors to return"
+        ),
+        since: Optional[datetime] = Query(
+            None, description="Only errors seen since (ISO format)"
+        ),
+    ):
+        """Get distinct errors grouped by fingerprint, most frequent first."""
+        try:
+            return JSONResponse(content=storage.get_errors(limit=limit, since=since))
+        except Exception as e:
+            logger.error(f"Error getting errors: {e}")
+            raise HTTPException(status_code=500, detail="Failed to retrieve errors")
+
+    @app.get("/api/queries/top")
+    async def get_top_queries(
+        limit: int = Query(
+            20, ge=1, le=1000, description="Number of statements to return"
+        ),
+        order: str = Query(
+            "total",
+            pattern="^(total|avg|max|count)$",
+            description="Rank by total, avg or max time, or by count",
+        ),
+    ):
+        """Get the most expensive SQL statements by fingerprint."""
+        try:
+            return JSONResponse(
+                content=storage.get_top_queries(limit=limit, order_by=order)
+            )
+        except Exception as e:
+            logger.error(f"Error getting top queries: {e}")
+            raise HTTPException(
+                status_code=500, detail="Failed to retrieve top queries"
+            )
+
+    @app.get("/api/flamegraph")
+    async def get_flamegraph(
+        route: Optional[str] = Query(None, description="Filter by route"),
+        request_id: Optional[str] = Query(
+            None, description="Only samples from one request"
+        ),
+        window: Optional[int] = Query(
+            None, ge=1, description="Only samples from the last N seconds"
+        ),
+        format: str = Query(
+            "json",
+            pattern="^(json|folded)$",
+            description="json, or folded stacks for flamegraph.pl/speedscope",
+        ),
+    ):
+        """Get merged stack samples for a flame graph."""
+        try:
+            since = (
+                datetime.now() - timedelta(seconds=window) if window else None
+            )
+            profile = storage.get_stack_profile(
+                route=route, request_id=request_id, since=since
+            )
+            if format == "folded":
+                return PlainTextResponse("".join(
+                    f"{';'.join(entry['stack'])} {entry['count']}\n"
+                    for entry in profile
+                ))
+            return JSONResponse(content=profile)
+        except Exception as e:
+            logger.error(f"Error getting flame graph: {e}")
+            raise HTTPException(
+                status_code=500, detail="Failed to retrieve flame graph"
+            )
+
     @app.get("/api/requests")
     async def get_requests(
         limit: int = Query(
             50, ge=1, le=1000, description="Number of requests to return"
         ),
         offset: int = Query(0, ge=0, description="Number of requests to skip"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque cursor from the X-Next-Cursor header"
+        ),
         start_time: Optional[datetime] = Query(
             None, description="Filter by start time (ISO format)"
         ),
@@ -68,12 +193,21 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
             None, description="Filter by end time (ISO format)"
         ),
         method: Optional[str] = Query(None, description="Filter by HTTP method"),
+        path: Optional[str] = Query(None, description="Filter by exact path"),
         path_contains: Optional[str] = Query(
-            None, description="Filter by path containing substring"
+            None,
+            description="Filter by path containing substring (scans the "
+            "time range; prefer path_prefix)",
+        ),
+        path_prefix: Optional[str] = Query(
+            None, description="Filter by path starting with prefix"
         ),
         status_code: Optional[int] = Query(
             None, description="Filter by HTTP status code"
         ),
+        route: Optional[str] = Query(
+            None, description="Filter by route template"
+        ),
     ):
         """Get profiling metrics with filtering."""
         try:
@@ -81,25 +215,25 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
             if limit > 1000:
                 raise HTTPException(status_code=400, detail="Limit cannot exceed 1000")
 
-            metrics = storage.get_profiling_metrics(
-                limit=limit, offset=offset, start_time=start_time, end_time=end_time
+            metrics, next_cursor = storage.get_profiling_metrics_page(
+                limit=limit,
+                cursor=cursor,
+                offset=offset,
+                start_time=start_time,
+                end_time=end_time,
+                method=method,
+                path=path,
+                path_contains=path_contains,
+                status_code=status_code,
+                route=route,
+                path_prefix=path_prefix,
             )
 
-            # Apply additional filters in Python (could be optimized with SQL)
-            if method:
-                metrics = [m for m in metrics if m.method == method]
-            if path_contains:
-                metrics = [
-                    m
-                    for m in metrics
-                    if path_contains.lower() in (m.path or "").lower()
-                ]
-            if status_code:
-                metrics = [m for m in metrics if m.status_code == status_code]
-
-            return JSONResponse(content=[m.to_dict() for m in metrics])
+            return _page_response([m.to_dict() for m in metrics], next_cursor)
         except HTTPException:
             raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error getting requests: {e}")
             raise HTTPException(status_code=500, detail="Failed to retrieve requests")
@@ -109,6 +243,9 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
         limit: int = Query(
             100, ge=1, le=1000, description="Number of metrics to return"
         ),
+        cursor: Optional[str] = Query(
+            None, description="Opaque cursor from the X-Next-Cursor header"
+        ),
         start_time: Optional[datetime] = Query(
             None, description="Filter by start time (ISO format)"
         ),
@@ -121,12 +258,14 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
             if limit > 1000:
                 raise HTTPException(status_code=400, detail="Limit cannot exceed 1000")
 
-            metrics = storage.get_system_metrics(
-                limit=limit, start_time=start_time, end_time=end_time
+            metrics, next_cursor = storage.get_system_metrics_page(
+                limit=limit, cursor=cursor, start_time=start_time, end_time=end_time
             )
-            return JSONResponse(content=[m.to_dict() for m in metrics])
+            return _page_response([m.to_dict() for m in metrics], next_cursor)
         except HTTPException:
             raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error getting system metrics: {e}")
             raise HTTPException(
@@ -142,18 +281,16 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
                 raise HTTPException(status_code=400, detail="Invalid request ID")
 
             # Get the specific request
-            metrics = storage.get_profiling_metrics(limit=1000)
-            request_data = None
-            for m in metrics:
-                if m.request_id == request_id:
-                    request_data = m
-                    break
+            request_data = storage.get_profiling_metric(request_id)
 
             if not request_data:
                 logger.warning(f"Request {request_id} not found")
                 raise HTTPException(status_code=404, detail="Request not found")
 
-            logger.info(f"Found request {request_id}: method={request_data.method}, path={request_data.path}")
+            logger.info(
+                f"Found request {request_id}: "
+                f"method={request_data.method}, path={request_data.path}"
+            )
 
             # Determine status code class
             status_code = request_data.status_code
@@ -204,23 +341,88 @@ def create_app(db_path: str = "timeglass.db") -> FastAPI:
             formatted_data = {
                 "method": request_data.method or "N/A",
                 "path": request_data.path or "N/A",
+                "route": request_data.route or "N/A",
                 "status_code": str(status_code) if status_code else "N/A",
                 "status_class": status_class,
-                "response_size_bytes": str(request_data.response_size_bytes) if request_data.response_size_bytes else "N/A",
+                "response_size_bytes": (
+                    str(request_data.response_size_bytes)
+                    if request_data.response_size_bytes else "N/A"
+                ),
                 "user_agent": request_data.user_agent or "N/A",
                 "client_ip": request_data.client_ip or "N/A",
-                "start_time": request_data.start_time.isoformat() if request_data.start_time else "N/A",
-                "end_time": request_data.end_time.isoformat() if request_data.end_time else "N/A",
-                "duration": f"{request_data.duration_ms:.2f}ms" if request_data.duration_ms else "N/A",
+                "start_time": (
+                    request_data.start_time.isoformat()
+                    if request_data.start_time else "N/A"
+                ),
+                "end_time": (
+                    request_data.end_time.isoformat()
+                    if request_data.end_time else "N/A"
+                ),
+                "duration": (
+                    f"{request_data.duration_ms * 1000:.0f}µs"
+                    if request_data.duration_ms < 1
+                    else f"{request_data.duration_ms:.2f}ms"
+                ) if request_data.duration_ms is not None else "N/A",
                 "duration_class": duration_class,
-                "cpu_usage": f"{request_data.cpu_usage_percent:.1f}%" if request_data.cpu_usage_percent else "N/A",
+                "ttfb": (
+                    f"{request_data.ttfb_us / 1000:.2f}ms"
+                    if request_data.ttfb_us is not None else "N/A"
+                ),
+                "cpu_usage": (
+                    f"{request_data.cpu_usage_percent:.1f}%"
+                    if request_data.cpu_usage_percent else "N/A"
+                ),
                 "cpu_class": cpu_class,
-                "memory_usage": f"{request_data.memory_usage_mb:.2f} MB" if request_data.memory_usage_mb else "N/A",
+                "memory_usage": (
+                    f"{request_data.memory_usage_mb:.2f} MB"
+                    if request_data.memory_usage_mb else "N/A"
+                ),
                 "memory_class": memory_class,
-                "memory_percent": f"{request_data.memory_usage_percent:.1f}%" if request_data.memory_usage_percent else "N/A",
-                "memory_percent_class": memory_class
+                "memory_percent": (
+                    f"{request_data.memory_usage_percent:.1f}%"
+                    if request_data.memory_usage_percent else "N/A"
+                ),
+                "memory_percent_class": memory_class,
+                "process_cpu": (
+                    f"{request_data.process_cpu_ms:.2f}ms"
+                    if request_data.process_cpu_ms is not None else "N/A"
+                ),
+                "thread_cpu": (
+                    f"{request_data.thread_cpu_ms:.2f}ms"
+                    if request_data.thread_cpu_ms is not None else "N/A"
+                ),
+                "process_rss": (
+                    f"{request_data.rss_bytes / 1024 / 1024:.2f} MB"
+                    if request_data.rss_bytes is not None else "N/A"
+                ),
+                "rss_delta": (
+                    f"{request_data.rss_delta_bytes / 1024:+.1f} KB"
+                    if request_data.rss_delta_bytes is not None else "N/A"
+                ),
+                "alloc_delta": (
+                    f"{request_data.alloc_delta_bytes / 1024:+.1f} KB"
+                    if request_data.alloc_delta_bytes is not None else "N/A"
+                ),
             }
 
+            queries = storage.get_query_metrics(request_id)
+            formatted_data["query_count"] = len(queries)
+            formatted_data["query_time"] = (
+                f"{sum(q.duration_ms for q in queries):.2f}ms"
+            )
+            formatted_data["n_plus_one"] = [
+                {
+                    "fingerprint": n["fingerprint"],
+                    "count": n["count"],
+                    "total": f"{n['total_ms']:.2f}ms",
+                    "wasted": f"{n['wasted_ms']:.2f}ms",
+                }
+                for n in storage.get_n_plus_one(request_id)
+            ]
+            formatted_data["timeline"] = _timeline(
+                storage.get_spans(request_id), request_data.duration_us
+            )
+
             logger.info(f"Formatted data for {request_id}: {formatted_data}")
 
             return templates.TemplateResponse(
@@ -0,0 +1,256 @@
+"""Background batched writer for TimeGlass profiling data."""
+
+import atexit
+import collections
+import logging
+import threading
+from typing import List, Optional, Union
+
+from .logs import log_limited
+from .models import ProfilingMetrics, QueryMetrics, Span
+from .sinks import Sink, StorageSink
+from .storage import TimeGlassStorage
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """Drain profiling metrics from a bounded ring buffer into a sink.
+
+    Producers (the middleware) call ``submit``, which only appends to a
+    deque and never blocks or takes a lock: when the buffer is full the
+    record is dropped and counted instead. A single daemon thread takes
+    records out in batches of up to ``batch_size`` and hands them to the
+    sink, whenever ``batch_size`` records are pending or ``flush_interval``
+    seconds have passed since the last write.
+
+    Query rows recorded during a request arrive through ``submit_queries``
+    as one list per request, share the buffer capacity, and are handed to
+    ``sink.write_queries`` after the profiling records they belong to.
+    Timeline spans go the same way through ``submit_spans`` and
+    ``sink.write_spans``.
+
+    ``sink`` may also be a TimeGlassStorage, which is wrapped in a
+    StorageSink.
+    """
+
+    def __init__(
+        self,
+        sink: Union[Sink, TimeGlassStorage],
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        if isinstance(sink, TimeGlassStorage):
+            sink = StorageSink(sink)
+        self.sink = sink
+        self.capacity = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: "collections.deque[ProfilingMetrics]" = collections.deque()
+        self._query_buffer: "collections.deque[List[QueryMetrics]]" = (
+            collections.deque()
+        )
+        self._span_buffer: "collections.deque[List[Span]]" = collections.deque()
+        self._wake = threading.Event()
+        self._waiters: List[threading.Event] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.queries_written = 0
+        self.queries_dropped = 0
+        self.spans_written = 0
+        self.spans_dropped = 0
+
+    def start(self):
+        """Start the writer thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="timeglass-writer", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, metrics: ProfilingMetrics) -> bool:
+        """Queue metrics for writing. Returns False if the record was dropped.
+
+        Counters are updated without a lock; submit is expected to be called
+        from one thread (the event loop), and deque appends are atomic.
+        """
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return False
+        self._buffer.append(metrics)
+        self.enqueued += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def submit_queries(self, queries: List[QueryMetrics]) -> bool:
+        """Queue the queries of one request. Returns False if dropped."""
+        if len(self._query_buffer) >= self.capacity:
+            self.queries_dropped += len(queries)
+            return False
+        self._query_buffer.append(queries)
+        return True
+
+    def submit_spans(self, spans: List[Span]) -> bool:
+        """Queue the timeline spans of one request. Returns False if dropped."""
+        if len(self._span_buffer) >= self.capacity:
+            self.spans_dropped += len(spans)
+            return False
+        self._span_buffer.append(spans)
+        return True
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every record submitted so far has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        with self._lock:
+            self._waiters.append(done)
+        self._wake.set()
+        done.wait(timeout)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Flush pending records and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        alive = self._thread.is_alive()
+        self._thread = None
+        atexit.unregister(self.stop)
+        if alive:
+            # The thread may still be writing; closing the sink under it
+            # would fail or lose the rest of the flush
+            logger.warning(
+                "Writer thread did not stop within %ss; leaving the sink open "
+                "with %d records pending", timeout, len(self._buffer),
+            )
+            return
+        self.sink.close()
+
+    def stats(self) -> dict:
+        """Return buffer depth and throughput counters."""
+        return {
+            "queue_depth": len(self._buffer),
+            "queue_capacity": self.capacity,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "queries_written": self.queries_written,
+            "queries_dropped": self.queries_dropped,
+            "spans_written": self.spans_written,
+            "spans_dropped": self.spans_dropped,
+        }
+
+    def _run(self):
+        """Writer thread main loop."""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stopped.is_set()
+
+            # Waiters registered before this point are satisfied by draining
+            # everything currently buffered
+            with self._lock:
+                waiters, self._waiters = self._waiters, []
+            self._drain()
+            for waiter in waiters:
+                waiter.set()
+
+            if stopping:
+                # Pick up anything submitted while the last drain ran
+                while self._buffer or self._query_buffer or self._span_buffer:
+                    self._drain()
+                return
+
+    def _drain(self):
+        """Write everything currently buffered, ``batch_size`` at a time.
+
+        Producers submit a request's profiling record before its queries
+        and spans, so the buffers are measured in the reverse order: every
+        query or span list counted here belongs to a record that is also
+        counted, and records are written first. Anything submitted during
+        the drain waits for the next one.
+        """
+        pending_spans = len(self._span_buffer)
+        pending_queries = len(self._query_buffer)
+        pending = len(self._buffer)
+
+        buffer = self._buffer
+        while pending:
+            batch = []
+            while pending and len(batch) < self.batch_size:
+                batch.append(buffer.popleft())
+                pending -= 1
+            self._write(batch)
+
+        queries = self._query_buffer
+        while pending_queries:
+            rows: List[QueryMetrics] = []
+            while pending_queries and len(rows) < self.batch_size:
+                rows.extend(queries.popleft())
+                pending_queries -= 1
+            self._write_queries(rows)
+
+        spans = self._span_buffer
+        while pending_spans:
+            span_rows: List[Span] = []
+            while pending_spans and len(span_rows) < self.batch_size:
+                span_rows.extend(spans.popleft())
+                pending_spans -= 1
+            self._write_spans(span_rows)
+
+    def _write(self, batch: List[ProfilingMetrics]):
+        """Write one batch, counting failures instead of raising."""
+        try:
+            self.sink.write(batch)
+        except Exception as e:
+            self.errors += 1
+            log_limited(
+                logger, logging.WARNING, "write-failed",
+                "Failed to write profiling metrics batch: %s", e,
+            )
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def _write_queries(self, rows: List[QueryMetrics]):
+        """Write one batch of query rows, counting failures."""
+        try:
+            self.sink.write_queries(rows)
+        except Exception as e:
+            self.errors += 1
+            log_limited(
+                logger, logging.WARNING, "query-write-failed",
+                "Failed to write query metrics batch: %s", e,
+            )
+            return
+        self.queries_written += len(rows)
+
+    def _write_spans(self, rows: List[Span]):
+        """Write one batch of timeline spans, counting failures."""
+        try:
+            self.sink.write_spans(rows)
+        except Exception as e:
+            self.errors += 1
+            log_limited(
+                logger, logging.WARNING, "span-write-failed",
+                "Failed to write span batch: %s", e,
+            )
+            return
+        self.spans_written += len(rows)